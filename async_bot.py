@@ -0,0 +1,318 @@
+#  Содержание async_bot.py
+
+import asyncio
+import inspect
+import time
+from telebot.async_telebot import AsyncTeleBot
+from telebot import asyncio_helper, types
+from logger import logger, log_function_call
+from metrics import observe_handler
+from http_session import PREWARM_TIMEOUT
+from lifecycle import restore_updates
+from send_queue import PRIORITY_COMMAND, PRIORITY_REPLY
+from bot import (
+    MESSAGE_CONTENT_TYPES, SERVICE_CONTENT_TYPES, catalog, commands, callbacks, is_command,
+    command_reply, command_keyboard, content_reply, edited_content_reply, callback_reply,
+    service_replies, remember_chat, process_attachment, use_state_store
+)
+
+
+class BoundedAsyncTeleBot(AsyncTeleBot):
+    """
+    AsyncTeleBot с ограничением количества одновременно обрабатываемых обновлений.
+
+    Стандартный `AsyncTeleBot` создает задачу на каждую пачку обновлений и не
+    ограничивает их число. Этот класс обрабатывает каждое обновление в отдельной
+    задаче, но не больше `max_in_flight` одновременно. Пока все слоты заняты,
+    новые обновления не запрашиваются у Telegram (обратное давление на polling),
+    а за один запрос запрашивается не больше обновлений, чем свободных слотов.
+    Полученные, но еще не запущенные обновления учитываются отдельно, чтобы
+    при остановке не подтвердить их Telegram.
+
+    Атрибуты:
+        max_in_flight (int): Максимальное число обновлений в обработке.
+    """
+    def __init__(self, token, max_in_flight=64, **kwargs):
+        """
+        Инициализирует BoundedAsyncTeleBot.
+
+        Args:
+            token (str): Токен бота.
+            max_in_flight (int): Максимальное число одновременно обрабатываемых обновлений.
+            **kwargs: Дополнительные параметры для `AsyncTeleBot`.
+        """
+        super().__init__(token, **kwargs)
+        self.max_in_flight = max_in_flight
+        self._in_flight = 0
+        self._unstarted = 0  # получены у Telegram, но обработка еще не запущена
+        self._closed = False
+        self._slots = asyncio.Condition()
+        self._tasks = set()
+
+    async def get_me(self):
+        """
+        Возвращает данные бота; ответ кешируется, как у `TeleBot.user`.
+
+        `AsyncTeleBot` запрашивает `get_me` при каждом запуске polling, а бот
+        уже получил его при запуске (см. `_run_async_polling`).
+        """
+        if self._user is None:
+            self._user = await super().get_me()
+        return self._user
+
+    async def close_session(self):
+        """
+        Закрывает сессию aiohttp, когда обработка всех полученных обновлений завершена.
+
+        `AsyncTeleBot` закрывает сессию при выходе из polling, а при остановке
+        обработчики еще дорабатывают и отправляют ответы через нее.
+        """
+        if self._in_flight or self._unstarted:
+            return
+        await super().close_session()
+
+    async def get_updates(self, *args, **kwargs):
+        """Запрашивает обновления только при наличии свободных слотов и не больше их числа."""
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._in_flight + self._unstarted < self.max_in_flight)
+            free = self.max_in_flight - self._in_flight - self._unstarted
+        kwargs['limit'] = min(kwargs.get('limit') or 100, free)
+        updates = await super().get_updates(*args, **kwargs)
+        # Смещение сдвигается сразу после возврата, а обработка запускается в
+        # отдельной задаче AsyncTeleBot: до запуска обновления считаются здесь
+        self._unstarted += len(updates)
+        return updates
+
+    async def process_new_updates(self, updates):
+        """
+        Запускает обработку каждого обновления в отдельной задаче с учетом лимита.
+
+        Args:
+            updates (list): Список объектов `telebot.types.Update`.
+        """
+        for update in updates:
+            async with self._slots:
+                await self._slots.wait_for(lambda: self._in_flight < self.max_in_flight)
+                if self._closed:
+                    # Остановка по дедлайну: обновление не запущено и останется неподтвержденным
+                    return
+                self._in_flight += 1
+                self._unstarted -= 1
+            task = asyncio.create_task(self._process_single_update(update))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process_single_update(self, update):
+        try:
+            await super().process_new_updates([update])
+        except Exception as e:
+            logger.error("Ошибка при обработке обновления %s: %s", update.update_id, e)
+        finally:
+            async with self._slots:
+                self._in_flight -= 1
+                self._slots.notify_all()
+
+    async def wait_idle(self, timeout=None):
+        """
+        Ожидает, пока все полученные обновления будут запущены и обработаны.
+
+        Args:
+            timeout (float): Сколько секунд ждать. Не завершившиеся к этому
+                времени обработчики отменяются, не запущенные обновления не
+                запускаются. None - без ограничения.
+
+        Returns:
+            int: Количество прерванных обработчиков и не запущенных обновлений.
+        """
+        try:
+            async with self._slots:
+                await asyncio.wait_for(
+                    self._slots.wait_for(lambda: not self._in_flight and not self._unstarted), timeout)
+            return 0
+        except asyncio.TimeoutError:
+            pass
+        async with self._slots:
+            self._closed = True
+        pending = set(self._tasks)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending) + self._unstarted
+
+
+def register_async_handlers(signal_bot, dispatcher=None, responder=None, state_store=None, media=None):
+    """
+    Регистрирует обработчики из `bot.py` на асинхронном экземпляре бота.
+
+    Используются те же фильтры, тексты ответов, декораторы и подсистемы, что и в
+    `bot.register_handlers`. Очередь исходящих сообщений, ответ на нажатия и
+    скачивание вложений работают в своих потоках через синхронный бот, поэтому
+    обработчики только ставят в них работу и не блокируют цикл событий.
+
+    Args:
+        signal_bot (telebot.async_telebot.AsyncTeleBot): Экземпляр асинхронного бота.
+        dispatcher (send_queue.OutboundDispatcher): Очередь исходящих сообщений.
+            Если не указана, ответы отправляются через `signal_bot.send_message`.
+        responder (keyboards.CallbackResponder): Последующая работа по нажатиям
+            в пуле потоков. Если не указан, она выполняется в обработчике.
+        state_store (state_store.StateStore): Хранилище состояния чатов. Без него
+            подписка на сигналы недоступна.
+        media (media.MediaPipeline): Скачивание вложений. Если не указан,
+            вложения не скачиваются.
+    """
+    use_state_store(state_store)
+
+    async def reply(chat_id, text, priority=PRIORITY_REPLY, **kwargs):
+        """Отправляет ответ через очередь исходящих сообщений или напрямую."""
+        if dispatcher is not None:
+            dispatcher.send(chat_id, text, priority=priority, **kwargs)
+        else:
+            await signal_bot.send_message(chat_id, text, **kwargs)
+
+    @signal_bot.message_handler(func=is_command)
+    @log_function_call
+    @observe_handler
+    async def command_message(message):
+        """Обрабатывает команды, начинающиеся с '/'."""
+        remember_chat(message.chat.id, message.from_user)
+        await reply(message.chat.id, command_reply(message), PRIORITY_COMMAND,
+                    reply_markup=command_keyboard(message))
+
+    @signal_bot.message_handler(content_types=MESSAGE_CONTENT_TYPES)
+    @log_function_call
+    @observe_handler
+    async def handle_all_messages(message):
+        """Обрабатывает все входящие сообщения различных типов."""
+        remember_chat(message.chat.id, message.from_user)
+        response = content_reply(message)
+        try:
+            await reply(message.chat.id, response)
+        except asyncio_helper.ApiException as e:
+            logger.error("Ошибка при отправке сообщения пользователю %s: %s",
+                         message.from_user.id, e)
+        if media is not None:
+            media.submit(message, process_attachment)
+
+    @signal_bot.edited_message_handler(content_types=MESSAGE_CONTENT_TYPES)
+    @log_function_call
+    @observe_handler
+    async def handle_edited_messages(message):
+        """Обрабатывает редактированные сообщения различных типов."""
+        response = edited_content_reply(message)
+        try:
+            await reply(message.chat.id, response)
+        except asyncio_helper.ApiException as e:
+            logger.error("Ошибка при отправке сообщения пользователю %s: %s",
+                         message.from_user.id, e)
+
+    @signal_bot.callback_query_handler(func=lambda call: True)
+    @log_function_call
+    @observe_handler
+    async def handle_inline_buttons(call):
+        """Обрабатывает нажатия на инлайн-кнопки: сначала ответ, затем последующая работа."""
+        response = callback_reply(call)
+        try:
+            await signal_bot.answer_callback_query(call.id, response)
+        except asyncio_helper.ApiException as e:
+            logger.error("Ошибка при ответе на обратный вызов пользователю %s: %s",
+                         call.from_user.id, e)
+        if responder is not None:
+            # Работа выполняется в пуле ответчика через его синхронный бот
+            follow_up = callbacks.follow_up_for(responder.signal_bot, call)
+            if follow_up is not None:
+                responder.schedule(call, follow_up)
+            return
+        follow_up = callbacks.follow_up_for(signal_bot, call)
+        if follow_up is not None:
+            result = follow_up()
+            if inspect.isawaitable(result):
+                await result
+
+    @signal_bot.message_handler(content_types=SERVICE_CONTENT_TYPES)
+    @log_function_call
+    @observe_handler
+    async def handle_service_messages(message):
+        """Обрабатывает служебные сообщения чата."""
+        for user_id, response in service_replies(message):
+            try:
+                await reply(message.chat.id, response)
+            except asyncio_helper.ApiException as e:
+                logger.error("Ошибка при отправке служебного ответа пользователю %s: %s",
+                             user_id, e)
+
+
+async def _run_async_polling(signal_bot, stop_event, allowed_updates, long_polling_timeout, drain_timeout):
+    # get_me открывает соединение и дает имя бота фильтру команд до первого
+    # обновления, а меню команд публикуется в фоне
+    try:
+        commands.bot_username = (await asyncio.wait_for(signal_bot.get_me(), PREWARM_TIMEOUT)).username
+    except Exception as e:
+        logger.warning("Не удалось выполнить get_me при запуске: %r", e)
+    publish_task = asyncio.create_task(commands.publish_async(signal_bot, catalog.locales))
+    # Обновления, сохраненные при прошлой остановке (см. lifecycle.py), обрабатываются до polling
+    pending = []
+    restore_updates(pending.append)
+    for update_json in pending:
+        try:
+            await AsyncTeleBot.process_new_updates(signal_bot, [types.Update.de_json(update_json)])
+        except Exception as e:
+            logger.error("Ошибка при обработке сохраненного обновления: %s", e)
+    polling_task = asyncio.create_task(signal_bot.infinity_polling(
+        timeout=long_polling_timeout,
+        allowed_updates=allowed_updates,
+        skip_pending=False
+    ))
+    stop_task = asyncio.create_task(asyncio.to_thread(stop_event.wait))
+
+    await asyncio.wait({polling_task, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+    # Останавливаем получение обновлений и дожидаемся уже начатой обработки
+    started = time.monotonic()
+    signal_bot._polling = False
+    polling_task.cancel()
+    publish_task.cancel()
+    await asyncio.gather(polling_task, publish_task, return_exceptions=True)
+    dropped = await signal_bot.wait_idle(drain_timeout)
+    if not dropped and signal_bot.offset:
+        # Подтверждаем последнюю пачку, только если все полученные обновления
+        # запущены и обработаны, иначе после запуска она придет повторно.
+        # Если обработка прервана, пачка придет снова и будет дообработана.
+        try:
+            # Мимо учета слотов: ответ подтверждения не обрабатывается
+            await AsyncTeleBot.get_updates(signal_bot, offset=signal_bot.offset, limit=1, timeout=0)
+        except Exception as e:
+            logger.error("Не удалось подтвердить полученные обновления: %s", e)
+    await signal_bot.close_session()
+    level = logger.warning if dropped else logger.info
+    level(f"Асинхронный polling остановлен за {time.monotonic() - started:.2f} с, "
+          f"прервано или не запущено обработок: {dropped}")
+
+
+def run_async_bot(bot_token, stop_event, allowed_updates=None, max_in_flight=64,
+                  long_polling_timeout=5, drain_timeout=None, api_url=None,
+                  dispatcher=None, responder=None, state_store=None, media=None):
+    """
+    Запускает асинхронный режим работы бота до установки `stop_event`.
+
+    Функция блокирующая и предназначена для запуска в отдельном потоке,
+    так же как `main.run_bot_polling`.
+
+    Args:
+        bot_token (str): Токен бота.
+        stop_event (threading.Event): Событие для остановки бота.
+        allowed_updates (list): Типы обновлений, которые нужно получать.
+        max_in_flight (int): Максимальное число одновременно обрабатываемых обновлений.
+        long_polling_timeout (int): Таймаут long polling, в секундах.
+        drain_timeout (float): Сколько секунд при остановке ждать обработчиков.
+            None - без ограничения.
+        api_url (str): Шаблон адреса Bot API вместо api.telegram.org (`http.api_url`).
+        dispatcher, responder, state_store, media: Подсистемы для обработчиков,
+            см. `register_async_handlers`. Их останавливает вызывающий код.
+    """
+    logger.info(f"Запуск асинхронного режима (max_in_flight={max_in_flight})")
+    if api_url:
+        asyncio_helper.API_URL = api_url
+    signal_bot = BoundedAsyncTeleBot(bot_token, max_in_flight=max_in_flight)
+    register_async_handlers(signal_bot, dispatcher, responder, state_store, media)
+    asyncio.run(_run_async_polling(
+        signal_bot, stop_event, allowed_updates, long_polling_timeout, drain_timeout))
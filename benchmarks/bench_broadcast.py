@@ -0,0 +1,81 @@
+#  Содержание benchmarks/bench_broadcast.py
+#
+#  Бенчмарк массовой рассылки сигнала на локальном фейковом Bot API.
+#  Лимит частоты можно поднять, чтобы измерить потолок пула потоков:
+#
+#      python -m benchmarks.bench_broadcast --subscribers 600 --rate 30
+#      python -m benchmarks.bench_broadcast --subscribers 20000 --rate 1000 --interrupt-after 5
+#      python -m benchmarks.bench_broadcast --subscribers 600 --rate 30 --queue
+
+import argparse
+import logging
+import tempfile
+import threading
+
+import telebot
+from telebot import apihelper
+
+from benchmarks.bench_runtime import FAKE_TOKEN
+from benchmarks.fake_bot_api import FakeBotApi
+from broadcast import SignalBroadcaster
+from send_queue import OutboundDispatcher
+from logger import logger
+
+
+def _print_report(title, report):
+    print(f"{title}: отправлено {report['sent']}, пропущено {report['skipped']}, "
+          f"ошибок {report['failed']}, {report['duration']:.2f} с, "
+          f"{report['throughput']:.1f} сообщ./с{' (прервана)' if report['interrupted'] else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк массовой рассылки")
+    parser.add_argument("--subscribers", type=int, default=600)
+    parser.add_argument("--rate", type=float, default=30, help="Глобальный лимит, сообщ./с")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Задержка фейкового Bot API на sendMessage, с")
+    parser.add_argument("--blocked-every", type=int, default=100,
+                        help="Каждый N-й подписчик заблокировал бота (0 - никто)")
+    parser.add_argument("--interrupt-after", type=float, default=0,
+                        help="Прервать рассылку через N секунд и затем продолжить ее")
+    parser.add_argument("--queue", action="store_true",
+                        help="Отправлять через очередь исходящих сообщений (send_queue) с лимитом --rate")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    api = FakeBotApi(latency=args.latency).start()
+    apihelper.API_URL = api.api_url
+    subscribers = list(range(1_000_000, 1_000_000 + args.subscribers))
+    if args.blocked_every:
+        api.blocked_chats = set(subscribers[::args.blocked_every])
+
+    signal_bot = telebot.TeleBot(FAKE_TOKEN, threaded=False)
+    dispatcher = None
+    if args.queue:
+        dispatcher = OutboundDispatcher(signal_bot, global_rate=args.rate, workers=args.workers).start()
+    broadcaster = SignalBroadcaster(signal_bot, workers=args.workers, global_rate=args.rate,
+                                    checkpoint_dir=tempfile.mkdtemp(prefix="broadcast-bench-"),
+                                    dispatcher=dispatcher)
+    text = "BTC/USDT LONG 65000, TP 67000, SL 64000"
+
+    stop_event = threading.Event()
+    if args.interrupt_after:
+        threading.Timer(args.interrupt_after, stop_event.set).start()
+    report = broadcaster.broadcast("bench", text, subscribers, stop_event=stop_event)
+    _print_report("Рассылка", report)
+    if report["interrupted"]:
+        resumed = broadcaster.broadcast("bench", text, subscribers)
+        _print_report("Продолжение", resumed)
+        report["sent"] += resumed["sent"]
+        report["failed"] = resumed["failed"] + report["failed"]
+
+    print(f"Всего доставлено {report['sent']} из {len(subscribers)}, "
+          f"запросов sendMessage к API: {api.calls.get('sendMessage', 0)}")
+    if dispatcher is not None:
+        dispatcher.stop()
+    api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#  Содержание benchmarks/bench_callbacks.py
+#
+#  Время реакции на нажатие инлайн-кнопки при медленной последующей работе
+#  (редактирование сообщения сигнала). Сравнивается ответ и работа в потоке
+#  обработчика TeleBot с CallbackResponder, который отвечает сразу, а работу
+#  выполняет в фоне. Запуск из корня проекта:
+#
+#      python -m benchmarks.bench_callbacks --presses 200 --edit-latency 0.3
+
+import argparse
+import logging
+import threading
+import time
+
+import telebot
+from telebot import apihelper
+
+from benchmarks.bench_runtime import FAKE_TOKEN, _percentile
+from benchmarks.fake_bot_api import FakeBotApi, make_callback_update
+from keyboards import CallbackResponder, encode_callback
+from logger import logger
+
+
+def run_case(presses, chats, latency, edit_latency, threads, responder_workers):
+    """
+    Прогоняет `presses` нажатий кнопок сигнала из `chats` чатов.
+
+    Args:
+        responder_workers (int): Потоки CallbackResponder (0 - без него).
+
+    Returns:
+        dict: Перцентили времени до ответа на нажатие, общее время и статистика.
+    """
+    from bot import register_handlers
+    api = FakeBotApi(latency=latency).start()
+    api.method_latency["editMessageReplyMarkup"] = edit_latency
+    apihelper.API_URL = api.api_url
+
+    signal_bot = telebot.TeleBot(FAKE_TOKEN, num_threads=threads)
+    responder = CallbackResponder(signal_bot, workers=responder_workers) if responder_workers else None
+    register_handlers(signal_bot, responder=responder)
+    # Пользователи нажимают «Подробнее» / «Скрыть» под одним сообщением сигнала
+    api.add_updates([
+        make_callback_update(i, 10_000 + i % chats,
+                             encode_callback("signal", "btc-2024-10-01", "more" if i % 2 else "less"))
+        for i in range(1, presses + 1)])
+
+    started = time.perf_counter()
+    thread = threading.Thread(
+        target=signal_bot.infinity_polling,
+        kwargs={"timeout": 5, "long_polling_timeout": 1, "logger_level": None},
+        daemon=True)
+    thread.start()
+    deadline = time.monotonic() + max(60.0, presses * (latency + edit_latency) * 2)
+    api.wait_answered(presses, timeout=deadline - time.monotonic())
+    answered_in = time.perf_counter() - started
+    if responder is not None:
+        responder.join(max(0.0, deadline - time.monotonic()))
+    elapsed = time.perf_counter() - started
+    signal_bot.stop_polling()
+    thread.join(10)
+    stats = responder.metrics() if responder is not None else {}
+    if responder is not None:
+        responder.stop()
+    api.stop()
+
+    latencies = [answered_at - api.served_at[int(callback_id)]
+                 for callback_id, answered_at in api.answered.items()]
+    return {
+        "answered": len(api.answered),
+        "edits": api.calls.get("editMessageReplyMarkup", 0),
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "answered_in": answered_in,
+        "elapsed": elapsed,
+        "stats": stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк ответов на нажатия инлайн-кнопок")
+    parser.add_argument("--presses", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Задержка answerCallbackQuery на фейковом Bot API, с")
+    parser.add_argument("--edit-latency", type=float, default=0.3,
+                        help="Задержка editMessageReplyMarkup (медленная работа по нажатию), с")
+    parser.add_argument("--threads", type=int, default=2,
+                        help="num_threads для TeleBot (по умолчанию как в main.py)")
+    parser.add_argument("--workers", type=int, default=4, help="Потоки CallbackResponder")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    for title, workers in (("в потоке обработчика", 0), (f"CallbackResponder, {args.workers} потока", args.workers)):
+        result = run_case(args.presses, args.chats, args.latency, args.edit_latency, args.threads, workers)
+        print(f"{title:>28}: ответ на нажатие p50 {result['p50_ms']:7.1f} мс, p99 {result['p99_ms']:7.1f} мс; "
+              f"все ответы за {result['answered_in']:.1f} с, вся работа за {result['elapsed']:.1f} с, "
+              f"правок {result['edits']}")
+        if result["stats"]:
+            print(f"{'':>28}  {result['stats']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#  Содержание benchmarks/bench_commands.py
+#
+#  Бенчмарк стоимости выбора обработчика команды на одно обновление.
+#  Сравнивается обход фильтров pyTelegramBotAPI, когда каждая команда
+#  зарегистрирована отдельным `message_handler(commands=[...])`, и один
+#  обработчик с CommandRouter, выбирающий команду по словарю. Сеть не
+#  используется: обработчики только формируют текст ответа.
+#
+#      python -m benchmarks.bench_commands --commands 50 --updates 20000
+
+import argparse
+import logging
+import random
+import time
+
+import telebot
+from telebot import types
+
+from benchmarks.bench_runtime import FAKE_TOKEN
+from benchmarks.fake_bot_api import make_text_update
+from commands import CommandRouter
+from logger import logger
+
+
+def build_filter_bot(names, text_handler):
+    """Бот, где каждая команда - отдельный обработчик с фильтром `commands`."""
+    signal_bot = telebot.TeleBot(FAKE_TOKEN, threaded=False)
+    for name in names:
+        signal_bot.register_message_handler(
+            lambda message, name=name: f"/{name}", commands=[name])
+    signal_bot.register_message_handler(text_handler, content_types=['text'])
+    return signal_bot
+
+
+def build_router_bot(names, text_handler):
+    """Бот с одним обработчиком команд на CommandRouter."""
+    router = CommandRouter()
+    for name in names:
+        router.command(name, f"Команда {name}")(lambda message, args, name=name: f"/{name}")
+    router.unknown(lambda message, args: "unknown")
+    signal_bot = telebot.TeleBot(FAKE_TOKEN, threaded=False)
+    signal_bot.register_message_handler(router.dispatch, func=router.match)
+    signal_bot.register_message_handler(text_handler, content_types=['text'])
+    return signal_bot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость выбора обработчика команды")
+    parser.add_argument("--commands", type=int, default=50, help="Количество команд")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--command-share", type=float, default=0.5,
+                        help="Доля обновлений-команд, остальные - обычный текст")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    names = [f"cmd{i}" for i in range(args.commands)]
+    rng = random.Random(1)
+    texts = [f"/{rng.choice(names)}@SignalBot BTC 65000" if rng.random() < args.command_share
+             else "BTC/USDT LONG 65000" for _ in range(args.updates)]
+    updates = [types.Update.de_json(make_text_update(i + 1, 42, text)) for i, text in enumerate(texts)]
+
+    def text_handler(message):
+        return message.text
+
+    for title, factory in (("фильтры pyTelegramBotAPI", build_filter_bot),
+                           ("CommandRouter", build_router_bot)):
+        signal_bot = factory(names, text_handler)
+        started = time.perf_counter()
+        for update in updates:
+            signal_bot.process_new_updates([update])
+        elapsed = time.perf_counter() - started
+        print(f"{title:>26}: {elapsed / args.updates * 1e6:7.2f} мкс/обновление "
+              f"({args.commands} команд)")
+
+
+if __name__ == "__main__":
+    main()
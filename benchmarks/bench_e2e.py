@@ -0,0 +1,310 @@
+#  Содержание benchmarks/bench_e2e.py
+#
+#  Сквозной бенчмарк: бот запускается через `main.run_signal_bot` в отдельном
+#  процессе в каждом режиме работы, получает синтетические обновления всех
+#  типов (benchmarks/synthetic_updates.py) от локального фейкового Bot API и
+#  отвечает на них. Для каждого режима выводятся время запуска, пропускная
+#  способность, перцентили задержки ответа, пиковая память, процессорное время
+#  и время остановки. Запуск из корня проекта:
+#
+#      python -m benchmarks.bench_e2e --updates 2000 --latency 0.02 --outbound-rate 1000
+#      python -m benchmarks.bench_e2e --modes threaded,async --faults 0.05 --fault-codes 429,502
+#      python -m benchmarks.bench_e2e --json > baseline.jsonl
+
+import argparse
+import copy
+import http.client
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_runtime import FAKE_TOKEN, _percentile
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.synthetic_updates import expected_replies, generate_updates
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("threaded", "durable", "async", "webhook", "sharded")
+# Сколько секунд без новых ответов считать, что оставшиеся ответы потеряны
+IDLE_TIMEOUT = 10.0
+
+
+def bench_settings(mode, webhook_port=0, shards=2, outbound_rate=None):
+    """
+    Настройки бота из `settings/key.json` для прогона в режиме `mode`.
+
+    Режим `durable` - это `threaded` с надежным хранилищем входящих обновлений.
+    Метрики и регистрация webhook в Telegram отключаются. `outbound_rate`
+    заменяет общий лимит очереди исходящих сообщений (`outbound.global_rate`).
+
+    Returns:
+        dict: Настройки бота.
+    """
+    with open(os.path.join(ROOT_DIR, 'settings', 'key.json'), 'r', encoding='utf-8') as file:
+        settings = copy.deepcopy(json.load(file)['tgm_bots']['SendingTradeSignal_Bot'])
+    settings['tgm_bot_token'] = FAKE_TOKEN
+    settings.setdefault('runtime', {})['mode'] = 'threaded' if mode == 'durable' else mode
+    settings.setdefault('inbound', {})['durable'] = mode == 'durable'
+    settings['inbound']['path'] = os.path.join("state", "updates.db")
+    settings.setdefault('sharding', {}).update({'workers': shards, 'source': 'polling'})
+    settings.setdefault('webhook', {}).update({'url': '', 'listen': '127.0.0.1', 'port': webhook_port,
+                                               'path': '/', 'secret_token': ''})
+    settings.setdefault('metrics', {})['enabled'] = False
+    settings.setdefault('http', {})
+    if outbound_rate:
+        settings.setdefault('outbound', {})['global_rate'] = outbound_rate
+    return settings
+
+
+def run_child(mode, api_url, webhook_port, shards, outbound_rate=None):
+    """
+    Запускает бота в текущем процессе до SIGTERM (вызывается в дочернем процессе).
+
+    Импорт `main` входит во время запуска, которое измеряет родительский процесс.
+    """
+    import main
+    from config import BotConfig
+
+    settings = bench_settings(mode, webhook_port, shards, outbound_rate)
+    settings['http']['api_url'] = api_url
+    # Вложения синтетических обновлений скачиваются с того же фейкового сервера
+    settings['http']['file_url'] = api_url.replace("/bot{0}/", "/file/bot{0}/")
+    config = BotConfig(settings['tgm_bot_token'], settings)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    stop_event, restart_event = threading.Event(), threading.Event()
+    thread = threading.Thread(target=main.run_signal_bot, args=(stop_event, restart_event),
+                              kwargs={'config': config})
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(0.5)
+    except KeyboardInterrupt:
+        stop_event.set()
+        thread.join()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(api, mode, port, proc, timeout):
+    """Ждет первого getUpdates (или открытого порта webhook) и возвращает момент готовности."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"процесс бота завершился с кодом {proc.returncode}")
+        if mode == "webhook":
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                return time.perf_counter()
+            except OSError:
+                pass
+        elif api.calls.get("getUpdates"):
+            return time.perf_counter()
+        time.sleep(0.005)
+    raise RuntimeError(f"бот не запустился за {timeout} с")
+
+
+def _post_updates(api, port, updates, senders=4):
+    """Отправляет обновления на webhook, запоминая время отправки как время отдачи."""
+    chunks = [updates[i::senders] for i in range(senders)]
+
+    def sender(chunk):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        for update in chunk:
+            body = json.dumps(update).encode("utf-8")
+            api.served_at[update["update_id"]] = time.perf_counter()
+            connection.request("POST", "/", body=body, headers={"Content-Type": "application/json"})
+            connection.getresponse().read()
+        connection.close()
+
+    threads = [threading.Thread(target=sender, args=(chunk,), daemon=True) for chunk in chunks]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def _wait_replies(api, expected_sent, expected_answered, timeout):
+    """Ждет ожидаемых ответов; прекращает ждать, если ответов нет `IDLE_TIMEOUT` секунд."""
+    deadline = time.monotonic() + timeout
+    progress, progress_at = -1, time.monotonic()
+    while time.monotonic() < deadline:
+        sent, answered = len(api.sent), len(api.answered)
+        if sent >= expected_sent and answered >= expected_answered:
+            return True
+        if sent + answered != progress:
+            progress, progress_at = sent + answered, time.monotonic()
+        elif time.monotonic() - progress_at > IDLE_TIMEOUT:
+            return False
+        time.sleep(0.01)
+    return False
+
+
+def _wait_exit(proc, timeout):
+    """Ждет завершения процесса и возвращает его rusage (при зависании процесс убивается)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        expired = time.monotonic() > deadline
+        if expired:
+            proc.kill()
+        pid, status, rusage = os.wait4(proc.pid, 0 if expired else os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return rusage
+        time.sleep(0.02)
+
+
+def run_mode(mode, updates, latency, fault_rate=0.0, fault_codes=(429,), shards=2, outbound_rate=None,
+             timeout=120.0, keep=False):
+    """
+    Запускает бота в режиме `mode` в отдельном процессе и прогоняет через него обновления.
+
+    Args:
+        mode (str): Режим из `MODES`.
+        updates (list): Обновления из `generate_updates`.
+        latency (float): Задержка фейкового Bot API на методы отправки, в секундах.
+        fault_rate (float): Доля вызовов sendMessage/answerCallbackQuery, отвечаемых ошибкой.
+        fault_codes (tuple): Коды внедряемых ошибок.
+        shards (int): Количество рабочих процессов в режиме `sharded`.
+        outbound_rate (float): Общий лимит исходящих сообщений вместо настроек бота.
+        timeout (float): Ограничение времени на запуск и на обработку, в секундах.
+        keep (bool): Не удалять рабочую директорию процесса (логи, state).
+
+    Returns:
+        dict: Время запуска, пропускная способность, задержки, память и время остановки.
+    """
+    from sharding import extract_chat_id
+
+    api = FakeBotApi(latency=latency).start()
+    if fault_rate:
+        api.inject_faults(fault_rate, codes=fault_codes, seed=0)
+    port = _free_port() if mode == "webhook" else 0
+    workdir = tempfile.mkdtemp(prefix=f"bench-e2e-{mode}-")
+    env = dict(os.environ, TGM_LOG_DIR=os.path.join(workdir, "logs"),
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get("PYTHONPATH")])))
+    log_path = os.path.join(workdir, "bot.out")
+    with open(log_path, "wb") as log_file:
+        started = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_e2e", "--child", mode, "--api-url", api.api_url,
+             "--webhook-port", str(port), "--shards", str(shards)]
+            + (["--outbound-rate", str(outbound_rate)] if outbound_rate else []),
+            cwd=workdir, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    try:
+        ready = _wait_ready(api, mode, port, proc, timeout)
+        expected = [expected_replies(update) for update in updates]
+        expected_sent = sum(sent for sent, _ in expected)
+        expected_answered = sum(answered for _, answered in expected)
+
+        fed = time.perf_counter()
+        if mode == "webhook":
+            _post_updates(api, port, updates)
+        else:
+            api.add_updates(updates)
+        completed = _wait_replies(api, expected_sent, expected_answered, timeout)
+        replies = sorted([at for _, at in api.sent] + list(api.answered.values()))
+        elapsed = (replies[-1] if replies else time.perf_counter()) - fed
+    except Exception:
+        proc.kill()
+        _wait_exit(proc, 10)
+        with open(log_path, "r", encoding="utf-8", errors="replace") as file:
+            sys.stderr.write(file.read()[-4000:])
+        raise
+    finally:
+        stopping = time.perf_counter()
+        if proc.returncode is None:
+            proc.send_signal(signal.SIGTERM)
+        rusage = _wait_exit(proc, 30)
+        shutdown = time.perf_counter() - stopping
+        api.stop()
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # Первый ответ в чат обновления (у служебных сообщений без ответа задержки нет)
+    first_reply = {}
+    for chat_id, sent_at in api.sent:
+        first_reply.setdefault(chat_id, sent_at)
+    latencies = []
+    for update, (sent, answered) in zip(updates, expected):
+        update_id = update["update_id"]
+        reply_at = (api.answered.get(str(update_id)) if answered
+                    else first_reply.get(extract_chat_id(update)) if sent else None)
+        if reply_at is not None and update_id in api.served_at:
+            latencies.append(reply_at - api.served_at[update_id])
+    return {
+        "mode": mode,
+        "completed": completed,
+        "updates": len(updates),
+        "replies": len(api.sent) + len(api.answered),
+        "expected_replies": expected_sent + expected_answered,
+        "startup_s": round(ready - started, 3),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_sec": round(len(updates) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "max_rss_mb": round(rusage.ru_maxrss / 1024, 1),
+        "cpu_s": round(rusage.ru_utime + rusage.ru_stime, 2),
+        "shutdown_s": round(shutdown, 2),
+        "exit_code": proc.returncode,
+        "faults": dict(api.faults),
+        "calls": dict(api.calls),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк режимов работы бота на фейковом Bot API")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Задержка фейкового Bot API на методы отправки, с")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--shards", type=int, default=2, help="Рабочие процессы в режиме sharded")
+    parser.add_argument("--outbound-rate", type=float,
+                        help="Общий лимит исходящих сообщений в секунду вместо outbound.global_rate "
+                             "(по умолчанию пропускная способность ограничена лимитом Telegram)")
+    parser.add_argument("--faults", type=float, default=0.0,
+                        help="Доля вызовов sendMessage/answerCallbackQuery, отвечаемых ошибкой")
+    parser.add_argument("--fault-codes", default="429", help="Коды ошибок через запятую: 429,500,502,503")
+    parser.add_argument("--seed", type=int, default=0, help="Начальное значение генератора обновлений")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", action="store_true", help="Выводить результаты в JSON, по строке на режим")
+    parser.add_argument("--keep", action="store_true", help="Не удалять рабочие директории с логами бота")
+    parser.add_argument("--child", metavar="MODE", help=argparse.SUPPRESS)
+    parser.add_argument("--api-url", help=argparse.SUPPRESS)
+    parser.add_argument("--webhook-port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.api_url, args.webhook_port, args.shards, args.outbound_rate)
+        return
+
+    updates = generate_updates(args.updates, seed=args.seed)
+    fault_codes = tuple(int(code) for code in args.fault_codes.split(","))
+    for mode in args.modes.split(","):
+        result = run_mode(mode, updates, args.latency, args.faults, fault_codes,
+                          args.shards, args.outbound_rate, args.timeout, args.keep)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+            continue
+        print(f"{mode:>9}: запуск {result['startup_s']:.2f} с, "
+              f"{result['updates']} обновлений за {result['elapsed_s']:.2f} с "
+              f"({result['updates_per_sec']:.1f} upd/s), "
+              f"p50 {result['p50_ms']:.1f} мс, p99 {result['p99_ms']:.1f} мс, "
+              f"ответов {result['replies']}/{result['expected_replies']}, "
+              f"RSS {result['max_rss_mb']:.1f} МБ, CPU {result['cpu_s']:.2f} с, "
+              f"остановка {result['shutdown_s']:.2f} с"
+              f"{'' if result['completed'] else ' (не все ответы получены)'}"
+              f"{', ошибки ' + str(result['faults']) if result['faults'] else ''}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
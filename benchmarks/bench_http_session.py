@@ -0,0 +1,123 @@
+#  Содержание benchmarks/bench_http_session.py
+#
+#  Бенчмарк HTTP-клиента Bot API на локальном фейковом сервере с TLS.
+#  Много потоков одновременно вызывают send_message и answer_callback_query.
+#  Вызовы идут несколькими волнами, каждая в новом пуле потоков (как
+#  рассылки, создающие свой пул). Для каждого варианта сессии выводится число
+#  TLS-рукопожатий и p50/p99 задержки одного вызова. Нужна утилита openssl:
+#
+#      python -m benchmarks.bench_http_session --threads 32 --calls 3000 --rounds 5
+
+import argparse
+import logging
+import os
+import ssl
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import telebot
+from telebot import apihelper
+
+from benchmarks.bench_runtime import FAKE_TOKEN, _percentile
+from benchmarks.fake_bot_api import FakeBotApi
+import http_session
+from logger import logger
+
+
+def make_certificate(directory):
+    """Создает самоподписанный сертификат для 127.0.0.1 и возвращает пути (сертификат, ключ)."""
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key_path, "-out", cert_path, "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1"],
+        check=True, capture_output=True)
+    return cert_path, key_path
+
+
+def reset_apihelper():
+    """Возвращает apihelper к настройкам pyTelegramBotAPI по умолчанию."""
+    apihelper.CUSTOM_REQUEST_SENDER = None
+    apihelper.session = None
+    apihelper.SESSION_TIME_TO_LIVE = 600
+    http_session._installed_layer = None
+
+
+def run_case(api, signal_bot, threads, calls, rounds):
+    """Выполняет вызовы волнами из новых пулов потоков и возвращает (рукопожатия, задержки)."""
+    def call(index):
+        started = time.perf_counter()
+        if index % 2:
+            signal_bot.answer_callback_query(str(index), "OK")
+        else:
+            signal_bot.send_message(index % 100 + 1, "BTC/USDT LONG 65000")
+        return time.perf_counter() - started
+
+    connections_before = api.connections
+    latencies = []
+    for _ in range(rounds):
+        # Новый пул потоков: сессии apihelper по умолчанию привязаны к потоку
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            latencies.extend(executor.map(call, range(calls // rounds)))
+    return api.connections - connections_before, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк пула HTTP-соединений с Bot API")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--calls", type=int, default=3000)
+    parser.add_argument("--rounds", type=int, default=5, help="Сколько раз пересоздавать пул потоков")
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="Задержка фейкового Bot API на вызов, с")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    cert_path, key_path = make_certificate(tempfile.mkdtemp(prefix="http-bench-"))
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    api = FakeBotApi(latency=args.latency, ssl_context=context).start()
+    apihelper.API_URL = api.api_url
+    # Сессии apihelper по умолчанию доверяют сертификату через переменную окружения
+    os.environ["REQUESTS_CA_BUNDLE"] = cert_path
+    signal_bot = telebot.TeleBot(FAKE_TOKEN, threaded=False)
+
+    def default_sessions():
+        reset_apihelper()
+
+    def shared_default_pool():
+        reset_apihelper()
+        apihelper.session = requests.Session()
+
+    def session_layer():
+        reset_apihelper()
+        http_session.install_session_layer(args.threads, verify=cert_path)
+
+    cases = [
+        ("сессия на поток (по умолчанию)", default_sessions),
+        ("общая сессия, пул 10", shared_default_pool),
+        (f"ApiSessionLayer, пул {args.threads}", session_layer),
+    ]
+    try:
+        import httpx  # noqa: F401
+        cases.append(("ApiSessionLayer, httpx HTTP/2", lambda: (
+            reset_apihelper(),
+            http_session.install_session_layer(args.threads, client="httpx", verify=cert_path))))
+    except ImportError:
+        print("httpx не установлен: вариант с HTTP/2 пропущен")
+
+    for title, setup in cases:
+        setup()
+        handshakes, latencies = run_case(api, signal_bot, args.threads, args.calls, args.rounds)
+        print(f"{title:>34}: рукопожатий TLS {handshakes:5d}, "
+              f"p50 {_percentile(latencies, 50) * 1000:6.1f} мс, "
+              f"p99 {_percentile(latencies, 99) * 1000:6.1f} мс")
+    reset_apihelper()
+    api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#  Содержание benchmarks/bench_logging.py
+#
+#  Микробенчмарк накладных расходов декоратора log_function_call на вызов
+#  обработчика. Логи пишутся в os.devnull, чтобы учесть форматирование и
+#  работу хендлера, но не скорость диска:
+#
+#      python -m benchmarks.bench_logging --calls 20000
+
+import argparse
+import logging
+import os
+import timeit
+from functools import wraps
+
+from telebot import types
+
+from benchmarks.fake_bot_api import make_text_update
+from logger import logger, log_function_call, configure_call_logging
+
+
+def eager_log_function_call(func):
+    """Прежняя реализация декоратора: f-строка с полным repr аргументов на INFO."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        logger.info(
+            f"Вызов функции {func.__name__} с аргументами: {args} и именованными аргументами: {kwargs}")
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def handler(message):
+    """Обработчик-заглушка с работой, сопоставимой с формированием ответа."""
+    return f"Вы отправили текстовое сообщение: {message.text}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Накладные расходы log_function_call")
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    # Пишем в /dev/null через обычный форматтер, как файловый хендлер логгера
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+    devnull = open(os.devnull, 'w', encoding='utf-8')
+    null_handler = logging.StreamHandler(devnull)
+    null_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(null_handler)
+    logger.setLevel(logging.INFO)
+
+    message = types.Message.de_json(make_text_update(1, 42, "BTC/USDT LONG")["message"])
+    eager = eager_log_function_call(handler)
+    lazy = log_function_call(handler)
+
+    cases = [
+        ("без декоратора", handler, None, None),
+        ("старый декоратор (INFO, полный repr)", eager, None, None),
+        ("новый декоратор, уровень INFO", lazy, logging.INFO, 1.0),
+        ("новый декоратор, INFO, выборка 1%", lazy, logging.INFO, 0.01),
+        ("новый декоратор, уровень DEBUG (выключен)", lazy, logging.DEBUG, 1.0),
+    ]
+    baseline = None
+    for title, func, level, sample_rate in cases:
+        if level is not None:
+            configure_call_logging(level=level, sample_rate=sample_rate)
+        seconds = min(timeit.repeat(lambda: func(message), number=args.calls, repeat=3))
+        per_call_us = seconds / args.calls * 1e6
+        if baseline is None:
+            baseline = per_call_us
+        print(f"{title:>45}: {per_call_us:8.2f} мкс/вызов "
+              f"(+{per_call_us - baseline:.2f} мкс)")
+
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
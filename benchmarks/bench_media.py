@@ -0,0 +1,183 @@
+#  Содержание benchmarks/bench_media.py
+#
+#  Вложения через локальный фейковый Bot API (benchmarks/fake_bot_api.py):
+#
+#  - пиковая память при скачивании большого файла: потоковое скачивание
+#    `MediaPipeline.download` против `TeleBot.download_file`, который держит
+#    весь файл в памяти;
+#  - скачивание вложений `--messages` сообщений, в которых всего `--unique`
+#    разных файлов (пересланные сигналы): конвейер с дедупликацией против
+#    скачивания файла каждого сообщения;
+#  - рассылка графика `--chats` получателям: загрузка файла один раз и
+#    отправка по `file_id` против загрузки файла каждому получателю.
+#
+#  Запуск из корня проекта:
+#
+#      python -m benchmarks.bench_media --file-mb 16 --messages 500 --unique 20 --chats 500
+#      python -m benchmarks.bench_media --rtt 0.02
+
+import argparse
+import gc
+import logging
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+from telebot import apihelper, types
+
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.synthetic_updates import make_update
+from broadcast import SignalBroadcaster
+from logger import logger
+from media import FileIdCache, MediaPipeline
+
+
+def peak_memory(action):
+    """Выполняет `action()` и возвращает пиковую память Python за время выполнения, в байтах."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        action()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def bench_download(api, signal_bot, directory, file_mb, chunk_size):
+    """Пиковая память и время скачивания одного файла размером `file_mb` МБ."""
+    api.add_file("big-file", file_mb * 2**20)
+    pipeline = MediaPipeline(signal_bot, directory, workers=1, max_file_size=2**40, chunk_size=chunk_size)
+    result = {}
+    try:
+        started = time.perf_counter()
+        result["stream_peak"] = peak_memory(
+            lambda: pipeline.download("big-file", os.path.join(directory, "stream.bin")))
+        result["stream_s"] = time.perf_counter() - started
+
+        def download_whole():
+            file_info = signal_bot.get_file("big-file")
+            with open(os.path.join(directory, "whole.bin"), "wb") as file:
+                file.write(signal_bot.download_file(file_info.file_path))
+
+        started = time.perf_counter()
+        result["whole_peak"] = peak_memory(download_whole)
+        result["whole_s"] = time.perf_counter() - started
+    finally:
+        pipeline.stop()
+    return result
+
+
+def bench_dedup(api, signal_bot, directory, messages, unique, workers):
+    """Скачивание вложений `messages` сообщений с `unique` разными файлами."""
+    updates = [make_update(1000 + 10 * (i % unique), "document", 10_000 + i, "ru") for i in range(messages)]
+    batch = [types.Update.de_json(update).message for update in updates]
+    result = {}
+
+    downloads = api.downloads
+    pipeline = MediaPipeline(signal_bot, os.path.join(directory, "dedup"), content_types=("document",),
+                             workers=workers, max_pending=messages)
+    started = time.perf_counter()
+    for message in batch:
+        pipeline.submit(message, lambda message, path: None)
+    pipeline.join(timeout=120)
+    result["dedup_s"] = time.perf_counter() - started
+    result["dedup_downloads"] = api.downloads - downloads
+    result["dedup_processed"] = pipeline.stats["processed"]
+    pipeline.stop()
+
+    # Каждое сообщение скачивает свой файл
+    downloads = api.downloads
+    pipeline = MediaPipeline(signal_bot, os.path.join(directory, "naive"), workers=1)
+    os.makedirs(pipeline.directory, exist_ok=True)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda item: pipeline.download(item[1].document.file_id,
+                                                         os.path.join(pipeline.directory, f"{item[0]}.pdf")),
+                          enumerate(batch)))
+    result["naive_s"] = time.perf_counter() - started
+    result["naive_downloads"] = api.downloads - downloads
+    pipeline.stop()
+    return result
+
+
+def bench_broadcast(api, signal_bot, directory, chats, chart_kb, workers):
+    """Рассылка графика размером `chart_kb` КБ `chats` получателям."""
+    chart = os.path.join(directory, "chart.png")
+    with open(chart, "wb") as file:
+        file.write(os.urandom(chart_kb * 1024))
+    result = {}
+
+    uploaded = api.uploaded_bytes
+    file_ids = FileIdCache()
+    broadcaster = SignalBroadcaster(signal_bot, workers=workers, global_rate=1e9,
+                                    checkpoint_dir=os.path.join(directory, "broadcasts"), file_ids=file_ids)
+    report = broadcaster.broadcast("bench-media", "BTC/USDT long", range(1, chats + 1), attachment=chart)
+    result["cached_s"] = report["duration"]
+    result["cached_sent"] = report["sent"]
+    result["cached_uploads"] = file_ids.stats["uploads"]
+    result["cached_mb"] = (api.uploaded_bytes - uploaded) / 2**20
+
+    # Каждому получателю загружается сам файл
+    uploaded, uploads = api.uploaded_bytes, api.uploads
+
+    def send(chat_id):
+        with open(chart, "rb") as file:
+            signal_bot.send_photo(chat_id, file, caption="BTC/USDT long")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(send, range(1, chats + 1)))
+    result["naive_s"] = time.perf_counter() - started
+    result["naive_uploads"] = api.uploads - uploads
+    result["naive_mb"] = (api.uploaded_bytes - uploaded) / 2**20
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк скачивания и отправки вложений")
+    parser.add_argument("--file-mb", type=int, default=16, help="Размер большого файла, в МБ")
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--unique", type=int, default=20)
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--chart-kb", type=int, default=200, help="Размер графика для рассылки, в КБ")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rtt", type=float, default=0.0,
+                        help="Задержка ответа фейкового Bot API на методы отправки, в секундах")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    api = FakeBotApi(latency=args.rtt).start()
+    apihelper.API_URL = api.api_url
+    apihelper.FILE_URL = api.file_url
+    signal_bot = telebot.TeleBot("1:fake", threaded=False)
+    directory = tempfile.mkdtemp(prefix="bench-media-")
+    try:
+        result = bench_download(api, signal_bot, directory, args.file_mb, args.chunk_size)
+        print(f"Файл {args.file_mb} МБ: потоковое скачивание - пик памяти "
+              f"{result['stream_peak'] / 2**20:.2f} МБ за {result['stream_s']:.2f} с, "
+              f"download_file - {result['whole_peak'] / 2**20:.2f} МБ за {result['whole_s']:.2f} с")
+
+        result = bench_dedup(api, signal_bot, directory, args.messages, args.unique, args.workers)
+        print(f"{args.messages} сообщений, {args.unique} разных файлов: с дедупликацией "
+              f"{result['dedup_downloads']} скачиваний за {result['dedup_s']:.2f} с "
+              f"(обработано {result['dedup_processed']}), без нее "
+              f"{result['naive_downloads']} скачиваний за {result['naive_s']:.2f} с")
+
+        result = bench_broadcast(api, signal_bot, directory, args.chats, args.chart_kb, args.workers)
+        print(f"Рассылка графика {args.chart_kb} КБ {args.chats} получателям: по file_id "
+              f"{result['cached_uploads']} загрузок, {result['cached_mb']:.1f} МБ за {result['cached_s']:.2f} с "
+              f"(отправлено {result['cached_sent']}), без кеша {result['naive_uploads']} загрузок, "
+              f"{result['naive_mb']:.1f} МБ за {result['naive_s']:.2f} с")
+    finally:
+        api.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#  Содержание benchmarks/bench_runtime.py
+#
+#  Сравнение режимов threaded (TeleBot.infinity_polling) и async (AsyncTeleBot)
+#  на локальном фейковом Bot API. Запуск из корня проекта:
+#
+#      python -m benchmarks.bench_runtime --updates 2000 --latency 0.05
+
+import argparse
+import logging
+import threading
+import time
+
+import telebot
+from telebot import apihelper, asyncio_helper
+
+from benchmarks.fake_bot_api import FakeBotApi, make_text_update
+from logger import logger
+
+FAKE_TOKEN = "123456:BENCHMARK"
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _run_threaded(api, num_threads):
+    from bot import register_handlers
+    signal_bot = telebot.TeleBot(FAKE_TOKEN, num_threads=num_threads)
+    register_handlers(signal_bot)
+    thread = threading.Thread(
+        target=signal_bot.infinity_polling,
+        kwargs={"timeout": 5, "long_polling_timeout": 1, "logger_level": None},
+        daemon=True)
+    thread.start()
+    return lambda: (signal_bot.stop_polling(), thread.join(10))
+
+
+def _run_async(api, max_in_flight):
+    from async_bot import run_async_bot
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_async_bot, args=(FAKE_TOKEN, stop_event),
+        kwargs={"max_in_flight": max_in_flight, "long_polling_timeout": 1},
+        daemon=True)
+    thread.start()
+    return lambda: (stop_event.set(), thread.join(10))
+
+
+def run_mode(mode, updates, latency, concurrency):
+    """
+    Прогоняет `updates` текстовых обновлений через выбранный режим.
+
+    Args:
+        mode (str): 'threaded' или 'async'.
+        updates (int): Количество обновлений.
+        latency (float): Искусственная задержка sendMessage, в секундах.
+        concurrency (int): num_threads для threaded или max_in_flight для async.
+
+    Returns:
+        dict: Пропускная способность и перцентили задержки.
+    """
+    api = FakeBotApi(latency=latency).start()
+    apihelper.API_URL = api.api_url
+    asyncio_helper.API_URL = api.api_url
+
+    # Каждое обновление приходит из своего чата, чтобы сопоставить ответ с запросом
+    api.add_updates([make_text_update(i, 10_000 + i) for i in range(1, updates + 1)])
+    started = time.perf_counter()
+    stop = _run_threaded(api, concurrency) if mode == "threaded" else _run_async(api, concurrency)
+    completed = api.wait_sent(updates, timeout=max(60.0, updates * latency * 2))
+    elapsed = time.perf_counter() - started
+    stop()
+    api.stop()
+
+    latencies = [sent_at - api.served_at[chat_id - 10_000] for chat_id, sent_at in api.sent]
+    return {
+        "mode": mode,
+        "completed": completed,
+        "handled": len(api.sent),
+        "updates_per_sec": len(api.sent) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк режимов threaded и async")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Задержка ответа фейкового Bot API на sendMessage, с")
+    parser.add_argument("--threads", type=int, default=2,
+                        help="num_threads для TeleBot (по умолчанию как в main.py)")
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--modes", default="threaded,async")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    for mode in args.modes.split(","):
+        concurrency = args.threads if mode == "threaded" else args.max_in_flight
+        result = run_mode(mode, args.updates, args.latency, concurrency)
+        print(f"{result['mode']:>9}: {result['handled']} обновлений, "
+              f"{result['updates_per_sec']:.1f} upd/s, "
+              f"p50 {result['p50_ms']:.1f} мс, p99 {result['p99_ms']:.1f} мс"
+              f"{'' if result['completed'] else ' (таймаут)'}")
+
+
+if __name__ == "__main__":
+    main()
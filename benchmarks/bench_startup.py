@@ -0,0 +1,130 @@
+#  Содержание benchmarks/bench_startup.py
+#
+#  Холодный запуск бота: `python main.py` запускается в отдельном процессе с
+#  настройками во временной директории (токен передается через TGM_BOT_TOKEN,
+#  Bot API - локальный фейковый сервер через `http.api_url`), в очереди
+#  getUpdates уже лежит одно обновление. Измеряется время от запуска процесса
+#  до get_me, до первого getUpdates и до ответа на первое обновление. Задержка
+#  `--rtt` добавляется к get_me и методам отправки, как сетевая задержка до
+#  api.telegram.org. Запуск из корня проекта:
+#
+#      python -m benchmarks.bench_startup --runs 5 --rtt 0.05
+#      python -m benchmarks.bench_startup --modes threaded,async --json
+
+import argparse
+import json
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_e2e import ROOT_DIR, _wait_exit, bench_settings
+from benchmarks.bench_runtime import FAKE_TOKEN
+from benchmarks.fake_bot_api import FakeBotApi
+from benchmarks.synthetic_updates import make_update
+
+MODES = ("threaded", "durable", "async")
+PHASES = ("get_me_s", "first_poll_s", "first_reply_s")
+
+
+def run_once(mode, rtt, timeout=30.0, keep=False):
+    """
+    Один холодный запуск `main.py` в режиме `mode`.
+
+    Returns:
+        dict: Время от запуска процесса до get_me, первого getUpdates и
+        ответа на первое обновление, а также время остановки, в секундах.
+    """
+    api = FakeBotApi(latency=rtt)
+    api.method_latency["getMe"] = rtt
+    api.start()
+    api.add_updates([make_update(1, "text", 10_001, "ru")])
+    workdir = tempfile.mkdtemp(prefix=f"bench-startup-{mode}-")
+    settings = bench_settings(mode)
+    settings['tgm_bot_token'] = "ТУТ НАДО ПРОПИСАТЬ ТОКЕН"  # токен придет из TGM_BOT_TOKEN
+    settings['http']['api_url'] = api.api_url
+    settings['http']['file_url'] = api.file_url
+    os.makedirs(os.path.join(workdir, "settings"))
+    with open(os.path.join(workdir, "settings", "key.json"), "w", encoding="utf-8") as file:
+        json.dump({"tgm_bots": {"SendingTradeSignal_Bot": settings}}, file, ensure_ascii=False, indent=4)
+    env = dict(os.environ, TGM_BOT_TOKEN=FAKE_TOKEN, TGM_LOG_DIR=os.path.join(workdir, "logs"))
+    log_path = os.path.join(workdir, "bot.out")
+    try:
+        with open(log_path, "wb") as log_file:
+            started = time.perf_counter()
+            proc = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, "main.py")],
+                                    cwd=workdir, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + timeout
+        while not api.sent and time.monotonic() < deadline and proc.poll() is None:
+            time.sleep(0.002)
+        replied = bool(api.sent)
+        stopping = time.perf_counter()
+        if proc.returncode is None:
+            proc.send_signal(signal.SIGTERM)
+        _wait_exit(proc, 30)
+        shutdown = time.perf_counter() - stopping
+        if not replied:
+            with open(log_path, "r", encoding="utf-8", errors="replace") as file:
+                sys.stderr.write(file.read()[-4000:])
+            raise RuntimeError(f"бот не ответил за {timeout} с (код выхода {proc.returncode})")
+        return {
+            "get_me_s": api.first_called["getMe"] - started,
+            "first_poll_s": api.first_called["getUpdates"] - started,
+            "first_reply_s": api.sent[0][1] - started,
+            "shutdown_s": shutdown,
+        }
+    finally:
+        api.stop()
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(mode, runs, rtt, timeout=30.0, keep=False):
+    """
+    Повторяет холодный запуск `runs` раз.
+
+    Returns:
+        dict: Медиана и минимум каждой фазы, в миллисекундах.
+    """
+    samples = [run_once(mode, rtt, timeout, keep) for _ in range(runs)]
+    result = {"mode": mode, "runs": runs, "rtt_ms": round(rtt * 1000, 1)}
+    for phase in PHASES + ("shutdown_s",):
+        values = [sample[phase] for sample in samples]
+        name = phase[:-2]
+        result[f"{name}_median_ms"] = round(statistics.median(values) * 1000, 1)
+        result[f"{name}_min_ms"] = round(min(values) * 1000, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного запуска main.py")
+    parser.add_argument("--modes", default="threaded,async",
+                        help=f"Режимы через запятую из: {', '.join(MODES)}")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--rtt", type=float, default=0.05,
+                        help="Задержка ответа фейкового Bot API, в секундах")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", action="store_true", help="Выводить результаты в JSONL")
+    parser.add_argument("--keep", action="store_true", help="Не удалять рабочие директории")
+    args = parser.parse_args()
+
+    for mode in args.modes.split(","):
+        if mode not in MODES:
+            parser.error(f"неизвестный режим: {mode}")
+        result = run(mode, args.runs, args.rtt, args.timeout, args.keep)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+            continue
+        print(f"{mode:>9}: get_me {result['get_me_median_ms']:.0f} мс, "
+              f"первый getUpdates {result['first_poll_median_ms']:.0f} мс, "
+              f"ответ на первое обновление {result['first_reply_median_ms']:.0f} мс "
+              f"(минимум {result['first_reply_min_ms']:.0f} мс), "
+              f"остановка {result['shutdown_median_ms']:.0f} мс; медиана {args.runs} запусков", flush=True)
+
+
+if __name__ == "__main__":
+    main()
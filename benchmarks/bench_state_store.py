@@ -0,0 +1,126 @@
+#  Содержание benchmarks/bench_state_store.py
+#
+#  Память и пропускная способность хранилища состояния чатов (state_store.py)
+#  на миллионе чатов: сколько занимает один чат в кеше (с __slots__ и без),
+#  скорость изменений с отложенной записью в SQLite, чтения из кеша и
+#  чтения с промахами, когда кеш меньше числа чатов. Запуск из корня проекта:
+#
+#      python -m benchmarks.bench_state_store --chats 1000000
+
+import argparse
+import gc
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from logger import logger
+from state_store import ChatState, StateStore
+
+
+class DictChatState:
+    """То же состояние чата без `__slots__` - для сравнения памяти."""
+    def __init__(self, chat_id, language_code=None, subscribed=False, step=None, data=None):
+        self.chat_id = chat_id
+        self.language_code = language_code
+        self.subscribed = subscribed
+        self.step = step
+        self.data = data
+        self.touched = 0.0
+
+
+def entry_memory(cls, chats):
+    """Байт на чат в кеше (объект + место в OrderedDict) для класса состояния `cls`."""
+    gc.collect()
+    tracemalloc.start()
+    entries = OrderedDict()
+    for chat_id in range(chats):
+        entries[chat_id] = cls(chat_id, "ru", chat_id % 3 == 0)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del entries
+    return current / chats
+
+
+def run(chats, lookups, cache_fraction, seed):
+    """
+    Прогоняет изменения и чтения состояния `chats` чатов.
+
+    Returns:
+        dict: Память на чат и скорость операций.
+    """
+    result = {
+        "slots_bytes": entry_memory(ChatState, chats),
+        "dict_bytes": entry_memory(DictChatState, chats),
+    }
+    rng = random.Random(seed)
+    directory = tempfile.mkdtemp(prefix="bench-state-")
+    try:
+        store = StateStore(os.path.join(directory, "chats.db"), max_entries=chats, ttl=3600).start()
+        started = time.perf_counter()
+        for chat_id in range(chats):
+            store.update(chat_id, language_code="en" if chat_id % 2 else "ru", subscribed=chat_id % 3 == 0)
+        result["update_per_sec"] = chats / (time.perf_counter() - started)
+        started = time.perf_counter()
+        store.flush()
+        result["final_flush_s"] = time.perf_counter() - started
+        result["flushes"] = store.stats["flushes"]
+
+        keys = [rng.randrange(chats) for _ in range(lookups)]
+        started = time.perf_counter()
+        for chat_id in keys:
+            store.get(chat_id)
+        result["hit_per_sec"] = lookups / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        subscribers = sum(1 for _ in store.subscribers())
+        result["subscribers"] = subscribers
+        result["subscribers_s"] = time.perf_counter() - started
+        store.close()
+
+        # Кеш меньше числа чатов: часть чтений идет в базу
+        store = StateStore(os.path.join(directory, "chats.db"),
+                           max_entries=max(1, int(chats * cache_fraction)), ttl=3600).start()
+        # Пользователи активны неравномерно: 80% обращений к 20% чатов
+        hot = max(1, chats // 5)
+        keys = [rng.randrange(hot) if rng.random() < 0.8 else rng.randrange(chats) for _ in range(lookups)]
+        started = time.perf_counter()
+        for chat_id in keys:
+            store.get(chat_id)
+        result["mixed_per_sec"] = lookups / (time.perf_counter() - started)
+        result["mixed_hit_rate"] = store.stats["hits"] / max(1, store.stats["hits"] + store.stats["misses"])
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк хранилища состояния чатов")
+    parser.add_argument("--chats", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=1_000_000)
+    parser.add_argument("--cache-fraction", type=float, default=0.1,
+                        help="Размер кеша во втором прогоне как доля от числа чатов")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    result = run(args.chats, args.lookups, args.cache_fraction, args.seed)
+    print(f"Память на чат в кеше: __slots__ {result['slots_bytes']:.0f} байт, "
+          f"без __slots__ {result['dict_bytes']:.0f} байт "
+          f"({args.chats * result['slots_bytes'] / 2**20:.0f} МБ против "
+          f"{args.chats * result['dict_bytes'] / 2**20:.0f} МБ на {args.chats} чатов)")
+    print(f"Изменения: {result['update_per_sec']:.0f} в секунду, записей в базу {result['flushes']}, "
+          f"последняя запись {result['final_flush_s']:.2f} с")
+    print(f"Чтение из кеша: {result['hit_per_sec']:.0f} в секунду")
+    print(f"Кеш {args.cache_fraction:.0%} чатов, 80% обращений к 20% чатов: "
+          f"{result['mixed_per_sec']:.0f} чтений в секунду, попаданий {result['mixed_hit_rate']:.1%}")
+    print(f"Подписчиков {result['subscribers']} прочитано за {result['subscribers_s']:.2f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#  Содержание benchmarks/bench_update_store.py
+#
+#  Бенчмарк накладных расходов UpdateStore: запись пачки обновлений из
+#  getUpdates и подтверждение каждого обновления после обработки, для разных
+#  режимов fsync (PRAGMA synchronous) и размеров пачки подтверждений.
+#  В конце проверяется восстановление: хранилище закрывается посреди
+#  обработки и открывается заново, как после перезапуска бота.
+#
+#      python -m benchmarks.bench_update_store --updates 20000
+
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fake_bot_api import make_text_update
+from update_store import UpdateStore
+
+
+def run_case(updates, synchronous, ack_batch, batch_size):
+    """Прогоняет все обновления через хранилище и возвращает время в секундах."""
+    path = os.path.join(tempfile.mkdtemp(prefix="update-store-bench-"), "updates.db")
+    store = UpdateStore(path, ack_batch=ack_batch, synchronous=synchronous)
+    started = time.perf_counter()
+    for start in range(0, len(updates), batch_size):
+        store.add(updates[start:start + batch_size])
+        for update_json in store.pending(batch_size):
+            store.ack(update_json["update_id"])
+        store.flush()
+    elapsed = time.perf_counter() - started
+    store.close()
+    return elapsed
+
+
+def check_recovery(updates, batch_size):
+    """Имитирует падение посреди обработки и проверяет, что ничего не потеряно и не повторено."""
+    path = os.path.join(tempfile.mkdtemp(prefix="update-store-bench-"), "updates.db")
+    store = UpdateStore(path)
+    store.add(updates[:batch_size])
+    processed = [u["update_id"] for u in store.pending(batch_size)[:batch_size // 2]]
+    for update_id in processed:
+        store.ack(update_id)
+    store.close()  # "падение" после обработки половины пачки
+
+    store = UpdateStore(path)
+    store.add(updates[:batch_size])  # Telegram повторно отдает ту же пачку
+    for update_json in store.pending(batch_size):
+        processed.append(update_json["update_id"])
+        store.ack(update_json["update_id"])
+    offset = store.next_offset()
+    store.close()
+    expected = [u["update_id"] for u in updates[:batch_size]]
+    return processed == expected and offset == expected[-1] + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Накладные расходы UpdateStore")
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=100, help="Размер пачки getUpdates")
+    args = parser.parse_args()
+
+    updates = [make_text_update(i + 1, 1000 + i % 500, f"BTC/USDT LONG {i}")
+               for i in range(args.updates)]
+    for synchronous in ("OFF", "NORMAL", "FULL"):
+        for ack_batch in (1, 10, args.batch_size):
+            elapsed = run_case(updates, synchronous, ack_batch, args.batch_size)
+            print(f"synchronous={synchronous:<6} ack_batch={ack_batch:<4}: "
+                  f"{args.updates / elapsed:9.0f} обн./с, {elapsed / args.updates * 1e6:7.1f} мкс/обн.")
+    print(f"Восстановление после падения: "
+          f"{'OK' if check_recovery(updates, args.batch_size) else 'ОШИБКА'}")
+
+
+if __name__ == "__main__":
+    main()
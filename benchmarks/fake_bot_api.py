@@ -0,0 +1,507 @@
+#  Содержание benchmarks/fake_bot_api.py
+
+import hashlib
+import json
+import random
+import ssl
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+
+FAKE_BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+# Описания ошибок, которые сервер может вернуть при внедрении сбоев
+FAULT_DESCRIPTIONS = {
+    429: "Too Many Requests: retry after {retry_after}",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+# Размер файла, о котором сервер не знает (см. `FakeBotApi.add_file`)
+DEFAULT_FILE_SIZE = 64 * 1024
+# Методы отправки файлов и поле с файлом в них
+MEDIA_METHODS = {
+    "sendPhoto": "photo",
+    "sendDocument": "document",
+    "sendAudio": "audio",
+    "sendVideo": "video",
+    "sendVoice": "voice",
+    "sendAnimation": "animation",
+}
+
+
+class FakeApiError(Exception):
+    """Ошибка, которую фейковый сервер вернет клиенту как ответ Bot API с ok=false."""
+    def __init__(self, error_code, description, parameters=None):
+        super().__init__(description)
+        self.error_code = error_code
+        self.description = description
+        self.parameters = parameters
+
+
+def make_text_update(update_id, chat_id, text="hello"):
+    """
+    Создает JSON обновления с текстовым сообщением, как его отдает Bot API.
+
+    Args:
+        update_id (int): Идентификатор обновления.
+        chat_id (int): Идентификатор чата (и пользователя).
+        text (str): Текст сообщения.
+
+    Returns:
+        dict: Обновление в формате Bot API.
+    """
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "User"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+        },
+    }
+
+
+def make_callback_update(update_id, chat_id, data, message_id=1):
+    """
+    Создает JSON обновления с нажатием инлайн-кнопки под сообщением бота.
+
+    Идентификатор нажатия равен `str(update_id)`.
+
+    Args:
+        update_id (int): Идентификатор обновления.
+        chat_id (int): Идентификатор чата (и пользователя).
+        data (str): Значение `callback_data` кнопки.
+        message_id (int): Сообщение бота с клавиатурой.
+
+    Returns:
+        dict: Обновление в формате Bot API.
+    """
+    user = {"id": chat_id, "is_bot": False, "first_name": "User"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private", "first_name": "User"},
+                "from": FAKE_BOT_USER,
+                "text": "signal",
+            },
+        },
+    }
+
+
+def file_content(file_id, size, chunk_size=64 * 1024):
+    """
+    Содержимое файла `file_id`, которое отдает сервер, частями.
+
+    Содержимое детерминировано: одинаково для одного `file_id` и различается
+    для разных, поэтому по хешу скачанного файла можно проверить загрузку.
+
+    Yields:
+        bytes: Очередная часть файла.
+    """
+    block = hashlib.sha256(file_id.encode("utf-8")).digest() * (chunk_size // 32 + 1)
+    while size > 0:
+        chunk = block[:min(size, chunk_size)]
+        size -= len(chunk)
+        yield chunk
+
+
+def _parse_multipart(content_type, body):
+    """
+    Разбирает тело multipart/form-data.
+
+    Returns:
+        tuple: (параметры, загруженные файлы): текстовые поля и словарь
+        имя поля -> размер файла в байтах.
+    """
+    message = BytesParser(policy=HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    params, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        payload = part.get_payload(decode=True) or b""
+        if part.get_filename() is not None:
+            files[name] = len(payload)
+        else:
+            params[name] = payload.decode("utf-8")
+    return params, files
+
+
+class _ApiHTTPServer(ThreadingHTTPServer):
+    """HTTP(S)-сервер, считающий принятые соединения (при TLS - число рукопожатий)."""
+    daemon_threads = True
+
+    def __init__(self, address, handler, ssl_context=None):
+        super().__init__(address, handler)
+        self.ssl_context = ssl_context
+        self.connections = 0
+
+    def get_request(self):
+        sock, address = super().get_request()
+        self.connections += 1
+        if self.ssl_context is not None:
+            # Рукопожатие выполняется в потоке обработчика, а не в потоке accept
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, address
+
+
+class FakeBotApi:
+    """
+    Локальный сервер, имитирующий Telegram Bot API для бенчмарков.
+
+    Отдает заранее загруженные обновления через getUpdates (с поддержкой
+    offset и long polling), принимает sendMessage/answerCallbackQuery с
+    искусственной задержкой и запоминает время получения каждого вызова.
+    Может отвечать ошибками 429 и 5xx на часть вызовов (`inject_faults`).
+    Отдает файлы через getFile и `/file/bot<token>/<file_path>` и принимает
+    загрузку файлов в sendPhoto, sendDocument и т.д. (multipart/form-data).
+
+    Атрибуты:
+        latency (float): Задержка ответа на методы отправки, в секундах.
+        served_at (dict): Время отдачи каждого обновления через getUpdates (update_id -> время).
+        sent (list): Список пар (chat_id, время) для всех принятых sendMessage
+            и методов отправки файлов.
+        answered (dict): Время получения answerCallbackQuery (callback_query_id -> время).
+        method_latency (dict): Задержка отдельных методов вместо `latency` (метод -> секунды).
+        blocked_chats (set): Чаты, для которых sendMessage возвращает 403 (бот заблокирован).
+        faults (dict): Количество внедренных ошибок по кодам ответа (см. `inject_faults`).
+        first_called (dict): Время (`time.perf_counter`) первого вызова каждого метода.
+        files (dict): Размеры файлов, известных серверу (file_id -> байты).
+        downloads (int): Количество скачиваний файлов.
+        uploads (int): Количество файлов, загруженных в методы отправки.
+        uploaded_bytes (int): Объем загруженных файлов, в байтах.
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, ssl_context=None):
+        """
+        Инициализирует FakeBotApi.
+
+        Args:
+            host (str): Адрес для прослушивания.
+            port (int): Порт (0 - выбрать свободный).
+            latency (float): Задержка ответа на методы отправки, в секундах.
+            ssl_context (ssl.SSLContext): Контекст TLS, если сервер должен работать по HTTPS.
+        """
+        self.latency = latency
+        self.served_at = {}
+        self.sent = []
+        self.answered = {}
+        self.method_latency = {}
+        self.calls = {}
+        self.first_called = {}
+        self.blocked_chats = set()
+        self.faults = {}
+        self.files = {}
+        self.downloads = 0
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self._fault_config = None
+        self._random = random.Random()
+        self._updates = []
+        self._cond = threading.Condition()
+        self._server = _ApiHTTPServer((host, port), self._make_handler(), ssl_context)
+        self._thread = None
+
+    @property
+    def api_url(self):
+        """Шаблон адреса для `apihelper.API_URL` и `asyncio_helper.API_URL`."""
+        host, port = self._server.server_address[:2]
+        scheme = "https" if self._server.ssl_context is not None else "http"
+        return f"{scheme}://{host}:{port}/bot{{0}}/{{1}}"
+
+    @property
+    def file_url(self):
+        """Шаблон адреса для `apihelper.FILE_URL`."""
+        host, port = self._server.server_address[:2]
+        scheme = "https" if self._server.ssl_context is not None else "http"
+        return f"{scheme}://{host}:{port}/file/bot{{0}}/{{1}}"
+
+    @property
+    def connections(self):
+        """Количество принятых соединений (при TLS - число рукопожатий)."""
+        return self._server.connections
+
+    def add_updates(self, updates):
+        """Добавляет обновления в очередь getUpdates и будит ожидающие запросы."""
+        with self._cond:
+            self._updates.extend(updates)
+            self._cond.notify_all()
+
+    def add_file(self, file_id, size):
+        """Регистрирует файл `file_id` размером `size` байт для getFile и скачивания."""
+        with self._cond:
+            self.files[file_id] = size
+
+    def inject_faults(self, rate, codes=(429,), methods=("sendMessage", "answerCallbackQuery"),
+                      retry_after=1, seed=None):
+        """
+        Включает ответы с ошибками на случайной доле вызовов.
+
+        Args:
+            rate (float): Доля вызовов `methods`, на которые возвращается ошибка (0 - отключить).
+            codes (tuple): Коды ошибок, из которых выбирается случайный (429, 500, 502, 503).
+            methods (tuple): Методы Bot API, в которые внедряются ошибки.
+            retry_after (int): Значение `retry_after` в ответах 429, в секундах.
+            seed (int): Начальное значение генератора для воспроизводимых прогонов.
+        """
+        with self._cond:
+            self._fault_config = {"rate": rate, "codes": tuple(codes), "methods": frozenset(methods),
+                                  "retry_after": retry_after} if rate else None
+            self._random = random.Random(seed)
+
+    def _maybe_fail(self, method):
+        """Выбрасывает FakeApiError, если для вызова выпала внедренная ошибка."""
+        config = self._fault_config
+        if config is None or method not in config["methods"]:
+            return
+        with self._cond:
+            if self._random.random() >= config["rate"]:
+                return
+            code = self._random.choice(config["codes"])
+            self.faults[code] = self.faults.get(code, 0) + 1
+        description = FAULT_DESCRIPTIONS.get(code, "Error").format(retry_after=config["retry_after"])
+        parameters = {"retry_after": config["retry_after"]} if code == 429 else None
+        raise FakeApiError(code, description, parameters)
+
+    def wait_sent(self, count, timeout):
+        """
+        Ожидает, пока сервер примет `count` вызовов sendMessage.
+
+        Returns:
+            bool: True, если вызовы получены до истечения таймаута.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self.sent) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def wait_answered(self, count, timeout):
+        """
+        Ожидает, пока сервер примет `count` вызовов answerCallbackQuery.
+
+        Returns:
+            bool: True, если вызовы получены до истечения таймаута.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self.answered) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def start(self):
+        """Запускает сервер в фоновом потоке."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Останавливает сервер."""
+        with self._cond:
+            self._cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                batch = [u for u in self._updates if u["update_id"] >= offset][:limit]
+                remaining = deadline - time.monotonic()
+                if batch or remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            # Подтвержденные обновления больше не нужны
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            now = time.perf_counter()
+            for update in batch:
+                self.served_at.setdefault(update["update_id"], now)
+        return batch
+
+    def _send_message(self, params):
+        if self.latency:
+            time.sleep(self.latency)
+        chat_id = int(params["chat_id"])
+        if chat_id in self.blocked_chats:
+            raise FakeApiError(403, "Forbidden: bot was blocked by the user")
+        with self._cond:
+            self.sent.append((chat_id, time.perf_counter()))
+            message_id = len(self.sent)
+            self._cond.notify_all()
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": FAKE_BOT_USER,
+            "text": params.get("text", ""),
+        }
+
+    def _get_file(self, params):
+        file_id = params["file_id"]
+        with self._cond:
+            size = self.files.setdefault(file_id, DEFAULT_FILE_SIZE)
+        return {"file_id": file_id, "file_unique_id": file_id, "file_size": size,
+                "file_path": f"files/{file_id}"}
+
+    def _send_media(self, method, params, uploaded):
+        latency = self.method_latency.get(method, self.latency)
+        if latency:
+            time.sleep(latency)
+        field = MEDIA_METHODS[method]
+        chat_id = int(params["chat_id"])
+        if chat_id in self.blocked_chats:
+            raise FakeApiError(403, "Forbidden: bot was blocked by the user")
+        with self._cond:
+            if field in uploaded:
+                self.uploads += 1
+                self.uploaded_bytes += uploaded[field]
+                # Загруженный файл получает новый file_id и становится доступен для скачивания
+                file_id = f"uploaded-{self.uploads}"
+                self.files[file_id] = uploaded[field]
+            else:
+                file_id = params[field]
+            self.sent.append((chat_id, time.perf_counter()))
+            message_id = len(self.sent)
+            self._cond.notify_all()
+        attachment = {"file_id": file_id, "file_unique_id": file_id,
+                      "file_size": self.files.get(file_id, DEFAULT_FILE_SIZE)}
+        if field == "photo":
+            attachment = [dict(attachment, width=1280, height=720)]
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": FAKE_BOT_USER,
+            field: attachment,
+        }
+        if params.get("caption"):
+            message["caption"] = params["caption"]
+        return message
+
+    def dispatch(self, method, params, uploaded=None):
+        """
+        Выполняет метод Bot API и возвращает поле `result` ответа.
+
+        Args:
+            method (str): Имя метода Bot API.
+            params (dict): Параметры запроса.
+            uploaded (dict): Загруженные файлы: имя поля -> размер в байтах.
+
+        Returns:
+            object: Результат метода.
+        """
+        with self._cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self.first_called.setdefault(method, time.perf_counter())
+        self._maybe_fail(method)
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method == "sendMessage":
+            return self._send_message(params)
+        if method == "getMe":
+            if method in self.method_latency:
+                time.sleep(self.method_latency[method])
+            return FAKE_BOT_USER
+        if method == "getFile":
+            return self._get_file(params)
+        if method in MEDIA_METHODS:
+            return self._send_media(method, params, uploaded or {})
+        latency = self.method_latency.get(method, self.latency)
+        if latency:
+            time.sleep(latency)
+        if method == "answerCallbackQuery":
+            with self._cond:
+                self.answered[params.get("callback_query_id")] = time.perf_counter()
+                self._cond.notify_all()
+        return True
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Заголовки и тело пишутся отдельно: без TCP_NODELAY ответ ждет delayed ACK клиента
+            disable_nagle_algorithm = True
+
+            def _download(self, url):
+                file_id = url.path.rsplit("/", 1)[-1]
+                with api._cond:
+                    size = api.files.get(file_id)
+                    if size is not None:
+                        api.downloads += 1
+                if size is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(size))
+                self.end_headers()
+                for chunk in file_content(file_id, size):
+                    self.wfile.write(chunk)
+
+            def _handle(self):
+                url = urlparse(self.path)
+                if url.path.startswith("/file/"):
+                    return self._download(url)
+                method = url.path.rsplit("/", 1)[-1]
+                params = dict(parse_qsl(url.query))
+                uploaded = {}
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    body = self.rfile.read(length)
+                    content_type = self.headers.get("Content-Type", "")
+                    if content_type.startswith("multipart/form-data"):
+                        fields, uploaded = _parse_multipart(content_type, body)
+                        params.update(fields)
+                    elif content_type.startswith("application/json"):
+                        params.update(json.loads(body.decode("utf-8")))
+                    else:
+                        params.update(parse_qsl(body.decode("utf-8")))
+                try:
+                    status, body = 200, {"ok": True, "result": api.dispatch(method, params, uploaded)}
+                except FakeApiError as e:
+                    status = e.error_code
+                    body = {"ok": False, "error_code": e.error_code, "description": e.description}
+                    if e.parameters:
+                        body["parameters"] = e.parameters
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError, ssl.SSLError):
+                    # Клиент закрыл соединение (например, отменил long polling при остановке)
+                    pass
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,193 @@
+#  Содержание benchmarks/synthetic_updates.py
+#
+#  Генератор синтетических обновлений Bot API для всех типов, которые
+#  обрабатывает `bot.register_handlers`: команды, сообщения всех типов
+#  контента, редактирования, нажатия кнопок и служебные сообщения чата.
+#  Записывает обновления в JSONL для `benchmarks.webhook_load`:
+#
+#      python -m benchmarks.synthetic_updates --count 5000 > updates.jsonl
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from benchmarks.fake_bot_api import FAKE_BOT_USER
+from bot import MESSAGE_CONTENT_TYPES, SERVICE_CONTENT_TYPES
+from keyboards import encode_callback
+
+# Виды обновлений: типы контента, служебные сообщения и отдельные виды ниже
+UPDATE_KINDS = (
+    ["command", "edited_message", "callback_query"]
+    + list(MESSAGE_CONTENT_TYPES) + list(SERVICE_CONTENT_TYPES)
+)
+# Доля видов по умолчанию: в основном текст, команды и нажатия кнопок
+DEFAULT_MIX = {kind: 1 for kind in UPDATE_KINDS}
+DEFAULT_MIX.update({"text": 30, "command": 10, "callback_query": 10, "edited_message": 3, "photo": 3})
+
+COMMANDS = ("/start", "/help", "/unknown_command", "/start@fake_bot")
+CALLBACK_DATA = (
+    encode_callback("signal", "btc-2024-10-01", "more"),
+    encode_callback("signal", "btc-2024-10-01", "less"),
+    "some_action",
+    "another_action",
+)
+LANGUAGES = ("ru", "en", None)
+
+
+def _user(user_id, language_code=None):
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+    if language_code:
+        user["language_code"] = language_code
+    return user
+
+
+def _file(update_id, **fields):
+    return {"file_id": f"file-{update_id}", "file_unique_id": f"unique-{update_id}", **fields}
+
+
+def _content(kind, update_id):
+    """Поле сообщения с контентом вида `kind`."""
+    if kind == "text":
+        return {"text": f"сообщение {update_id}"}
+    if kind == "photo":
+        return {"photo": [_file(update_id, width=90, height=90, file_size=1200),
+                          _file(update_id + 1, width=1280, height=1280, file_size=98000)]}
+    if kind == "audio":
+        return {"audio": _file(update_id, duration=180, title="track")}
+    if kind == "document":
+        return {"document": _file(update_id, file_name="report.pdf", file_size=52000)}
+    if kind == "video":
+        return {"video": _file(update_id, width=1280, height=720, duration=30)}
+    if kind == "video_note":
+        return {"video_note": _file(update_id, length=240, duration=10)}
+    if kind == "voice":
+        return {"voice": _file(update_id, duration=5)}
+    if kind == "sticker":
+        return {"sticker": _file(update_id, type="regular", width=512, height=512,
+                                 is_animated=False, is_video=False)}
+    if kind == "animation":
+        return {"animation": _file(update_id, width=320, height=240, duration=3)}
+    raise ValueError(f"Неизвестный тип контента: {kind}")
+
+
+def _service(kind, update_id, chat_id):
+    """Поля служебного сообщения вида `kind`."""
+    if kind == "new_chat_members":
+        return {"new_chat_members": [_user(chat_id + i, LANGUAGES[i % len(LANGUAGES)]) for i in range(2)]}
+    if kind == "left_chat_member":
+        return {"left_chat_member": _user(chat_id)}
+    if kind == "new_chat_photo":
+        return {"new_chat_photo": [_file(update_id, width=640, height=640)]}
+    if kind == "migrate_to_chat_id":
+        return {"migrate_to_chat_id": -1_000_000_000_000 - update_id}
+    if kind == "migrate_from_chat_id":
+        return {"migrate_from_chat_id": -update_id}
+    if kind == "pinned_message":
+        return {"pinned_message": {"message_id": 1, "date": int(time.time()),
+                                   "chat": {"id": chat_id, "type": "private"},
+                                   "from": FAKE_BOT_USER, "text": "закрепленный сигнал"}}
+    # delete_chat_photo, group_chat_created, supergroup_chat_created, channel_chat_created
+    return {kind: True}
+
+
+def make_update(update_id, kind, chat_id, language_code=None):
+    """
+    Создает JSON обновления вида `kind`, как его отдает Bot API.
+
+    Личные сообщения приходят из чата `chat_id`, служебные - из группы `-chat_id`.
+    Идентификатор нажатия кнопки равен `str(update_id)`.
+
+    Args:
+        update_id (int): Идентификатор обновления.
+        kind (str): Вид обновления из `UPDATE_KINDS`.
+        chat_id (int): Идентификатор чата (и пользователя).
+        language_code (str | None): Язык пользователя.
+
+    Returns:
+        dict: Обновление в формате Bot API.
+    """
+    user = _user(chat_id, language_code)
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": user["first_name"]},
+        "from": user,
+    }
+    if kind == "callback_query":
+        message.update({"from": FAKE_BOT_USER, "text": "signal"})
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": str(chat_id), "message": message,
+            "data": CALLBACK_DATA[update_id % len(CALLBACK_DATA)]}}
+    if kind == "command":
+        message["text"] = COMMANDS[update_id % len(COMMANDS)]
+        return {"update_id": update_id, "message": message}
+    if kind == "edited_message":
+        message.update(_content("text", update_id), edit_date=int(time.time()))
+        return {"update_id": update_id, "edited_message": message}
+    if kind in SERVICE_CONTENT_TYPES:
+        message["chat"] = {"id": -chat_id, "type": "supergroup", "title": "Signals"}
+        message.update(_service(kind, update_id, chat_id))
+        return {"update_id": update_id, "message": message}
+    message.update(_content(kind, update_id))
+    return {"update_id": update_id, "message": message}
+
+
+def generate_updates(count, start_id=1, chat_base=10_000, mix=None, seed=0):
+    """
+    Создает `count` обновлений разных видов в случайном (воспроизводимом) порядке.
+
+    Каждое обновление приходит из своего чата `chat_base + update_id`, чтобы
+    ответы можно было сопоставить с обновлениями.
+
+    Args:
+        count (int): Количество обновлений.
+        start_id (int): Первый `update_id`.
+        chat_base (int): Смещение идентификаторов чатов.
+        mix (dict): Доли видов обновлений (вид -> вес). По умолчанию `DEFAULT_MIX`.
+        seed (int): Начальное значение генератора.
+
+    Returns:
+        list: Обновления в формате Bot API.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [make_update(update_id, kind, chat_base + update_id, rng.choice(LANGUAGES))
+            for update_id, kind in enumerate(kinds, start=start_id)]
+
+
+def expected_replies(update_json):
+    """
+    Сколько вызовов Bot API сделают обработчики `bot.py` в ответ на обновление.
+
+    Returns:
+        tuple: (количество sendMessage, количество answerCallbackQuery).
+    """
+    if "callback_query" in update_json:
+        return 0, 1
+    message = update_json.get("message") or update_json.get("edited_message")
+    if message is None:
+        return 0, 0
+    if "new_chat_members" in message:
+        return len(message["new_chat_members"]), 0
+    if "left_chat_member" in message:
+        return 1, 0
+    if any(key in message for key in SERVICE_CONTENT_TYPES):
+        return 0, 0
+    return 1, 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетических обновлений Bot API (JSONL)")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start-id", type=int, default=1)
+    args = parser.parse_args()
+    for update in generate_updates(args.count, start_id=args.start_id, seed=args.seed):
+        sys.stdout.write(json.dumps(update, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+#  Содержание benchmarks/webhook_load.py
+#
+#  Нагрузочный тест webhook-режима: воспроизводит записанные обновления
+#  (JSONL, по одному обновлению в строке) с заданной частотой запросов.
+#  По умолчанию поднимает webhook-сервер и фейковый Bot API в процессе,
+#  поэтому работает без доступа к Telegram:
+#
+#      python -m benchmarks.webhook_load --rps 500 --count 5000
+#      python -m benchmarks.webhook_load --updates-file recorded.jsonl --rps 200
+#      python -m benchmarks.webhook_load --target http://127.0.0.1:8443/ --secret s3cret
+
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+import telebot
+from telebot import apihelper
+
+from benchmarks.bench_runtime import FAKE_TOKEN, _percentile
+from benchmarks.fake_bot_api import FakeBotApi, make_text_update
+from logger import logger
+from webhook_server import SECRET_TOKEN_HEADER, WebhookServer
+
+
+def load_recorded_updates(path):
+    """Читает записанные обновления из JSONL-файла."""
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def replay(target, updates, rps, senders, secret=None):
+    """
+    Отправляет обновления на webhook с частотой `rps` запросов в секунду.
+
+    Args:
+        target (str): Адрес webhook, например http://127.0.0.1:8443/.
+        updates (list): Список обновлений для отправки.
+        rps (float): Целевая частота запросов.
+        senders (int): Количество параллельных отправителей.
+        secret (str): Секретный токен для заголовка `X-Telegram-Bot-Api-Secret-Token`.
+
+    Returns:
+        dict: Коды ответов, задержки подтверждения и фактическая частота.
+    """
+    url = urlparse(target)
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers[SECRET_TOKEN_HEADER] = secret
+    statuses = {}
+    ack_latencies = []
+    lock = threading.Lock()
+    counter = itertools.count()
+    started = time.perf_counter()
+
+    def sender():
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+        while True:
+            index = next(counter)
+            if index >= len(updates):
+                break
+            # Равномерное расписание: i-й запрос уходит в момент i / rps
+            delay = started + index / rps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            body = json.dumps(updates[index])
+            sent_at = time.perf_counter()
+            try:
+                connection.request("POST", url.path or "/", body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+                status = "error"
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                ack_latencies.append(time.perf_counter() - sent_at)
+        connection.close()
+
+    threads = [threading.Thread(target=sender) for _ in range(senders)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "statuses": statuses,
+        "achieved_rps": len(updates) / elapsed if elapsed else 0.0,
+        "ack_p50_ms": _percentile(ack_latencies, 50) * 1000,
+        "ack_p99_ms": _percentile(ack_latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook-режима")
+    parser.add_argument("--updates-file", help="JSONL с записанными обновлениями")
+    parser.add_argument("--count", type=int, default=2000,
+                        help="Количество синтетических обновлений, если файл не указан")
+    parser.add_argument("--rps", type=float, default=200)
+    parser.add_argument("--senders", type=int, default=8)
+    parser.add_argument("--target", help="Адрес внешнего webhook-сервера")
+    parser.add_argument("--secret", default="bench-secret")
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.01,
+                        help="Задержка фейкового Bot API на sendMessage, с")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    if args.updates_file:
+        updates = load_recorded_updates(args.updates_file)
+    else:
+        updates = [make_text_update(i, 10_000 + i) for i in range(1, args.count + 1)]
+
+    api = server = None
+    target = args.target
+    if not target:
+        api = FakeBotApi(latency=args.latency).start()
+        apihelper.API_URL = api.api_url
+        signal_bot = telebot.TeleBot(FAKE_TOKEN, threaded=False)
+        from bot import register_handlers
+        register_handlers(signal_bot)
+        server = WebhookServer(signal_bot, port=0, secret_token=args.secret,
+                               queue_size=args.queue_size, workers=args.workers).start()
+        host, port = server.address
+        target = f"http://{host}:{port}/"
+
+    result = replay(target, updates, args.rps, args.senders, secret=args.secret)
+    print(f"Отправлено {len(updates)} обновлений, {result['achieved_rps']:.1f} req/s, "
+          f"подтверждение p50 {result['ack_p50_ms']:.1f} мс, p99 {result['ack_p99_ms']:.1f} мс")
+    print(f"Коды ответов: {result['statuses']}")
+
+    if server is not None:
+        drain_started = time.perf_counter()
+        server.stop()
+        print(f"Дообработка очереди: {time.perf_counter() - drain_started:.2f} с, "
+              f"статистика сервера: {server.stats}, ответов Bot API: {len(api.sent)}")
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
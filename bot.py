@@ -2,9 +2,306 @@
 
 from telebot import types, apihelper
 from logger import logger, log_function_call
+from metrics import observe_handler
+from send_queue import PRIORITY_COMMAND, PRIORITY_REPLY
+from commands import CommandRouter, PARSED_COMMAND_ATTR
+from keyboards import CallbackRouter, KeyboardCache, encode_callback
+from templates import TemplateCatalog
 
+# Типы контента, на которые бот отвечает (обычные и отредактированные сообщения)
+MESSAGE_CONTENT_TYPES = [
+    'text', 'photo', 'audio', 'document', 'video',
+    'video_note', 'voice', 'sticker', 'animation'
+]
 
-def register_handlers(signal_bot):
+# Служебные сообщения чата
+SERVICE_CONTENT_TYPES = [
+    "new_chat_members", "left_chat_member", "new_chat_photo", "delete_chat_photo",
+    "group_chat_created", "supergroup_chat_created", "channel_chat_created",
+    "migrate_to_chat_id", "migrate_from_chat_id", "pinned_message"
+]
+
+
+# Каталог текстов ответов (locales/<язык>.json), загружается один раз при запуске
+catalog = TemplateCatalog()
+
+# Реестр команд бота. Описания команд переводятся по каталогу (commands.descriptions.<команда>)
+commands = CommandRouter()
+commands.translate = lambda name, description, language_code: catalog.get(
+    f"commands.descriptions.{name}", language_code, description)
+
+# Готовые инлайн-клавиатуры и действия инлайн-кнопок
+keyboards = KeyboardCache()
+callbacks = CallbackRouter()
+
+# Состояние чатов (state_store.StateStore): язык, подписка на сигналы, шаг диалога.
+# Задается в register_handlers (use_state_store); None, если хранилище отключено
+chat_states = None
+
+
+def use_state_store(state_store):
+    """Задает хранилище состояния чатов для команд и `remember_chat`."""
+    global chat_states
+    chat_states = state_store
+
+
+def _language(message):
+    """Код языка отправителя сообщения или нажатия на кнопку."""
+    return message.from_user.language_code if message.from_user else None
+
+
+@commands.command("start", "Начать работу")
+def start_command(message, args):
+    """Ответ на /start."""
+    return catalog.render("commands.start", _language(message))
+
+
+@commands.command("help", "Помощь")
+def help_command(message, args):
+    """Ответ на /help со списком опубликованных команд."""
+    language_code = _language(message)
+    # Список команд строится только при промахе кеша шаблона
+    return catalog.cached("commands.help", language_code, commands=lambda: commands.describe(language_code))
+
+
+@commands.command("subscribe", "Подписаться на сигналы")
+def subscribe_command(message, args):
+    """Подписывает чат на рассылку сигналов."""
+    if chat_states is None:
+        return catalog.render("commands.subscriptions_unavailable", _language(message))
+    chat_states.update(message.chat.id, subscribed=True)
+    return catalog.render("commands.subscribe", _language(message))
+
+
+@commands.command("unsubscribe", "Отписаться от сигналов")
+def unsubscribe_command(message, args):
+    """Отписывает чат от рассылки сигналов."""
+    if chat_states is None:
+        return catalog.render("commands.subscriptions_unavailable", _language(message))
+    chat_states.update(message.chat.id, subscribed=False)
+    return catalog.render("commands.unsubscribe", _language(message))
+
+
+@commands.unknown
+def unknown_command(message, args):
+    """Ответ на неизвестную команду."""
+    return catalog.render("commands.unknown", _language(message))
+
+
+def menu_keyboard(language_code=None):
+    """Клавиатура меню под ответом на /start."""
+    locale = catalog.locale_for(language_code)
+    return keyboards.get(("menu", locale, catalog.generation), lambda: [[
+        (catalog.get("buttons.some_action", locale), "some_action"),
+        (catalog.get("buttons.another_action", locale), "another_action"),
+    ]])
+
+
+def signal_keyboard(signal_id, language_code=None, expanded=False):
+    """
+    Клавиатура под сообщением сигнала.
+
+    Передается в рассылку: `broadcaster.broadcast(signal_id, text, subscribers,
+    reply_markup=signal_keyboard(signal_id))`.
+
+    Args:
+        signal_id (str): Идентификатор сигнала.
+        language_code (str | None): Код языка пользователя.
+        expanded (bool): Показаны ли подробности сигнала.
+
+    Returns:
+        keyboards.FrozenInlineKeyboard: Клавиатура из кеша.
+    """
+    locale = catalog.locale_for(language_code)
+    view = "less" if expanded else "more"
+    return keyboards.get(("signal", signal_id, view, locale, catalog.generation), lambda: [[
+        (catalog.get(f"buttons.signal_{view}", locale), encode_callback("signal", signal_id, view)),
+    ]])
+
+
+@callbacks.action("signal")
+def signal_answer(call, args):
+    """Мгновенный ответ на кнопку сигнала."""
+    return catalog.render("callback.signal", _language(call))
+
+
+@callbacks.follow_up("signal")
+def signal_follow_up(signal_bot, call, args):
+    """
+    Разворачивает или сворачивает подробности сигнала, заменяя клавиатуру сообщения.
+
+    Возвращает результат вызова бота, чтобы в асинхронном режиме его можно было дождаться.
+    """
+    if len(args) != 2:
+        return None
+    signal_id, view = args
+    keyboard = signal_keyboard(signal_id, _language(call), expanded=view == "more")
+    if call.message is None:
+        return signal_bot.edit_message_reply_markup(
+            inline_message_id=call.inline_message_id, reply_markup=keyboard)
+    return signal_bot.edit_message_reply_markup(
+        call.message.chat.id, call.message.message_id, reply_markup=keyboard)
+
+
+@callbacks.unknown
+def unknown_callback(call, args):
+    """Ответ на кнопки без отдельного обработчика: текст `callback.<действие>` из каталога."""
+    action, _ = callbacks.parse(call)
+    return catalog.render(f"callback.{action}", _language(call), default_key="callback.unknown")
+
+
+def remember_chat(chat_id, user):
+    """
+    Запоминает язык пользователя чата.
+
+    На пути обработки это поиск в кеше; в базу попадает только изменение языка.
+
+    Args:
+        chat_id (int): Идентификатор чата.
+        user (telebot.types.User | None): Отправитель сообщения или нажатия.
+    """
+    if chat_states is None or user is None or not user.language_code:
+        return
+    if chat_states.get(chat_id).language_code != user.language_code:
+        chat_states.update(chat_id, language_code=user.language_code)
+
+
+def process_attachment(message, path):
+    """
+    Обрабатывает скачанное вложение (график или документ к сигналу).
+
+    Вызывается конвейером `media.MediaPipeline` в его потоке после того, как
+    файл сохранен на диск. Один и тот же файл скачивается один раз, а этот
+    обработчик вызывается для каждого сообщения с ним.
+
+    Args:
+        message (telebot.types.Message): Сообщение с вложением.
+        path (str): Путь к скачанному файлу.
+    """
+    logger.info("Вложение %s от пользователя %s сохранено: %s",
+                message.content_type, message.from_user.id if message.from_user else None, path)
+
+
+def is_command(message):
+    """Фильтр для сообщений-команд этому боту (`/cmd`, `/cmd@botname аргументы`)."""
+    return commands.match(message)
+
+
+def command_reply(message):
+    """
+    Формирует ответ на команду пользователя.
+
+    Args:
+        message (telebot.types.Message): Объект сообщения с командой.
+
+    Returns:
+        str: Текст ответа.
+    """
+    logger.info("Пользователь %s отправил команду %s", message.from_user.id, message.text)
+    return commands.dispatch(message)
+
+
+def command_keyboard(message):
+    """
+    Возвращает клавиатуру к ответу на команду.
+
+    Args:
+        message (telebot.types.Message): Сообщение, прошедшее фильтр `is_command`.
+
+    Returns:
+        telebot.types.InlineKeyboardMarkup | None: Меню для /start, для остальных команд None.
+    """
+    parsed = getattr(message, PARSED_COMMAND_ATTR, None)
+    if parsed is not None and parsed[0] == "start":
+        return menu_keyboard(_language(message))
+    return None
+
+
+def content_reply(message):
+    """
+    Формирует ответ на входящее сообщение в зависимости от типа контента.
+
+    Args:
+        message (telebot.types.Message): Объект сообщения от пользователя.
+
+    Returns:
+        str: Текст ответа.
+    """
+    content_type = message.content_type
+    logger.info("Пользователь %s отправил сообщение типа %s",
+                message.from_user.id, content_type)
+
+    return catalog.render(f"content.{content_type}", _language(message),
+                          default_key="content.unknown", text=message.text)
+
+
+def edited_content_reply(message):
+    """
+    Формирует ответ на редактированное сообщение в зависимости от типа контента.
+
+    Args:
+        message (telebot.types.Message): Объект редактированного сообщения от пользователя.
+
+    Returns:
+        str: Текст ответа.
+    """
+    content_type = message.content_type
+    logger.info("Пользователь %s отредактировал сообщение типа %s",
+                message.from_user.id, content_type)
+
+    return catalog.render(f"edited.{content_type}", _language(message),
+                          default_key="edited.unknown", text=message.text)
+
+
+def callback_reply(call):
+    """
+    Формирует ответ на нажатие инлайн-кнопки.
+
+    Args:
+        call (telebot.types.CallbackQuery): Объект обратного вызова от нажатия кнопки.
+
+    Returns:
+        str: Текст ответа.
+    """
+    logger.info("Пользователь %s нажал инлайн-кнопку с данными: %s",
+                call.from_user.id, call.data)
+
+    return callbacks.answer(call)
+
+
+def service_replies(message):
+    """
+    Формирует ответы на служебное сообщение чата.
+
+    Args:
+        message (telebot.types.Message): Объект служебного сообщения от чата.
+
+    Returns:
+        list: Список пар (id пользователя, текст ответа). Пустой, если отвечать не нужно.
+    """
+    content_type = message.content_type
+
+    if content_type == "new_chat_members":
+        replies = []
+        for member in message.new_chat_members:
+            logger.info("Пользователь %s присоединился к чату", member.id)
+            replies.append((member.id, catalog.render(
+                "service.new_chat_member", member.language_code, first_name=member.first_name)))
+        return replies
+    elif content_type == "left_chat_member":
+        logger.info("Пользователь %s покинул чат", message.left_chat_member.id)
+        return [(message.left_chat_member.id, catalog.render(
+            "service.left_chat_member", _language(message),
+            first_name=message.left_chat_member.first_name))]
+    elif content_type == "pinned_message":
+        pinned_text = message.pinned_message.text if message.pinned_message else "Нет текста."
+        logger.info("Сообщение закреплено в чате: %s", pinned_text)
+    else:
+        logger.info("Служебное сообщение: %s", content_type)
+    return []
+
+
+def register_handlers(signal_bot, dispatcher=None, responder=None, state_store=None, media=None):
     """
     Регистрирует все необходимые обработчики для бота.
 
@@ -13,10 +310,33 @@ def register_handlers(signal_bot):
 
     Args:
         signal_bot (telebot.TeleBot): Экземпляр бота, для которого регистрируются обработчики.
+        dispatcher (send_queue.OutboundDispatcher): Очередь исходящих сообщений.
+            Если не указана, ответы отправляются напрямую через `send_message`.
+        responder (keyboards.CallbackResponder): Ответ на нажатия кнопок с фоновой
+            последующей работой. Если не указан, работа выполняется в потоке обработчика.
+        state_store (state_store.StateStore): Хранилище состояния чатов. Без него
+            подписка на сигналы недоступна.
+        media (media.MediaPipeline): Скачивание вложений. Если не указан,
+            вложения не скачиваются.
     """
+    use_state_store(state_store)
+
+    # При горячей перезагрузке реестр команд создается заново: берем имя
+    # бота, если оно уже получено через get_me
+    bot_user = getattr(signal_bot, '_user', None)
+    if bot_user is not None:
+        commands.bot_username = bot_user.username
+
+    def reply(chat_id, text, priority=PRIORITY_REPLY, **kwargs):
+        """Отправляет ответ через очередь исходящих сообщений или напрямую."""
+        if dispatcher is not None:
+            dispatcher.send(chat_id, text, priority=priority, **kwargs)
+        else:
+            signal_bot.send_message(chat_id, text, **kwargs)
 
+    @signal_bot.message_handler(func=is_command)
     @log_function_call
-    @signal_bot.message_handler(func=lambda message: message.text[1:].lower() and message.text.startswith('/'))
+    @observe_handler
     def command_message(message):
         """
         Обрабатывает команды, начинающиеся с '/' (например, /start, /help).
@@ -26,68 +346,37 @@ def register_handlers(signal_bot):
         Args:
             message (telebot.types.Message): Объект сообщения от пользователя.
         """
-        user_id = message.from_user.id
-        command = message.text[1:].lower()
-        logger.info(f"Пользователь {user_id} отправил команду /{command}")
-
-        if command == "start":
-            signal_bot.send_message(
-                message.chat.id, "Привет! Я бот, который помогает с торговыми сигналами."
-            )
-        elif command == "help":
-            signal_bot.send_message(
-                message.chat.id,
-                "Список доступных команд:\n/start - Начать работу\n/help - Помощь"
-            )
-        else:
-            signal_bot.send_message(
-                message.chat.id, "Команда не распознана. Введите /help для списка команд."
-            )
+        remember_chat(message.chat.id, message.from_user)
+        reply(message.chat.id, command_reply(message), PRIORITY_COMMAND,
+              reply_markup=command_keyboard(message))
 
+    @signal_bot.message_handler(content_types=MESSAGE_CONTENT_TYPES)
     @log_function_call
-    @signal_bot.message_handler(content_types=[
-        'text', 'photo', 'audio', 'document', 'video',
-        'video_note', 'voice', 'sticker', 'animation'
-    ])
+    @observe_handler
     def handle_all_messages(message):
         """
         Обрабатывает все входящие сообщения различных типов.
 
         В зависимости от типа контента сообщения, отправляет соответствующий ответ.
+        Вложения ставятся в очередь на скачивание и обрабатываются в фоне
+        (`process_attachment`), не задерживая ответ.
 
         Args:
             message (telebot.types.Message): Объект сообщения от пользователя.
         """
-        user_id = message.from_user.id
-        content_type = message.content_type
-        logger.info(
-            f"Пользователь {user_id} отправил сообщение типа {content_type}")
-
-        response_messages = {
-            'text': f"Вы отправили текстовое сообщение: {message.text}",
-            'photo': "Вы отправили фото!",
-            'audio': "Вы отправили аудио!",
-            'document': "Вы отправили документ!",
-            'video': "Вы отправили видео!",
-            'video_note': "Вы отправили видеосообщение!",
-            'voice': "Вы отправили голосовое сообщение!",
-            'sticker': "Вы отправили стикер!",
-            'animation': "Вы отправили анимацию!"
-        }
-
-        response = response_messages.get(
-            content_type, "Неизвестный тип сообщения.")
+        remember_chat(message.chat.id, message.from_user)
+        response = content_reply(message)
         try:
-            signal_bot.send_message(message.chat.id, response)
+            reply(message.chat.id, response)
         except apihelper.ApiException as e:
-            logger.error(
-                f"Ошибка при отправке сообщения пользователю {user_id}: {e}")
+            logger.error("Ошибка при отправке сообщения пользователю %s: %s",
+                         message.from_user.id, e)
+        if media is not None:
+            media.submit(message, process_attachment)
 
+    @signal_bot.edited_message_handler(content_types=MESSAGE_CONTENT_TYPES)
     @log_function_call
-    @signal_bot.edited_message_handler(content_types=[
-        'text', 'photo', 'audio', 'document', 'video',
-        'video_note', 'voice', 'sticker', 'animation'
-    ])
+    @observe_handler
     def handle_edited_messages(message):
         """
         Обрабатывает редактированные сообщения различных типов.
@@ -97,64 +386,42 @@ def register_handlers(signal_bot):
         Args:
             message (telebot.types.Message): Объект редактированного сообщения от пользователя.
         """
-        user_id = message.from_user.id
-        content_type = message.content_type
-        logger.info(
-            f"Пользователь {user_id} отредактировал сообщение типа {content_type}")
-
-        response_messages = {
-            'text': f"Вы отредактировали текстовое сообщение: {message.text}",
-            'photo': "Вы отредактировали фото!",
-            'audio': "Вы отредактировали аудио!",
-            'document': "Вы отредактировали документ!",
-            'video': "Вы отредактировали видео!",
-            'video_note': "Вы отредактировали видеосообщение!",
-            'voice': "Вы отредактировали голосовое сообщение!",
-            'sticker': "Вы отредактировали стикер!",
-            'animation': "Вы отредактировали анимацию!"
-        }
-
-        response = response_messages.get(
-            content_type, "Вы отредактировали сообщение неизвестного типа.")
+        response = edited_content_reply(message)
         try:
-            signal_bot.send_message(message.chat.id, response)
+            reply(message.chat.id, response)
         except apihelper.ApiException as e:
-            logger.error(
-                f"Ошибка при отправке сообщения пользователю {user_id}: {e}")
+            logger.error("Ошибка при отправке сообщения пользователю %s: %s",
+                         message.from_user.id, e)
 
-    @log_function_call
     @signal_bot.callback_query_handler(func=lambda call: True)
+    @log_function_call
+    @observe_handler
     def handle_inline_buttons(call):
         """
         Обрабатывает нажатия на инлайн-кнопки.
 
-        В зависимости от данных, отправленных с кнопкой, выполняет соответствующее действие.
+        Сначала отвечает на нажатие, затем выполняет последующую работу
+        действия (с `responder` - в фоновом потоке).
 
         Args:
             call (telebot.types.CallbackQuery): Объект вызова обратного вызова от нажатия кнопки.
         """
-        user_id = call.from_user.id
-        logger.info(
-            f"Пользователь {user_id} нажал инлайн-кнопку с данными: {call.data}")
-
-        responses = {
-            "some_action": "Вы выбрали действие!",
-            "another_action": "Другое действие выполнено!"
-        }
-
-        response = responses.get(call.data, "Неизвестное действие.")
+        response = callback_reply(call)
+        follow_up = callbacks.follow_up_for(signal_bot, call)
+        if responder is not None:
+            responder.respond(call, response, follow_up)
+            return
         try:
             signal_bot.answer_callback_query(call.id, response)
         except apihelper.ApiException as e:
-            logger.error(
-                f"Ошибка при ответе на обратный вызов пользователю {user_id}: {e}")
+            logger.error("Ошибка при ответе на обратный вызов пользователю %s: %s",
+                         call.from_user.id, e)
+        if follow_up is not None:
+            follow_up()
 
+    @signal_bot.message_handler(content_types=SERVICE_CONTENT_TYPES)
     @log_function_call
-    @signal_bot.message_handler(content_types=[
-        "new_chat_members", "left_chat_member", "new_chat_photo", "delete_chat_photo",
-        "group_chat_created", "supergroup_chat_created", "channel_chat_created",
-        "migrate_to_chat_id", "migrate_from_chat_id", "pinned_message"
-    ])
+    @observe_handler
     def handle_service_messages(message):
         """
         Обрабатывает служебные сообщения чата.
@@ -165,31 +432,9 @@ def register_handlers(signal_bot):
         Args:
             message (telebot.types.Message): Объект служебного сообщения от чата.
         """
-        user_id = message.from_user.id if message.from_user else None
-        content_type = message.content_type
-
-        if content_type == "new_chat_members":
-            for member in message.new_chat_members:
-                logger.info(f"Пользователь {member.id} присоединился к чату")
-                try:
-                    signal_bot.send_message(
-                        message.chat.id, f"Привет, {member.first_name}!"
-                    )
-                except apihelper.ApiException as e:
-                    logger.error(
-                        f"Ошибка при приветствии пользователя {member.id}: {e}")
-        elif content_type == "left_chat_member":
-            logger.info(
-                f"Пользователь {message.left_chat_member.id} покинул чат")
+        for user_id, response in service_replies(message):
             try:
-                signal_bot.send_message(
-                    message.chat.id, f"{message.left_chat_member.first_name} покинул нас."
-                )
+                reply(message.chat.id, response)
             except apihelper.ApiException as e:
-                logger.error(
-                    f"Ошибка при уведомлении о покидании пользователя {message.left_chat_member.id}: {e}")
-        elif content_type == "pinned_message":
-            pinned_text = message.pinned_message.text if message.pinned_message else "Нет текста."
-            logger.info(f"Сообщение закреплено в чате: {pinned_text}")
-        else:
-            logger.info(f"Служебное сообщение: {content_type}")
+                logger.error("Ошибка при отправке служебного ответа пользователю %s: %s",
+                             user_id, e)
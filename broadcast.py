@@ -0,0 +1,294 @@
+#  Содержание broadcast.py
+
+import os
+import threading
+import time
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+from telebot import apihelper
+from logger import logger
+from http_session import ensure_session_layer
+from media import FileIdCache
+from send_queue import PRIORITY_BULK, TokenBucket, get_retry_after
+
+CHECKPOINT_FLUSH_EVERY = 100  # как часто сбрасывать чекпоинт на диск (fsync), в записях
+# Статусы, с которыми получатель считается завершенным: "ok" - доставлено,
+# "failed" - постоянная ошибка (400, 403). С "error" (сеть, 5xx, исчерпаны
+# попытки) получатель повторяется при продолжении рассылки.
+DONE_STATUSES = ("ok", "failed")
+STOP_CHECK_INTERVAL = 0.1  # как часто проверять остановку при ожидании очереди, в секундах
+
+# Ошибки Bot API, при которых повторять отправку получателю бессмысленно
+PERMANENT_ERROR_CODES = (400, 403)
+
+
+class BroadcastCheckpoint:
+    """
+    Чекпоинт рассылки: журнал получателей, которым отправка уже завершена.
+
+    Хранится в файле `<checkpoint_dir>/<broadcast_id>.log` по одной строке
+    на получателя (`chat_id статус`). Запись только дописывается в конец,
+    поэтому прерванная рассылка продолжается с места остановки. Завершенными
+    считаются получатели со статусом из `DONE_STATUSES`, остальным отправка
+    повторяется. Журнал синхронизируется с диском каждые `CHECKPOINT_FLUSH_EVERY`
+    записей, так что после аварии повторно могут получить сигнал не более
+    стольких получателей.
+    """
+    def __init__(self, checkpoint_dir, broadcast_id):
+        """
+        Инициализирует BroadcastCheckpoint и загружает уже завершенных получателей.
+
+        Args:
+            checkpoint_dir (str): Директория для файлов чекпоинтов.
+            broadcast_id (str): Идентификатор рассылки.
+        """
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.path = os.path.join(checkpoint_dir, f"{broadcast_id}.log")
+        self.done = set()
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    chat_id, _, status = line.strip().partition(' ')
+                    if chat_id.lstrip('-').isdigit() and status in DONE_STATUSES:
+                        self.done.add(int(chat_id))
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._unsynced = 0
+
+    def record(self, chat_id, status):
+        """Записывает результат отправки получателю."""
+        with self._lock:
+            self._file.write(f"{chat_id} {status}\n")
+            self._unsynced += 1
+            if self._unsynced >= CHECKPOINT_FLUSH_EVERY:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        """Сбрасывает журнал на диск и закрывает файл."""
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+
+class SignalBroadcaster:
+    """
+    Массовая рассылка торгового сигнала всем подписчикам.
+
+    Сообщения рассылки ставятся в очередь исходящих сообщений (`dispatcher`)
+    с приоритетом `PRIORITY_BULK`: они делят с ответами пользователям общий
+    лимит Telegram и лимиты чатов и отправляются после ответов. Без очереди
+    отправка идет из пула рабочих потоков напрямую, а частоту держит
+    собственный token bucket рассылки (~30 сообщений в секунду), ответ 429
+    приостанавливает всю рассылку на `retry_after`. Прогресс сохраняется в
+    `BroadcastCheckpoint`.
+    Вложение (график к сигналу) загружается в Telegram один раз, остальным
+    получателям оно отправляется по `file_id` (см. `media.FileIdCache`).
+
+    Это библиотечный API: `main.py` рассылки не запускает. Рассылку вызывает
+    код, публикующий сигналы, с получателями из `StateStore.subscribers()`.
+
+    Атрибуты:
+        signal_bot (telebot.TeleBot): Экземпляр бота для отправки.
+        workers (int): Количество рабочих потоков.
+        checkpoint_dir (str): Директория для чекпоинтов рассылок.
+        max_attempts (int): Максимальное количество попыток для одного получателя.
+        file_ids (media.FileIdCache): Кеш `file_id` загруженных вложений.
+        dispatcher (send_queue.OutboundDispatcher): Очередь исходящих сообщений.
+    """
+    def __init__(self, signal_bot, workers=8, global_rate=30.0,
+                 checkpoint_dir="broadcasts", max_attempts=3, file_ids=None, dispatcher=None):
+        """
+        Инициализирует SignalBroadcaster.
+
+        Args:
+            signal_bot (telebot.TeleBot): Экземпляр бота для отправки.
+            workers (int): Количество рабочих потоков.
+            global_rate (float): Лимит сообщений в секунду для всей рассылки без очереди.
+            checkpoint_dir (str): Директория для чекпоинтов рассылок.
+            max_attempts (int): Максимальное количество попыток для одного получателя.
+            file_ids (media.FileIdCache): Кеш `file_id` вложений. По умолчанию -
+                кеш в памяти этого экземпляра.
+            dispatcher (send_queue.OutboundDispatcher): Очередь исходящих сообщений.
+                None - отправлять напрямую с лимитом `global_rate`.
+        """
+        self.signal_bot = signal_bot
+        self.workers = workers
+        self.checkpoint_dir = checkpoint_dir
+        self.max_attempts = max_attempts
+        self.file_ids = file_ids if file_ids is not None else FileIdCache()
+        self.dispatcher = dispatcher
+        self._bucket = TokenBucket(global_rate, capacity=1)
+        self._bucket_lock = threading.Lock()
+        # Пул соединений должен быть не меньше числа рабочих потоков рассылки
+        ensure_session_layer(workers)
+
+    def _acquire(self, stop_event):
+        while True:
+            with self._bucket_lock:
+                wait = self._bucket.wait_time(time.monotonic())
+                if wait == 0:
+                    self._bucket.consume()
+                    return True
+            if stop_event is not None and stop_event.wait(wait):
+                return False
+            if stop_event is None:
+                time.sleep(wait)
+
+    def _send_once(self, chat_id, text, send_kwargs, stop_event, send_func):
+        """
+        Одна попытка отправки: через очередь исходящих сообщений или напрямую.
+
+        Returns:
+            bool: False, если рассылка прервана до отправки.
+        """
+        if self.dispatcher is None:
+            if not self._acquire(stop_event):
+                return False
+            send_func(chat_id, text, **send_kwargs)
+            return True
+        future = self.dispatcher.send(chat_id, text, priority=PRIORITY_BULK, send_func=send_func,
+                                      checkpointed=True, **send_kwargs)
+        while not future.done():
+            # Отменить можно только сообщение, отправка которого еще не началась
+            if stop_event is not None and stop_event.is_set() and future.cancel():
+                return False
+            futures.wait([future], timeout=STOP_CHECK_INTERVAL if stop_event is not None else None)
+        try:
+            future.result()
+        except futures.CancelledError:
+            return False  # очередь снята при остановке бота
+        return True
+
+    def _send(self, chat_id, text, send_kwargs, stop_event, attachment=None, attachment_type='photo'):
+        """Отправляет сигнал одному получателю. Возвращает (статус, ошибка)."""
+        if attachment is None:
+            send_func = self.signal_bot.send_message
+        else:
+            def send_func(chat_id, text, **kwargs):
+                return self.file_ids.send(self.signal_bot, chat_id, attachment, attachment_type,
+                                          caption=text, **kwargs)
+        error = None
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                if not self._send_once(chat_id, text, send_kwargs, stop_event, send_func):
+                    return "interrupted", None
+                return "ok", None
+            except apihelper.ApiTelegramException as e:
+                error = e
+                retry_after = get_retry_after(e)
+                if retry_after is not None:
+                    # Очередь исходящих сама приостанавливает чат и повторяет отправку
+                    if self.dispatcher is None:
+                        with self._bucket_lock:
+                            self._bucket.pause(retry_after)
+                    continue
+                if e.error_code in PERMANENT_ERROR_CODES:
+                    return "failed", e
+            except Exception as e:
+                error = e
+            delay = min(2 ** attempt * 0.1, 5)
+            if stop_event is not None and stop_event.wait(delay):
+                return "interrupted", None
+            if stop_event is None:
+                time.sleep(delay)
+        return "error", error
+
+    def broadcast(self, broadcast_id, text, subscribers, stop_event=None,
+                  attachment=None, attachment_type='photo', **send_kwargs):
+        """
+        Рассылает сигнал всем подписчикам, пропуская уже получивших его.
+
+        Повторный вызов с тем же `broadcast_id` продолжает прерванную рассылку
+        и повторяет отправку получателям с временными ошибками. С вложением
+        текст сигнала отправляется подписью к нему.
+
+        Args:
+            broadcast_id (str): Идентификатор рассылки (имя файла чекпоинта).
+            text (str): Текст сигнала.
+            subscribers (iterable): Идентификаторы чатов подписчиков.
+            stop_event (threading.Event): Событие для прерывания рассылки.
+            attachment (str): Путь к файлу вложения (график к сигналу).
+            attachment_type (str): Тип вложения: `photo`, `document` и т.д.
+            **send_kwargs: Дополнительные параметры для `send_message` (`send_<тип>` с вложением).
+
+        Returns:
+            dict: Отчет о рассылке: количество отправленных, пропущенных и
+            неудачных сообщений, ошибки по получателям, длительность и пропускная способность.
+        """
+        checkpoint = BroadcastCheckpoint(self.checkpoint_dir, broadcast_id)
+        report = {
+            "broadcast_id": broadcast_id,
+            "sent": 0,
+            "skipped": 0,
+            "failed": 0,
+            "interrupted": False,
+            "failures": {},
+        }
+        report_lock = threading.Lock()
+        started = time.perf_counter()
+
+        def deliver(chat_id):
+            status, error = self._send(chat_id, text, send_kwargs, stop_event, attachment, attachment_type)
+            if status == "interrupted":
+                with report_lock:
+                    report["interrupted"] = True
+                return
+            checkpoint.record(chat_id, status)
+            with report_lock:
+                if status == "ok":
+                    report["sent"] += 1
+                else:
+                    report["failed"] += 1
+                    report["failures"][chat_id] = str(error)
+
+        logger.info(f"Рассылка {broadcast_id}: старт, уже завершено {len(checkpoint.done)}")
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers,
+                                    thread_name_prefix=f"broadcast-{broadcast_id}") as executor:
+                # Ограничиваем число задач в очереди пула, чтобы не держать в памяти
+                # десятки тысяч futures одновременно
+                slots = threading.BoundedSemaphore(self.workers * 4)
+                for chat_id in subscribers:
+                    if chat_id in checkpoint.done:
+                        report["skipped"] += 1
+                        continue
+                    if stop_event is not None and stop_event.is_set():
+                        report["interrupted"] = True
+                        break
+                    slots.acquire()
+                    future = executor.submit(deliver, chat_id)
+                    future.add_done_callback(lambda _: slots.release())
+        finally:
+            checkpoint.close()
+
+        report["duration"] = time.perf_counter() - started
+        report["throughput"] = report["sent"] / report["duration"] if report["duration"] else 0.0
+        logger.info(
+            f"Рассылка {broadcast_id}: отправлено {report['sent']}, пропущено {report['skipped']}, "
+            f"ошибок {report['failed']}, {report['duration']:.1f} с "
+            f"({report['throughput']:.1f} сообщ./с){', прервана' if report['interrupted'] else ''}")
+        return report
+
+
+def load_broadcast_settings(bot_settings):
+    """
+    Возвращает настройки рассылок из секции `broadcast` настроек бота.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки рассылок со значениями по умолчанию.
+    """
+    broadcast = bot_settings.get('broadcast', {})
+    return {
+        'workers': broadcast.get('workers', 8),
+        'global_rate': broadcast.get('global_rate', 30),
+        'checkpoint_dir': broadcast.get('checkpoint_dir', 'broadcasts'),
+        'max_attempts': broadcast.get('max_attempts', 3),
+    }
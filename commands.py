@@ -0,0 +1,159 @@
+#  Содержание commands.py
+
+from telebot import types
+from logger import logger
+
+# Атрибут сообщения, в котором сохраняется результат разбора команды
+PARSED_COMMAND_ATTR = "_parsed_command"
+
+
+def parse_command(text):
+    """
+    Разбирает текст сообщения-команды.
+
+    Поддерживаются команды вида `/cmd`, `/cmd аргументы` и `/cmd@botname аргументы`.
+
+    Args:
+        text (str | None): Текст сообщения.
+
+    Returns:
+        tuple | None: (команда в нижнем регистре, имя бота или None, строка аргументов)
+        или None, если это не команда.
+    """
+    if not text or text[0] != '/' or len(text) < 2 or text[1].isspace():
+        return None
+    parts = text[1:].split(None, 1)
+    name, _, mention = parts[0].partition('@')
+    if not name:
+        return None
+    return name.lower(), mention or None, parts[1].strip() if len(parts) > 1 else ""
+
+
+class CommandRouter:
+    """
+    Реестр команд бота с разбором команды один раз на обновление.
+
+    Вместо цепочки фильтров и `if/elif` команда разбирается одним фильтром
+    `match`, результат сохраняется в сообщении, а обработчик выбирается по
+    словарю. Команды с описанием публикуются в меню Telegram через `set_my_commands`.
+
+    Атрибуты:
+        bot_username (str): Имя бота. Команды `/cmd@другой_бот` игнорируются.
+            Если не задано, принимаются команды с любым упоминанием.
+        fallback (callable): Обработчик неизвестных команд.
+        translate (callable): Перевод описания команды: (команда, описание,
+            код языка) -> текст. Если не задан, используется исходное описание.
+    """
+    def __init__(self, bot_username=None):
+        self.bot_username = bot_username
+        self.fallback = None
+        self.translate = None
+        self._handlers = {}
+        self._descriptions = {}
+
+    def command(self, name, description=None):
+        """
+        Декоратор регистрации обработчика команды.
+
+        Обработчик принимает сообщение и строку аргументов и возвращает текст ответа.
+
+        Args:
+            name (str): Команда без '/'.
+            description (str): Описание для меню команд. Команды без описания не публикуются.
+        """
+        def decorator(handler):
+            self._handlers[name.lower()] = handler
+            if description:
+                self._descriptions[name.lower()] = description
+            return handler
+        return decorator
+
+    def unknown(self, handler):
+        """Декоратор регистрации обработчика неизвестных команд."""
+        self.fallback = handler
+        return handler
+
+    def match(self, message):
+        """
+        Фильтр для `message_handler`: разбирает команду и сохраняет результат в сообщении.
+
+        Args:
+            message (telebot.types.Message): Входящее сообщение.
+
+        Returns:
+            bool: True, если сообщение - команда этому боту.
+        """
+        parsed = parse_command(message.text)
+        if parsed is None:
+            return False
+        mention = parsed[1]
+        if mention and self.bot_username and mention.lower() != self.bot_username.lower():
+            return False
+        setattr(message, PARSED_COMMAND_ATTR, parsed)
+        return True
+
+    def dispatch(self, message):
+        """
+        Вызывает обработчик команды из сообщения.
+
+        Args:
+            message (telebot.types.Message): Сообщение, прошедшее фильтр `match`.
+
+        Returns:
+            str | None: Текст ответа обработчика.
+        """
+        parsed = getattr(message, PARSED_COMMAND_ATTR, None) or parse_command(message.text)
+        name, _, args = parsed
+        handler = self._handlers.get(name, self.fallback)
+        if handler is None:
+            return None
+        return handler(message, args)
+
+    def _described(self, language_code=None):
+        for name, description in self._descriptions.items():
+            if self.translate is not None:
+                description = self.translate(name, description, language_code)
+            yield name, description
+
+    def describe(self, language_code=None):
+        """Возвращает список опубликованных команд в виде строк `/cmd - описание`."""
+        return "\n".join(f"/{name} - {description}"
+                         for name, description in self._described(language_code))
+
+    def bot_commands(self, language_code=None):
+        """Возвращает команды с описанием для `set_my_commands`."""
+        return [types.BotCommand(name, description)
+                for name, description in self._described(language_code)]
+
+    def publish(self, signal_bot, language_codes=()):
+        """
+        Публикует команды в меню Telegram и запоминает имя бота.
+
+        Ошибки сети не останавливают запуск бота, они только пишутся в лог.
+
+        Args:
+            signal_bot (telebot.TeleBot): Экземпляр бота.
+            language_codes (iterable): Языки, для которых публикуются переводы
+                описаний (меню по умолчанию публикуется всегда).
+        """
+        try:
+            self.bot_username = signal_bot.user.username
+            signal_bot.set_my_commands(self.bot_commands())
+            for language_code in language_codes:
+                signal_bot.set_my_commands(self.bot_commands(language_code),
+                                           language_code=language_code)
+            logger.info("Опубликовано команд в меню бота: %s", len(self._descriptions))
+        except Exception as e:
+            logger.error("Не удалось опубликовать команды бота: %s", e)
+
+    async def publish_async(self, signal_bot, language_codes=()):
+        """То же, что `publish`, для `AsyncTeleBot`."""
+        try:
+            self.bot_username = (await signal_bot.get_me()).username
+            await signal_bot.set_my_commands(self.bot_commands())
+            for language_code in language_codes:
+                await signal_bot.set_my_commands(self.bot_commands(language_code),
+                                                 language_code=language_code)
+            logger.info("Опубликовано команд в меню бота: %s", len(self._descriptions))
+        except Exception as e:
+            logger.error("Не удалось опубликовать команды бота: %s", e)
@@ -0,0 +1,260 @@
+#  Содержание config.py
+
+import json
+import logging
+import math
+import os
+import threading
+from logger import logger
+
+# Файл настроек и имя бота в нем
+SETTINGS_PATH = os.path.join('settings', 'key.json')
+BOT_NAME = 'SendingTradeSignal_Bot'
+# Переменная окружения, заменяющая токен из файла настроек
+TOKEN_ENV = 'TGM_BOT_TOKEN'
+# Значение токена в шаблоне settings/key.json
+TOKEN_PLACEHOLDER = "ТУТ НАДО ПРОПИСАТЬ ТОКЕН"
+
+RUNTIME_MODES = ('threaded', 'async', 'webhook', 'sharded')
+RELOAD_MODES = ('restart', 'hot')
+HTTP_CLIENTS = ('requests', 'httpx')
+SHARDING_SOURCES = ('polling', 'webhook')
+# Режимы PRAGMA synchronous баз SQLite (update_store, state_store): здесь, а не в
+# модулях хранилищ, чтобы проверка настроек не импортировала sqlite3
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL")
+
+# Числовые поля секций, которые читают функции `load_X_settings` модулей:
+# секция -> {поле: вид значения}. Виды:
+#   count    - целое число >= 1 (потоки, размеры очередей, попытки);
+#   size     - целое число >= 0 (0 - автоматический выбор);
+#   rate     - число > 0 (сообщений в секунду, интервалы);
+#   seconds  - число >= 0;
+#   fraction - число от 0 до 1;
+#   port     - номер порта от 0 до 65535.
+NUMERIC_FIELDS = {
+    'outbound': {'global_rate': 'rate', 'per_chat_rate': 'rate', 'per_chat_burst': 'rate',
+                 'workers': 'count', 'max_attempts': 'count'},
+    'broadcast': {'workers': 'count', 'global_rate': 'rate', 'max_attempts': 'count'},
+    'callbacks': {'workers': 'count', 'max_pending': 'count'},
+    'shutdown': {'deadline': 'seconds'},
+    'state': {'max_entries': 'count', 'ttl': 'rate', 'flush_interval': 'rate', 'flush_batch': 'count'},
+    'inbound': {'ack_batch': 'count', 'batch_size': 'count', 'retention_seconds': 'seconds'},
+    'webhook': {'port': 'port', 'queue_size': 'count', 'workers': 'count', 'max_body_size': 'count'},
+    'sharding': {'workers': 'size', 'queue_size': 'count', 'report_interval': 'rate'},
+    'media': {'workers': 'count', 'max_pending': 'count', 'max_file_size': 'count', 'chunk_size': 'count'},
+    'http': {'pool_size': 'size'},
+    'metrics': {'port': 'port'},
+    'logging': {'call_sample_rate': 'fraction'},
+}
+# Поля, для которых null означает значение по умолчанию
+NULLABLE_FIELDS = {('sharding', 'workers')}
+
+
+class ConfigError(ValueError):
+    """Ошибка в настройках бота: с такими настройками бот не запускается."""
+
+
+def _check_number(section, name, value, kind):
+    """
+    Проверяет числовое поле `section.name` вида `kind` (см. `NUMERIC_FIELDS`).
+
+    Raises:
+        ConfigError: Если значение не подходит.
+    """
+    integer = kind in ('count', 'size', 'port')
+    valid_type = int if integer else (int, float)
+    if isinstance(value, bool) or not isinstance(value, valid_type) or not math.isfinite(value):
+        raise ConfigError(f"{section}.{name} должен быть {'целым ' if integer else ''}числом, "
+                          f"получено {value!r}")
+    if kind == 'count' and value < 1:
+        raise ConfigError(f"{section}.{name} должен быть не меньше 1, получено {value}")
+    if kind in ('size', 'seconds') and value < 0:
+        raise ConfigError(f"{section}.{name} не может быть отрицательным, получено {value}")
+    if kind == 'rate' and value <= 0:
+        raise ConfigError(f"{section}.{name} должен быть больше 0, получено {value}")
+    if kind == 'fraction' and not 0 <= value <= 1:
+        raise ConfigError(f"{section}.{name} должен быть от 0 до 1, получено {value}")
+    if kind == 'port' and not 0 <= value <= 65535:
+        raise ConfigError(f"{section}.{name} должен быть номером порта от 0 до 65535, получено {value}")
+
+
+def _check_choice(section, name, value, choices):
+    if value not in choices:
+        raise ConfigError(f"неизвестное значение {section}.{name}={value!r}, допустимы: {', '.join(choices)}")
+
+
+def validate_sections(settings):
+    """
+    Проверяет секции, которые читают сами модули (`outbound`, `state`, `logging` и т.д.).
+
+    Отсутствующие поля не проверяются: для них функции `load_X_settings`
+    берут значения по умолчанию.
+
+    Args:
+        settings (dict): Секция бота из `settings/key.json`.
+
+    Raises:
+        ConfigError: Если значение поля некорректно.
+    """
+    for section, fields in NUMERIC_FIELDS.items():
+        values = settings.get(section, {})
+        for name, kind in fields.items():
+            if name not in values:
+                continue
+            if values[name] is None and (section, name) in NULLABLE_FIELDS:
+                continue
+            _check_number(section, name, values[name], kind)
+
+    call_level = settings.get('logging', {}).get('call_level')
+    if call_level is not None:
+        # logging.getLevelName возвращает для неизвестного имени строку "Level X"
+        if isinstance(call_level, bool) or not isinstance(
+                call_level if isinstance(call_level, int) else logging.getLevelName(call_level), int):
+            raise ConfigError(f"неизвестный уровень logging.call_level={call_level!r}, "
+                              "допустимы DEBUG, INFO, WARNING, ERROR, CRITICAL или число")
+
+    http = settings.get('http', {})
+    if 'client' in http:
+        _check_choice('http', 'client', http['client'], HTTP_CLIENTS)
+    timeouts = http.get('timeouts')
+    if timeouts is not None:
+        if not isinstance(timeouts, dict):
+            raise ConfigError("http.timeouts должен быть объектом JSON: метод -> [подключение, чтение]")
+        for method, pair in timeouts.items():
+            if not isinstance(pair, list) or len(pair) != 2:
+                raise ConfigError(f"http.timeouts.{method} должен быть парой [подключение, чтение]")
+            for value in pair:
+                _check_number('http.timeouts', method, value, 'rate')
+    if 'source' in settings.get('sharding', {}):
+        _check_choice('sharding', 'source', settings['sharding']['source'], SHARDING_SOURCES)
+    for section in ('state', 'inbound'):
+        synchronous = settings.get(section, {}).get('synchronous')
+        if synchronous is not None:
+            _check_choice(section, 'synchronous', str(synchronous).upper(), SYNCHRONOUS_MODES)
+
+
+class BotConfig:
+    """
+    Настройки бота, проверенные один раз при загрузке.
+
+    Секции, которые читают сами модули (`outbound`, `webhook`, `state` и т.д.),
+    остаются в `settings` и передаются в их функции `load_X_settings`; их
+    числовые поля и перечисления проверяются здесь же (`validate_sections`).
+
+    Атрибуты:
+        token (str): Токен бота.
+        settings (dict): Секция бота из `settings/key.json`.
+        runtime (dict): Режим работы: `mode` и `async_max_in_flight`.
+        reload (dict): Перезагрузка при изменении файлов: `mode` и `hot_files`.
+        api_url (str | None): Шаблон адреса Bot API (`http.api_url`), например
+            локального сервера Bot API. None - api.telegram.org.
+        file_url (str | None): Шаблон адреса скачивания файлов (`http.file_url`).
+            None - api.telegram.org.
+    """
+    __slots__ = ('token', 'settings', 'runtime', 'reload', 'api_url', 'file_url')
+
+    def __init__(self, token, settings):
+        """
+        Проверяет настройки и создает BotConfig.
+
+        Args:
+            token (str): Токен бота.
+            settings (dict): Секция бота из `settings/key.json`.
+
+        Raises:
+            ConfigError: Если настройки некорректны.
+        """
+        if not isinstance(settings, dict):
+            raise ConfigError("настройки бота должны быть объектом JSON")
+        for name, section in settings.items():
+            if name != 'tgm_bot_token' and not isinstance(section, dict):
+                raise ConfigError(f"секция '{name}' должна быть объектом JSON")
+        token = (token or '').strip()
+        if not token or token == TOKEN_PLACEHOLDER:
+            raise ConfigError(f"не задан токен бота (tgm_bot_token или переменная окружения {TOKEN_ENV})")
+        bot_id, _, secret = token.partition(':')
+        if not bot_id.isdigit() or not secret:
+            raise ConfigError("токен бота должен иметь вид '<id>:<секрет>'")
+        validate_sections(settings)
+
+        runtime = settings.get('runtime', {})
+        mode = runtime.get('mode', 'threaded')
+        if mode not in RUNTIME_MODES:
+            raise ConfigError(f"неизвестный режим работы runtime.mode='{mode}', "
+                              f"допустимы: {', '.join(RUNTIME_MODES)}")
+        max_in_flight = runtime.get('async_max_in_flight', 64)
+        if not isinstance(max_in_flight, int) or max_in_flight < 1:
+            raise ConfigError("runtime.async_max_in_flight должен быть целым числом больше 0")
+
+        reload_settings = settings.get('reload', {})
+        reload_mode = reload_settings.get('mode', 'restart')
+        if reload_mode not in RELOAD_MODES:
+            raise ConfigError(f"неизвестный режим перезагрузки reload.mode='{reload_mode}', "
+                              f"допустимы: {', '.join(RELOAD_MODES)}")
+
+        api_url = settings.get('http', {}).get('api_url') or None
+        if api_url is not None and ('{0}' not in api_url or '{1}' not in api_url):
+            raise ConfigError("http.api_url должен содержать {0} (токен) и {1} (метод), "
+                              "например http://127.0.0.1:8081/bot{0}/{1}")
+        file_url = settings.get('http', {}).get('file_url') or None
+        if file_url is not None and ('{0}' not in file_url or '{1}' not in file_url):
+            raise ConfigError("http.file_url должен содержать {0} (токен) и {1} (путь к файлу), "
+                              "например http://127.0.0.1:8081/file/bot{0}/{1}")
+
+        self.token = token
+        self.settings = settings
+        self.runtime = {'mode': mode, 'async_max_in_flight': max_in_flight}
+        self.reload = {'mode': reload_mode,
+                       'hot_files': reload_settings.get('hot_files', ['bot.py'])}
+        self.api_url = api_url
+        self.file_url = file_url
+
+
+_cache_lock = threading.Lock()
+_cached = (None, None)  # (ключ файла, BotConfig)
+
+
+def load_config(path=SETTINGS_PATH, bot_name=BOT_NAME):
+    """
+    Загружает и проверяет настройки бота.
+
+    Токен из переменной окружения `TGM_BOT_TOKEN` заменяет `tgm_bot_token`
+    из файла. Результат кешируется: пока файл (время изменения и размер) и
+    переменная окружения не изменились, повторный вызов - например, при
+    перезапуске бота - не читает и не разбирает файл заново.
+
+    Args:
+        path (str): Путь к файлу настроек.
+        bot_name (str): Имя бота в секции `tgm_bots`.
+
+    Returns:
+        BotConfig: Проверенные настройки.
+
+    Raises:
+        ConfigError: Если файла нет, он не разбирается или настройки некорректны.
+    """
+    global _cached
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise ConfigError(f"не удалось прочитать файл настроек {path}: {e}") from e
+    env_token = os.environ.get(TOKEN_ENV)
+    key = (os.path.abspath(path), bot_name, stat.st_mtime_ns, stat.st_size, env_token)
+    with _cache_lock:
+        if _cached[0] == key:
+            return _cached[1]
+
+        logger.info(f"Загрузка настроек бота из {path}")
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                document = json.load(file)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"не удалось разобрать файл настроек {path}: {e}") from e
+        try:
+            settings = document['tgm_bots'][bot_name]
+        except (KeyError, TypeError):
+            raise ConfigError(f"в {path} нет настроек бота tgm_bots.{bot_name}") from None
+        token = env_token or (settings.get('tgm_bot_token') if isinstance(settings, dict) else None)
+        config = BotConfig(token, settings)
+        _cached = (key, config)
+        return config
@@ -0,0 +1,152 @@
+#  Содержание hot_reload.py
+
+import copy
+import importlib
+import threading
+import time
+from logger import logger
+
+
+def _handler_lists(signal_bot):
+    """Возвращает имена атрибутов бота, хранящих списки обработчиков."""
+    return [name for name, value in vars(signal_bot).items()
+            if name.endswith('_handlers') and isinstance(value, list)]
+
+
+class HandlerReloader:
+    """
+    Горячая перезагрузка обработчиков без остановки polling.
+
+    Модуль с обработчиками (по умолчанию `bot`) импортируется заново, а его
+    `register_handlers` регистрирует новый набор обработчиков на копии бота.
+    Затем наборы обработчиков подменяются на работающем боте под блокировкой.
+    `process_new_updates` под той же блокировкой только снимает копию бота с
+    текущими списками обработчиков и обрабатывает пачку на ней уже без
+    блокировки: каждая пачка видит либо полностью старый, либо полностью
+    новый набор, пачки обрабатываются параллельно, а перезагрузка не ждет
+    медленные обработчики. Соединение с Telegram и очередь исходящих
+    сообщений при этом не пересоздаются.
+
+    Атрибуты:
+        signal_bot (telebot.TeleBot): Работающий экземпляр бота.
+        module_name (str): Имя модуля с функцией `register_handlers`.
+        stats (dict): Количество перезагрузок, ошибок, задержка последней
+            перезагрузки и число обновлений, обработанных во время перезагрузок.
+    """
+    def __init__(self, signal_bot, module_name='bot', **register_kwargs):
+        """
+        Инициализирует HandlerReloader и перехватывает `process_new_updates` бота.
+
+        Args:
+            signal_bot (telebot.TeleBot): Работающий экземпляр бота.
+            module_name (str): Имя модуля с функцией `register_handlers`.
+            **register_kwargs: Дополнительные аргументы для `register_handlers`
+                (например, `dispatcher`).
+        """
+        self.signal_bot = signal_bot
+        self.module_name = module_name
+        self.register_kwargs = register_kwargs
+        self.stats = {"reloads": 0, "failed": 0, "last_latency": None,
+                      "updates_during_reload": 0}
+        self._swap_lock = threading.Lock()
+        self._reloading = False
+        self._reload_requested = False
+
+        process_new_updates = type(signal_bot).process_new_updates
+
+        def guarded_process_new_updates(updates):
+            with self._swap_lock:
+                if self._reloading:
+                    self.stats["updates_during_reload"] += len(updates)
+                # Списки обработчиков при подмене заменяются, а не изменяются,
+                # поэтому поверхностная копия бота видит согласованный набор
+                snapshot = copy.copy(signal_bot)
+            try:
+                return process_new_updates(snapshot, updates)
+            finally:
+                # Polling запрашивает обновления со смещения last_update_id работающего бота
+                with self._swap_lock:
+                    if snapshot.last_update_id > signal_bot.last_update_id:
+                        signal_bot.last_update_id = snapshot.last_update_id
+
+        signal_bot.process_new_updates = guarded_process_new_updates
+
+    def reload(self):
+        """
+        Перезагружает модуль обработчиков и подменяет обработчики на работающем боте.
+
+        Если импорт или регистрация завершились ошибкой, продолжают работать
+        прежние обработчики. Запрос, пришедший во время перезагрузки, не
+        запускает вторую параллельную перезагрузку: текущая повторяется еще раз,
+        чтобы подхватить изменения, сделанные после начала импорта.
+
+        Returns:
+            bool: True, если обработчики были заменены.
+        """
+        with self._swap_lock:
+            if self._reloading:
+                self._reload_requested = True
+                return False
+            self._reloading = True
+        replaced = False
+        try:
+            while True:
+                started = time.perf_counter()
+                staging = self._register()
+                with self._swap_lock:
+                    if staging is not None:
+                        for name, handlers in staging.items():
+                            setattr(self.signal_bot, name, handlers)
+                    repeat, self._reload_requested = self._reload_requested, False
+                    if not repeat:
+                        self._reloading = False
+                if staging is not None:
+                    replaced = True
+                    latency = time.perf_counter() - started
+                    self.stats["reloads"] += 1
+                    self.stats["last_latency"] = latency
+                    logger.info("Обработчики %s перезагружены за %.1f мс, обновлений во время перезагрузок: %s",
+                                self.module_name, latency * 1000, self.stats["updates_during_reload"])
+                if not repeat:
+                    return replaced
+        except BaseException:
+            with self._swap_lock:
+                self._reloading = self._reload_requested = False
+            raise
+
+    def _register(self):
+        """
+        Импортирует модуль заново и регистрирует обработчики на копии бота.
+
+        Returns:
+            dict | None: Новые списки обработчиков по имени атрибута бота или
+            None, если импорт или регистрация завершились ошибкой.
+        """
+        try:
+            module = importlib.reload(importlib.import_module(self.module_name))
+            staging = copy.copy(self.signal_bot)
+            names = _handler_lists(self.signal_bot)
+            for name in names:
+                setattr(staging, name, [])
+            module.register_handlers(staging, **self.register_kwargs)
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error("Ошибка горячей перезагрузки %s, остаются прежние обработчики: %s",
+                         self.module_name, e)
+            return None
+        return {name: getattr(staging, name) for name in names}
+
+    def run(self, reload_event, stop_event):
+        """
+        Выполняет перезагрузку при каждой установке `reload_event` до установки `stop_event`.
+
+        Args:
+            reload_event (threading.Event): Событие запроса перезагрузки (ставит watchdog).
+            stop_event (threading.Event): Событие остановки.
+        """
+        while True:
+            reload_event.wait()
+            if stop_event.is_set():
+                return
+            reload_event.clear()
+            self.reload()
@@ -0,0 +1,265 @@
+#  Содержание http_session.py
+
+import socket
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from telebot import apihelper
+from logger import logger
+
+# Параметры TCP keep-alive для соединений с Bot API
+TCP_KEEPALIVE_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, "TCP_KEEPIDLE"):
+    TCP_KEEPALIVE_OPTIONS += [
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 60),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 15),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 4),
+    ]
+
+# Таймауты (подключение, чтение) по методам Bot API, в секундах
+DEFAULT_TIMEOUTS = {
+    "default": (5, 30),
+    "sendMessage": (3, 10),
+    "answerCallbackQuery": (3, 5),
+}
+
+# Сколько секунд при запуске ждать ответа get_me, прежде чем начать получать обновления
+PREWARM_TIMEOUT = 5
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter с включенным TCP keep-alive на сокетах пула."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs.setdefault("socket_options",
+                          list(HTTPConnection.default_socket_options) + TCP_KEEPALIVE_OPTIONS)
+        super().init_poolmanager(*args, **kwargs)
+
+
+class RequestsClient:
+    """
+    HTTP-клиент на общей сессии `requests` с пулом keep-alive соединений.
+
+    Атрибуты:
+        session (requests.Session): Общая сессия для всех потоков бота.
+    """
+    def __init__(self, pool_size, pool_block=True, verify=True):
+        """
+        Инициализирует RequestsClient.
+
+        Args:
+            pool_size (int): Максимальное число соединений с Bot API.
+            pool_block (bool): Ждать свободного соединения вместо открытия
+                лишнего, которое закроется сразу после запроса.
+            verify (bool | str): Проверка сертификата сервера (или путь к CA).
+        """
+        self.session = requests.Session()
+        self.session.verify = verify
+        adapter = KeepAliveAdapter(pool_connections=2, pool_maxsize=pool_size, pool_block=pool_block)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        return self.session.request(method, url, params=params, files=files,
+                                    timeout=timeout, proxies=proxies)
+
+    def close(self):
+        self.session.close()
+
+
+class HttpxClient:
+    """
+    HTTP-клиент на `httpx` с поддержкой HTTP/2 (нужен пакет `httpx[http2]`).
+
+    При HTTP/2 все запросы идут мультиплексированно через одно соединение.
+    Прокси из `apihelper.proxy` для этого клиента не используется.
+    """
+    def __init__(self, pool_size, http2=True, verify=True):
+        """
+        Инициализирует HttpxClient.
+
+        Args:
+            pool_size (int): Максимальное число соединений с Bot API.
+            http2 (bool): Включить HTTP/2.
+            verify (bool | str): Проверка сертификата сервера (или путь к CA).
+        """
+        try:
+            import httpx
+        except ImportError as e:
+            raise RuntimeError("Для клиента httpx установите пакет: pip install 'httpx[http2]'") from e
+        self._httpx = httpx
+        self.client = httpx.Client(
+            http2=http2, verify=verify,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+
+    def request(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        connect_timeout, read_timeout = timeout
+        response = self.client.request(
+            method, url, params=params, files=files,
+            timeout=self._httpx.Timeout(read_timeout, connect=connect_timeout))
+        # Ответ проверяет apihelper, который ожидает атрибут reason, как у requests
+        response.reason = response.reason_phrase
+        return response
+
+    def close(self):
+        self.client.close()
+
+
+class ApiSessionLayer:
+    """
+    Общий слой HTTP-запросов к Bot API для всех потоков бота.
+
+    Устанавливается в `apihelper.CUSTOM_REQUEST_SENDER`, поэтому все методы
+    TeleBot идут через один пул keep-alive соединений, размер которого
+    согласован с числом рабочих потоков. Таймауты подключения и чтения
+    задаются по методам Bot API; для getUpdates таймаут чтения не бывает
+    меньше, чем требует long polling.
+
+    Атрибуты:
+        client: HTTP-клиент (`RequestsClient` или `HttpxClient`).
+        timeouts (dict): Таймауты (подключение, чтение) по методам и `default`.
+    """
+    def __init__(self, client, timeouts=None):
+        """
+        Инициализирует ApiSessionLayer.
+
+        Args:
+            client: HTTP-клиент с методом `request(method, url, params, files, timeout, proxies)`.
+            timeouts (dict): Таймауты (подключение, чтение) по методам Bot API.
+                Методы без записи и без `default` используют таймауты apihelper.
+        """
+        self.client = client
+        self.timeouts = {method: tuple(value) for method, value in (timeouts or {}).items()}
+
+    def timeout_for(self, method_name, timeout):
+        """
+        Возвращает таймауты (подключение, чтение) для метода.
+
+        Args:
+            method_name (str): Метод Bot API.
+            timeout (tuple): Таймауты, вычисленные apihelper.
+        """
+        configured = self.timeouts.get(method_name) or self.timeouts.get("default")
+        if configured is None:
+            return timeout
+        if method_name == "getUpdates":
+            # apihelper уже учел long_polling_timeout в таймауте чтения
+            return configured[0], max(configured[1], timeout[1])
+        return configured
+
+    def __call__(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        method_name = url.rsplit('/', 1)[-1]
+        return self.client.request(method, url, params=params, files=files,
+                                   timeout=self.timeout_for(method_name, timeout), proxies=proxies)
+
+    def close(self):
+        self.client.close()
+
+
+_installed_layer = None
+
+
+def install_session_layer(pool_size, client="requests", pool_block=True, timeouts=None, verify=True):
+    """
+    Создает слой HTTP-запросов и подключает его к `apihelper`.
+
+    Сессия `requests` также становится `apihelper.session`, чтобы скачивание
+    файлов шло через тот же пул, а время жизни сессии не ограничивается.
+
+    Args:
+        pool_size (int): Размер пула соединений.
+        client (str): `requests` или `httpx` (HTTP/2).
+        pool_block (bool): Ждать свободного соединения (только для `requests`).
+        timeouts (dict): Таймауты по методам Bot API.
+        verify (bool | str): Проверка сертификата сервера (или путь к CA).
+
+    Returns:
+        ApiSessionLayer: Установленный слой.
+    """
+    global _installed_layer
+    if client == "httpx":
+        http_client = HttpxClient(pool_size, http2=True, verify=verify)
+    else:
+        http_client = RequestsClient(pool_size, pool_block=pool_block, verify=verify)
+        apihelper.session = http_client.session
+        apihelper.SESSION_TIME_TO_LIVE = None
+    layer = ApiSessionLayer(http_client, DEFAULT_TIMEOUTS if timeouts is None else timeouts)
+    previous, _installed_layer = _installed_layer, layer
+    apihelper.CUSTOM_REQUEST_SENDER = layer
+    if previous is not None:
+        previous.close()
+    logger.info(f"HTTP-клиент Bot API: {client}, пул соединений {pool_size}")
+    return layer
+
+
+def ensure_session_layer(pool_size):
+    """
+    Устанавливает слой HTTP-запросов с настройками по умолчанию, если он еще не установлен.
+
+    Args:
+        pool_size (int): Размер пула соединений.
+
+    Returns:
+        ApiSessionLayer: Установленный слой.
+    """
+    if _installed_layer is None:
+        return install_session_layer(pool_size)
+    return _installed_layer
+
+
+def prewarm(signal_bot):
+    """
+    Запрашивает `get_me` в фоновом потоке, пока бот инициализируется.
+
+    Первый запрос открывает соединение с Bot API (DNS, TCP и TLS), которое
+    затем берут из пула long polling и отправка ответов, а результат
+    кешируется в `signal_bot.user`. Ошибка только пишется в лог: `get_me`
+    повторится при следующем обращении к `signal_bot.user`.
+
+    Args:
+        signal_bot (telebot.TeleBot): Экземпляр бота.
+
+    Returns:
+        threading.Thread: Запущенный поток прогрева.
+    """
+    def warm_up():
+        try:
+            logger.info("Соединение с Bot API установлено, бот @%s", signal_bot.user.username)
+        except Exception as e:
+            logger.warning("Не удалось выполнить get_me при запуске: %s", e)
+
+    thread = threading.Thread(target=warm_up, name="bot-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def load_http_settings(bot_settings):
+    """
+    Возвращает настройки HTTP-клиента из секции `http` настроек бота.
+
+    Размер пула 0 означает автоматический выбор: потоки очереди исходящих
+    сообщений, рассылки, работы по нажатиям кнопок, скачивания вложений и
+    потоки обработчиков TeleBot.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки HTTP-клиента со значениями по умолчанию.
+    """
+    http = bot_settings.get('http', {})
+    pool_size = http.get('pool_size', 0)
+    if not pool_size:
+        pool_size = (bot_settings.get('outbound', {}).get('workers', 4)
+                     + bot_settings.get('broadcast', {}).get('workers', 8)
+                     + bot_settings.get('callbacks', {}).get('workers', 4)
+                     + bot_settings.get('media', {}).get('workers', 4)
+                     + 4)  # потоки обработчиков TeleBot и long polling
+    timeouts = http.get('timeouts')
+    return {
+        'client': http.get('client', 'requests'),
+        'pool_size': pool_size,
+        'pool_block': http.get('pool_block', True),
+        'timeouts': {k: tuple(v) for k, v in timeouts.items()} if timeouts else None,
+    }
@@ -0,0 +1,449 @@
+#  Содержание keyboards.py
+
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from telebot import types
+from logger import logger
+from metrics import Gauge
+
+# Ограничение Telegram на длину callback_data, в байтах UTF-8
+CALLBACK_DATA_LIMIT = 64
+CALLBACK_SEPARATOR = ":"
+# Атрибут нажатия, в котором сохраняется результат разбора callback_data
+PARSED_CALLBACK_ATTR = "_parsed_callback"
+
+
+def encode_callback(action, *args):
+    """
+    Кодирует действие и аргументы кнопки в компактную строку `действие:арг1:арг2`.
+
+    Args:
+        action (str): Действие (например, `signal`).
+        *args: Аргументы действия (id сигнала, режим и т.п.), приводятся к строке.
+
+    Returns:
+        str: Значение для `callback_data`.
+
+    Raises:
+        ValueError: Если в действии есть разделитель или строка длиннее 64 байт.
+    """
+    if CALLBACK_SEPARATOR in action:
+        raise ValueError(f"Действие кнопки не может содержать '{CALLBACK_SEPARATOR}': {action}")
+    data = CALLBACK_SEPARATOR.join([action, *map(str, args)])
+    if len(data.encode('utf-8')) > CALLBACK_DATA_LIMIT:
+        raise ValueError(f"callback_data длиннее {CALLBACK_DATA_LIMIT} байт: {data}")
+    return data
+
+
+def decode_callback(data):
+    """
+    Разбирает `callback_data`, созданную `encode_callback`.
+
+    Данные без разделителя (старые кнопки вида `some_action`) считаются
+    действием без аргументов.
+
+    Args:
+        data (str | None): Значение `callback_data`.
+
+    Returns:
+        tuple: (действие, список аргументов).
+    """
+    action, *args = (data or "").split(CALLBACK_SEPARATOR)
+    return action, args
+
+
+class FrozenInlineKeyboard(types.InlineKeyboardMarkup):
+    """
+    Инлайн-клавиатура, которая сериализуется в JSON один раз.
+
+    TeleBot вызывает `to_json` при каждой отправке сообщения с клавиатурой.
+    Клавиатура из кеша не меняется, поэтому JSON запоминается при первом вызове.
+    """
+    def to_json(self):
+        json_text = self.__dict__.get('_json')
+        if json_text is None:
+            json_text = self._json = super().to_json()
+        return json_text
+
+
+def build_keyboard(rows):
+    """
+    Собирает инлайн-клавиатуру из строк кнопок.
+
+    Args:
+        rows (list): Строки кнопок, каждая - список пар (текст, callback_data).
+
+    Returns:
+        FrozenInlineKeyboard: Готовая клавиатура.
+    """
+    keyboard = FrozenInlineKeyboard()
+    for row in rows:
+        keyboard.row(*(types.InlineKeyboardButton(text, callback_data=data) for text, data in row))
+    return keyboard
+
+
+class KeyboardCache:
+    """
+    Кеш готовых инлайн-клавиатур по ключу (например, `("signal", id, язык)`).
+
+    Клавиатура собирается при первом обращении и затем переиспользуется
+    вместе с уже сериализованным JSON. Хранится не больше `max_size`
+    клавиатур, давно не использованные удаляются первыми.
+
+    Атрибуты:
+        max_size (int): Максимальное число клавиатур в кеше.
+        stats (dict): Количество попаданий и промахов кеша.
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.stats = {"hits": 0, "misses": 0}
+        self._keyboards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, builder):
+        """
+        Возвращает клавиатуру из кеша или собирает ее.
+
+        Args:
+            key (hashable): Ключ клавиатуры.
+            builder (callable): Функция без аргументов, возвращающая строки кнопок
+                для `build_keyboard`.
+
+        Returns:
+            FrozenInlineKeyboard: Клавиатура.
+        """
+        with self._lock:
+            keyboard = self._keyboards.get(key)
+            if keyboard is not None:
+                self._keyboards.move_to_end(key)
+                self.stats["hits"] += 1
+                return keyboard
+        keyboard = build_keyboard(builder())
+        with self._lock:
+            self.stats["misses"] += 1
+            keyboard = self._keyboards.setdefault(key, keyboard)
+            if len(self._keyboards) > self.max_size:
+                self._keyboards.popitem(last=False)
+        return keyboard
+
+    def invalidate(self, key=None):
+        """Удаляет клавиатуру по ключу или, без ключа, весь кеш."""
+        with self._lock:
+            if key is None:
+                self._keyboards.clear()
+            else:
+                self._keyboards.pop(key, None)
+
+
+class CallbackRouter:
+    """
+    Реестр действий инлайн-кнопок.
+
+    `callback_data` разбирается один раз на нажатие. Для действия
+    регистрируются быстрый ответ (текст уведомления на нажатие) и,
+    при необходимости, последующая работа (редактирование сообщения,
+    запросы к внешним сервисам), которая выполняется после ответа.
+
+    Атрибуты:
+        fallback (callable): Ответ на нажатие с неизвестным действием.
+    """
+    def __init__(self):
+        self.fallback = None
+        self._answers = {}
+        self._follow_ups = {}
+
+    def action(self, name):
+        """
+        Декоратор регистрации ответа на нажатие.
+
+        Обработчик принимает нажатие и список аргументов и возвращает текст уведомления.
+        """
+        def decorator(handler):
+            self._answers[name] = handler
+            return handler
+        return decorator
+
+    def follow_up(self, name):
+        """
+        Декоратор регистрации последующей работы для действия.
+
+        Обработчик принимает бота, нажатие и список аргументов и выполняется
+        после ответа на нажатие (в `CallbackResponder` - в фоновом потоке).
+        """
+        def decorator(handler):
+            self._follow_ups[name] = handler
+            return handler
+        return decorator
+
+    def unknown(self, handler):
+        """Декоратор регистрации ответа на нажатие с неизвестным действием."""
+        self.fallback = handler
+        return handler
+
+    def parse(self, call):
+        """Возвращает (действие, аргументы) нажатия, разбирая `callback_data` один раз."""
+        parsed = getattr(call, PARSED_CALLBACK_ATTR, None)
+        if parsed is None:
+            parsed = decode_callback(call.data)
+            setattr(call, PARSED_CALLBACK_ATTR, parsed)
+        return parsed
+
+    def answer(self, call):
+        """
+        Возвращает текст уведомления на нажатие.
+
+        Returns:
+            str | None: Текст ответа обработчика.
+        """
+        action, args = self.parse(call)
+        handler = self._answers.get(action, self.fallback)
+        if handler is None:
+            return None
+        return handler(call, args)
+
+    def follow_up_for(self, signal_bot, call):
+        """
+        Возвращает последующую работу для нажатия.
+
+        Returns:
+            callable | None: Функция без аргументов или None, если работы нет.
+        """
+        action, args = self.parse(call)
+        handler = self._follow_ups.get(action)
+        if handler is None:
+            return None
+        return lambda: handler(signal_bot, call, args)
+
+
+class CallbackResponder:
+    """
+    Быстрый ответ на нажатия инлайн-кнопок с фоновой последующей работой.
+
+    `answer_callback_query` выполняется сразу в потоке обработчика, поэтому
+    пользователь видит реакцию на кнопку за время одного запроса к Bot API,
+    а медленная работа (редактирование сообщения, расчеты по сигналу)
+    выполняется в пуле из `workers` потоков и не занимает потоки обработчиков.
+
+    Ответы на нажатия не группируются: в Bot API нет пакетного метода, каждое
+    нажатие подтверждается отдельным `answerCallbackQuery` со своим `id`.
+    Перенос ответа в пул только добавил бы ожидание в очереди перед тем же запросом.
+
+    Работа для одного сообщения выполняется последовательно. Если пользователь
+    нажал несколько кнопок одного сообщения, пока предыдущая работа ждала
+    очереди, выполняется только последняя: промежуточные правки все равно
+    были бы перезаписаны.
+
+    Атрибуты:
+        signal_bot (telebot.TeleBot): Экземпляр бота.
+        max_pending (int): Максимальное число сообщений с ожидающей работой.
+        stats (dict): Количество ответов, выполненных, замененных, отброшенных
+            и неудачных задач.
+    """
+    def __init__(self, signal_bot, workers=4, max_pending=1000):
+        """
+        Инициализирует CallbackResponder.
+
+        Args:
+            signal_bot (telebot.TeleBot): Экземпляр бота.
+            workers (int): Количество потоков для последующей работы.
+            max_pending (int): Максимальное число сообщений с ожидающей работой.
+                Работа сверх лимита отбрасывается с записью в лог.
+        """
+        self.signal_bot = signal_bot
+        self.max_pending = max_pending
+        self.stats = {"answered": 0, "answer_failed": 0, "follow_ups": 0,
+                      "superseded": 0, "dropped": 0, "failed": 0}
+        self._pending = {}   # ключ сообщения -> последняя ожидающая задача
+        self._running = set()
+        self._active = 0     # задачи, выполняемые в данный момент
+        self._answer_times = deque(maxlen=1000)
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="callback")
+
+    def respond(self, call, text, follow_up=None):
+        """
+        Отвечает на нажатие и ставит последующую работу в очередь.
+
+        Args:
+            call (telebot.types.CallbackQuery): Нажатие кнопки.
+            text (str | None): Текст уведомления.
+            follow_up (callable): Функция без аргументов, выполняемая после ответа.
+        """
+        started = time.perf_counter()
+        try:
+            self.signal_bot.answer_callback_query(call.id, text)
+        except Exception as e:
+            # Работа по нажатию важнее уведомления: продолжаем
+            with self._cond:
+                self.stats["answer_failed"] += 1
+            logger.error("Ошибка при ответе на обратный вызов пользователю %s: %s",
+                         call.from_user.id, e)
+        else:
+            with self._cond:
+                self.stats["answered"] += 1
+                self._answer_times.append(time.perf_counter() - started)
+        if follow_up is not None:
+            self.schedule(call, follow_up)
+
+    def schedule(self, call, follow_up):
+        """
+        Ставит последующую работу по нажатию в очередь без ответа на нажатие.
+
+        Используется, когда ответ уже отправлен (в асинхронном режиме - без
+        блокировки цикла событий).
+
+        Args:
+            call (telebot.types.CallbackQuery): Нажатие кнопки.
+            follow_up (callable): Функция без аргументов.
+        """
+        self._schedule(self._message_key(call), follow_up)
+
+    @staticmethod
+    def _message_key(call):
+        if call.message is not None:
+            return call.message.chat.id, call.message.message_id
+        return call.inline_message_id or call.id
+
+    def _schedule(self, key, task):
+        with self._cond:
+            if key in self._pending:
+                self._pending[key] = task
+                self.stats["superseded"] += 1
+                return
+            if len(self._pending) >= self.max_pending:
+                self.stats["dropped"] += 1
+                logger.warning("Очередь работы по нажатиям переполнена, задача для %s отброшена", key)
+                return
+            self._pending[key] = task
+            if key in self._running:
+                return  # запустится после текущей задачи этого сообщения
+            self._running.add(key)
+        self._executor.submit(self._run, key)
+
+    def _run(self, key):
+        while True:
+            with self._cond:
+                task = self._pending.pop(key, None)
+                if task is None:
+                    self._running.discard(key)
+                    self._cond.notify_all()
+                    return
+                self._active += 1
+            try:
+                task()
+            except Exception as e:
+                with self._cond:
+                    self.stats["failed"] += 1
+                logger.error("Ошибка при обработке нажатия для %s: %s", key, e)
+            else:
+                with self._cond:
+                    self.stats["follow_ups"] += 1
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    self._cond.notify_all()
+
+    def join(self, timeout):
+        """
+        Ожидает завершения всей последующей работы.
+
+        Returns:
+            bool: True, если работа завершена до истечения таймаута.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """
+        Останавливает пул потоков.
+
+        Выполняемая задача не прерывается: она ждется не дольше `timeout` и
+        дорабатывает в фоне.
+
+        Args:
+            timeout (float): Сколько секунд ждать ожидающей работы. None - не ждать
+                очереди, но дождаться выполняемых задач.
+
+        Returns:
+            int: Количество сообщений, работа для которых не выполнена (включая
+            задачи, не завершившиеся к `timeout`).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if timeout:
+            self.join(timeout)
+        with self._cond:
+            remaining = len(self._pending)
+            self._pending.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._cond:
+            self._cond.wait_for(lambda: not self._active,
+                                None if deadline is None else max(0.0, deadline - time.monotonic()))
+            remaining += self._active
+        logger.info(f"Обработка нажатий остановлена, не выполнено задач: {remaining}")
+        return remaining
+
+    def metrics(self):
+        """
+        Возвращает метрики ответов на нажатия.
+
+        Returns:
+            dict: Счетчики, число ожидающих и выполняемых задач и время ответа
+            на нажатие (p50, p99) в секундах.
+        """
+        with self._cond:
+            result = dict(self.stats)
+            result["pending"] = len(self._pending)
+            result["running"] = len(self._running)
+            answer_times = sorted(self._answer_times)
+        if answer_times:
+            result["answer_p50"] = answer_times[len(answer_times) // 2]
+            result["answer_p99"] = answer_times[min(len(answer_times) - 1, int(len(answer_times) * 0.99))]
+        else:
+            result["answer_p50"] = result["answer_p99"] = 0.0
+        return result
+
+
+def load_callback_settings(bot_settings):
+    """
+    Возвращает настройки ответов на нажатия из секции `callbacks`.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки со значениями по умолчанию.
+    """
+    callbacks = bot_settings.get('callbacks', {})
+    return {
+        'workers': callbacks.get('workers', 4),
+        'max_pending': callbacks.get('max_pending', 1000),
+    }
+
+
+def create_responder(signal_bot, settings):
+    """
+    Создает `CallbackResponder` по настройкам и регистрирует его метрики.
+
+    Args:
+        signal_bot (telebot.TeleBot): Экземпляр бота.
+        settings (dict): Настройки из `load_callback_settings`.
+
+    Returns:
+        CallbackResponder: Созданный экземпляр.
+    """
+    responder = CallbackResponder(signal_bot, workers=settings['workers'],
+                                  max_pending=settings['max_pending'])
+    # Значения считаются только при чтении /metrics
+    Gauge("bot_callback_follow_ups_pending", "Сообщения с ожидающей работой по нажатию кнопки",
+          lambda: responder.metrics()["pending"])
+    Gauge("bot_callback_answer_p99_seconds", "p99 времени ответа на нажатие кнопки",
+          lambda: responder.metrics()["answer_p99"])
+    return responder
@@ -0,0 +1,338 @@
+#  Содержание lifecycle.py
+
+import glob
+import json
+import os
+import queue
+import time
+from telebot import apihelper, types
+from logger import logger
+
+# Директория для работы, не завершенной к остановке бота
+PENDING_DIR = os.path.join("state", "pending")
+# Время на остановку бота по умолчанию, в секундах
+DEFAULT_SHUTDOWN_DEADLINE = 10.0
+
+
+def save_pending(kind, items, directory=PENDING_DIR):
+    """
+    Сохраняет незавершенную работу в файл JSON Lines `<kind>-<pid>-<время>.jsonl`.
+
+    Каждый процесс пишет в свой файл, поэтому рабочим процессам не нужна
+    общая блокировка. Файл появляется целиком (запись во временный файл и
+    переименование).
+
+    Args:
+        kind (str): Вид работы: `updates` или `outbound`.
+        items (list): Элементы, сериализуемые в JSON.
+        directory (str): Директория для файлов.
+
+    Returns:
+        int: Количество сохраненных элементов.
+    """
+    if not items:
+        return 0
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kind}-{os.getpid()}-{time.time_ns()}.jsonl")
+    with open(path + ".tmp", 'w', encoding='utf-8') as file:
+        for item in items:
+            file.write(json.dumps(item, ensure_ascii=False) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+    return len(items)
+
+
+def load_pending(kind, directory=PENDING_DIR):
+    """
+    Читает и удаляет сохраненную работу вида `kind` в порядке сохранения.
+
+    Returns:
+        list: Сохраненные элементы.
+    """
+    items = []
+    for path in sorted(glob.glob(os.path.join(directory, f"{kind}-*.jsonl")),
+                       key=lambda p: int(p.rsplit('-', 1)[-1][:-len(".jsonl")])):
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                items.extend(json.loads(line) for line in file if line.strip())
+        except (OSError, ValueError) as e:
+            logger.error("Не удалось прочитать сохраненную работу %s: %s", path, e)
+            continue
+        os.remove(path)
+    return items
+
+
+def restore_updates(consume, directory=PENDING_DIR):
+    """
+    Передает в `consume` обновления, не обработанные до прошлой остановки.
+
+    Args:
+        consume (callable): Функция, принимающая одно обновление в формате Bot API.
+
+    Returns:
+        int: Количество восстановленных обновлений.
+    """
+    updates = load_pending("updates", directory)
+    for update_json in updates:
+        try:
+            consume(update_json)
+        except Exception as e:
+            logger.error("Ошибка при обработке сохраненного обновления: %s", e)
+    if updates:
+        logger.info(f"Восстановлено обновлений с прошлой остановки: {len(updates)}")
+    return len(updates)
+
+
+def restore_outbound(signal_bot, dispatcher=None, messages=None, directory=PENDING_DIR):
+    """
+    Ставит в очередь (или отправляет) сообщения, не отправленные до прошлой остановки.
+
+    Args:
+        signal_bot (telebot.TeleBot): Бот для отправки, если очереди нет.
+        dispatcher (send_queue.OutboundDispatcher): Очередь исходящих сообщений.
+        messages (list): Уже прочитанные сохраненные сообщения. По умолчанию
+            читаются из `directory`.
+
+    Returns:
+        int: Количество восстановленных сообщений.
+    """
+    if messages is None:
+        messages = load_pending("outbound", directory)
+    for item in messages:
+        try:
+            if dispatcher is not None:
+                dispatcher.send(item["chat_id"], item["text"], priority=item["priority"], **item["kwargs"])
+            else:
+                signal_bot.send_message(item["chat_id"], item["text"], **item["kwargs"])
+        except Exception as e:
+            logger.error("Ошибка при отправке сохраненного сообщения в чат %s: %s", item["chat_id"], e)
+    if messages:
+        logger.info(f"Восстановлено исходящих сообщений с прошлой остановки: {len(messages)}")
+    return len(messages)
+
+
+def _outbound_to_json(message):
+    """Представление сообщения из очереди для `save_pending` (клавиатуры - в виде JSON)."""
+    kwargs = {key: value.to_json() if isinstance(value, types.JsonSerializable) else value
+              for key, value in message.kwargs.items() if value is not None}
+    item = {"chat_id": message.chat_id, "text": message.text,
+            "priority": message.priority, "kwargs": kwargs}
+    json.dumps(item)  # несериализуемые параметры отсеиваются до записи файла
+    return item
+
+
+def confirm_offset(bot_token, offset):
+    """
+    Подтверждает Telegram получение обновлений до `offset` без ожидания новых.
+
+    Обычно offset подтверждается следующим запросом getUpdates. При остановке
+    следующего запроса нет, и без подтверждения последняя пачка пришла бы
+    повторно после запуска, хотя она уже обработана или сохранена.
+
+    Args:
+        bot_token (str): Токен бота.
+        offset (int): Номер, следующий за последним полученным обновлением.
+    """
+    # apihelper.get_updates заменяет long_polling_timeout=0 значением по умолчанию
+    # и ждал бы новых обновлений, поэтому запрос собирается напрямую
+    params = {'offset': offset, 'limit': 1, 'timeout': 5, 'long_polling_timeout': 0}
+    try:
+        apihelper._make_request(bot_token, 'getUpdates', params=params)
+    except Exception as e:
+        logger.error("Не удалось подтвердить полученные обновления: %s", e)
+
+
+def stop_intake(polling_thread, timeout, signal_bot=None):
+    """
+    Прекращает получение обновлений и ждет завершения потока polling.
+
+    Для `TeleBot` с `threaded=True` после остановки подтверждается offset:
+    все полученные обновления к этому моменту лежат в пуле потоков и будут
+    обработаны или сохранены `drain_worker_pool`.
+
+    Args:
+        polling_thread (threading.Thread): Поток получения обновлений.
+        timeout (float): Сколько секунд ждать завершения потока.
+        signal_bot (telebot.TeleBot): Бот, если обновления получает `infinity_polling`.
+    """
+    if signal_bot is not None:
+        signal_bot.stop_polling()
+    polling_thread.join(timeout)
+    if polling_thread.is_alive():
+        logger.warning(f"Поток получения обновлений не завершился за {timeout:.1f} с")
+        return
+    if signal_bot is not None and signal_bot.threaded and signal_bot.last_update_id:
+        confirm_offset(signal_bot.token, signal_bot.last_update_id + 1)
+
+
+def _pool_idle(worker_pool):
+    return worker_pool.tasks.empty() and all(
+        not worker.received_task_event.is_set() or worker.done_event.is_set()
+        or worker.exception_event.is_set()
+        for worker in worker_pool.workers)
+
+
+def drain_worker_pool(signal_bot, timeout, directory=PENDING_DIR):
+    """
+    Дожидается обработки обновлений, уже полученных `TeleBot`, и сохраняет остаток.
+
+    В режиме `threaded` TeleBot кладет полученные обновления в очередь своего
+    пула потоков. Что не успело обработаться до истечения `timeout`, снимается
+    с очереди и сохраняется как обновления для обработки после запуска.
+    Сохраняются сообщения и нажатия кнопок (у остальных типов TeleBot не
+    хранит исходный JSON), остальное считается потерянным.
+
+    Args:
+        signal_bot (telebot.TeleBot): Бот с `threaded=True` после `stop_polling`.
+        timeout (float): Сколько секунд ждать обработки.
+        directory (str): Директория для сохранения.
+
+    Returns:
+        dict: Количество сохраненных (`persisted`) обновлений и потерянных
+            (`dropped`), включая обработчики, не завершившиеся к дедлайну.
+    """
+    worker_pool = signal_bot.worker_pool
+    deadline = time.monotonic() + timeout
+    while not _pool_idle(worker_pool) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    # Обработчик, не завершившийся к дедлайну, прервать нельзя: он доработает
+    # в фоне, но его результат (например, ответ в очередь) может потеряться
+    dropped = sum(1 for worker in worker_pool.workers
+                  if worker.received_task_event.is_set() and not worker.done_event.is_set()
+                  and not worker.exception_event.is_set())
+    for worker in worker_pool.workers:
+        worker.stop()
+    leftovers = []
+    while True:
+        try:
+            _, args, kwargs = worker_pool.tasks.get_nowait()
+        except queue.Empty:
+            break
+        update_type = kwargs.get("update_type")
+        raw = getattr(args[0], "json", None) if args else None
+        if isinstance(raw, dict) and update_type:
+            # Исходный update_id неизвестен; offset уже подтвержден, поэтому он не нужен
+            leftovers.append({"update_id": 0, update_type: raw})
+        else:
+            dropped += 1
+    return {"persisted": save_pending("updates", leftovers, directory), "dropped": dropped}
+
+
+def drain_outbound(dispatcher, timeout, directory=PENDING_DIR):
+    """
+    Дожидается отправки очереди исходящих сообщений и сохраняет остаток.
+
+    Сообщения рассылок (`checkpointed`) не сохраняются: рассылка повторит их
+    по своему чекпоинту. Остальные сообщения с `send_func` (например, отправка
+    файла) сохранить нельзя, они считаются потерянными.
+
+    Args:
+        dispatcher (send_queue.OutboundDispatcher): Очередь исходящих сообщений.
+        timeout (float): Сколько секунд ждать отправки.
+        directory (str): Директория для сохранения.
+
+    Returns:
+        dict: Количество сохраненных (`persisted`), потерянных (`dropped`) и
+            оставленных рассылкам (`deferred_to_checkpoint`) сообщений.
+    """
+    deadline = time.monotonic() + timeout
+    dispatcher.join(timeout)
+    # Остановка ждет начатые отправки не дольше дедлайна и возвращает в очередь
+    # сообщения, переданные пулу, но не начавшие отправку
+    dispatcher.stop(max(0.0, deadline - time.monotonic()))
+    # Отправки, не завершившиеся к дедлайну, потеряны
+    dropped = dispatcher.metrics()["in_flight"]
+    leftovers, deferred = [], 0
+    for message in dispatcher.take_pending():
+        if message.checkpointed:
+            deferred += 1
+            continue
+        if message.send_func is not None:
+            dropped += 1
+            continue
+        try:
+            leftovers.append(_outbound_to_json(message))
+        except (TypeError, ValueError):
+            dropped += 1
+    return {"persisted": save_pending("outbound", leftovers, directory), "dropped": dropped,
+            "deferred_to_checkpoint": deferred}
+
+
+class ShutdownManager:
+    """
+    Остановка бота по этапам с общим ограничением времени.
+
+    Этапы выполняются по порядку: прекратить прием обновлений, дообработать
+    уже полученные, дождаться ответов и исходящих сообщений и сохранить то,
+    что не успело завершиться. Каждый этап получает оставшееся до дедлайна
+    время, поэтому остановка занимает не больше `deadline` секунд (плюс время
+    на сохранение остатка), а работа, не уложившаяся в срок, сохраняется на
+    диск и выполняется после следующего запуска.
+
+    Атрибуты:
+        deadline (float): Время на всю остановку, в секундах.
+        report (dict): Итоги последней остановки: время и результаты этапов.
+    """
+    def __init__(self, deadline=DEFAULT_SHUTDOWN_DEADLINE):
+        self.deadline = deadline
+        self.report = None
+        self._stages = []
+
+    def stage(self, name, drain):
+        """
+        Добавляет этап остановки.
+
+        Args:
+            name (str): Название этапа для лога.
+            drain (callable): Функция, принимающая оставшееся время в секундах и
+                возвращающая None или словарь с `persisted` и `dropped`.
+        """
+        self._stages.append((name, drain))
+
+    def run(self):
+        """
+        Выполняет этапы остановки и пишет итоги в лог.
+
+        Ошибка одного этапа не прерывает остальные.
+
+        Returns:
+            dict: Время остановки, количество сохраненной и потерянной работы по этапам.
+        """
+        started = time.monotonic()
+        deadline = started + self.deadline
+        report = {"seconds": 0.0, "persisted": 0, "dropped": 0, "stages": {}}
+        for name, drain in self._stages:
+            stage_started = time.monotonic()
+            try:
+                result = drain(max(0.0, deadline - stage_started)) or {}
+            except Exception as e:
+                logger.error(f"Ошибка на этапе остановки {name}: {e}")
+                result = {"error": str(e)}
+            result["seconds"] = round(time.monotonic() - stage_started, 3)
+            report["stages"][name] = result
+            report["persisted"] += result.get("persisted", 0)
+            report["dropped"] += result.get("dropped", 0)
+        report["seconds"] = round(time.monotonic() - started, 3)
+        self.report = report
+        level = logger.warning if report["dropped"] else logger.info
+        level(f"Остановка заняла {report['seconds']} с (дедлайн {self.deadline} с), "
+              f"сохранено для следующего запуска: {report['persisted']}, "
+              f"потеряно: {report['dropped']}. Этапы: {report['stages']}")
+        return report
+
+
+def load_shutdown_settings(bot_settings):
+    """
+    Возвращает настройки остановки из секции `shutdown` настроек бота.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки со значениями по умолчанию.
+    """
+    shutdown = bot_settings.get('shutdown', {})
+    return {
+        'deadline': shutdown.get('deadline', DEFAULT_SHUTDOWN_DEADLINE),
+    }
@@ -1,16 +1,196 @@
 #  Содержание logger.py
 
+import atexit
+import gzip
+import inspect
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from functools import wraps
 import os
+import random
 
-# Путь к директории логов
-LOG_DIR = r"f:\code\logs\TGM_Pattern"
-LOG_FILE = os.path.join(LOG_DIR, "bot_log.log")
+# Путь к директории логов (переопределяется переменной окружения TGM_LOG_DIR)
+LOG_DIR = os.environ.get(
+    'TGM_LOG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs'))
+# Имя файла лога (переопределяется TGM_LOG_FILE, например для рабочих процессов)
+LOG_FILE = os.path.join(LOG_DIR, os.environ.get('TGM_LOG_FILE', "bot_log.jsonl"))
 
-# Создаем директорию для логов, если она не существует
-os.makedirs(LOG_DIR, exist_ok=True)
+# Размер очереди записей между потоками бота и потоком записи логов
+LOG_QUEUE_SIZE = int(os.environ.get('TGM_LOG_QUEUE_SIZE', 10000))
+# Сколько ждать места в переполненной очереди для записей WARNING и выше, в секундах
+LOG_OVERFLOW_TIMEOUT = 0.05
+# Сжимать ли ротированные файлы логов в gzip (переменная окружения TGM_LOG_GZIP=0 отключает)
+LOG_GZIP_ROTATED = os.environ.get('TGM_LOG_GZIP', '1') != '0'
+# Сбрасывать буфер файла не реже, чем раз в столько записей или секунд
+LOG_FLUSH_EVERY = 256
+LOG_FLUSH_INTERVAL = 1.0
+
+# Уровень и доля логируемых вызовов для декоратора log_function_call
+LOG_CALL_LEVEL = logging.DEBUG
+LOG_CALL_SAMPLE_RATE = 1.0
+
+# Максимальная длина repr аргумента, не имеющего специального описания
+MAX_ARG_REPR_LENGTH = 100
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Форматирует запись лога как одну строку JSON."""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+                  + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    QueueHandler с ограниченной очередью и политикой переполнения.
+
+    Потоки бота только кладут запись в очередь. Если очередь заполнена,
+    записи ниже WARNING отбрасываются сразу, а WARNING и выше ждут место
+    не дольше `LOG_OVERFLOW_TIMEOUT` секунд. Количество отброшенных записей
+    хранится в `dropped` и периодически сообщается в лог потоком записи.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Подставляем аргументы в сообщение сразу: объекты, переданные в лог,
+        # могут измениться до того, как запись будет обработана в другом потоке
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if record.levelno >= logging.WARNING:
+                try:
+                    self.queue.put(record, timeout=LOG_OVERFLOW_TIMEOUT)
+                    return
+                except queue.Full:
+                    pass
+            self.dropped += 1
+
+
+class BatchingRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler, сбрасывающий буфер на диск пачками.
+
+    Вместо `flush` после каждой записи буфер сбрасывается раз в
+    `LOG_FLUSH_EVERY` записей, раз в `LOG_FLUSH_INTERVAL` секунд или когда
+    очередь логов опустела. Ротированные файлы при необходимости сжимаются
+    в gzip в фоновом потоке, не задерживая запись новых логов.
+
+    Директория и файл создаются при первой записи (в потоке записи логов),
+    а не при импорте `logger`.
+    """
+    def __init__(self, *args, gzip_rotated=False, **kwargs):
+        kwargs.setdefault('delay', True)
+        super().__init__(*args, **kwargs)
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._compressor = None
+        if gzip_rotated:
+            self.namer = lambda name: name + ".gz"
+            self.rotator = self._rotate_gzip
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+    def _rotate_gzip(self, source, dest):
+        # Быстро переименовываем файл, а сжимаем уже в фоне
+        temp_path = f"{source}.{time.time_ns()}.rotating"
+        os.rename(source, temp_path)
+        if self._compressor is None:
+            self._compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-gzip")
+        self._compressor.submit(self._compress, temp_path, dest)
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+            self._pending += 1
+            if (self._pending >= LOG_FLUSH_EVERY
+                    or time.monotonic() - self._last_flush >= LOG_FLUSH_INTERVAL):
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        super().flush()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        super().close()
+        if self._compressor is not None:
+            self._compressor.shutdown(wait=True)
+
+
+class BatchingQueueListener(QueueListener):
+    """
+    QueueListener, сбрасывающий буферы хендлеров, когда очередь опустела,
+    и сообщающий о записях, отброшенных при переполнении очереди.
+    """
+    def __init__(self, log_queue, queue_handler, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self._reported_dropped = 0
+
+    def dequeue(self, block):
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            if not block:
+                raise
+        dropped = self.queue_handler.dropped
+        if dropped != self._reported_dropped:
+            self.handle(logging.LogRecord(
+                self.queue_handler.name, logging.WARNING, __file__, 0,
+                "Очередь логов переполнена, отброшено записей: %s",
+                (dropped - self._reported_dropped,), None))
+            self._reported_dropped = dropped
+        for handler in self.handlers:
+            handler.flush()
+        return self.queue.get(block)
+
+    def enqueue_sentinel(self):
+        # Очередь может быть заполнена: ждем, пока поток записи освободит место
+        self.queue.put(self._sentinel)
+
+
+_listener = None
+_listener_lock = threading.Lock()
 
 
 # Настройка логгера
@@ -18,9 +198,12 @@ def setup_logger(name='bot_logger'):
     """
     Настраивает и возвращает логгер с указанным именем.
 
-    Этот логгер настроен для вывода логов как в файл с ротацией,
-    так и в консоль. Ротация файлов происходит при достижении
-    размера 50 МБ, при этом сохраняется до 5 резервных файлов.
+    Потоки бота только кладут записи в ограниченную очередь (`DroppingQueueHandler`),
+    а запись в файл и в консоль выполняет отдельный поток `BatchingQueueListener`.
+    В файл логи пишутся построчно в формате JSON с пакетным сбросом на диск.
+    Ротация файлов происходит при достижении размера 50 МБ, при этом сохраняется
+    до 5 резервных файлов, которые сжимаются в gzip в фоне. Файл открывается
+    при первой записи, поэтому импорт `logger` не обращается к диску.
 
     Args:
         name (str): Имя логгера. По умолчанию 'bot_logger'.
@@ -28,46 +211,124 @@ def setup_logger(name='bot_logger'):
     Returns:
         logging.Logger: Настроенный экземпляр логгера.
     """
+    global _listener
 
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
 
-    # Хендлер для вывода логов в файл с ротацией
-    file_handler = RotatingFileHandler(
-        LOG_FILE,
-        maxBytes=50 * 1024 * 1024,  # Ротация при достижении 50 МБ
-        backupCount=5,               # Хранить до 5 резервных файлов
-        encoding='utf-8'
-    )
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-
-    # Хендлер для вывода логов в терминал
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-
     # Добавляем хендлеры к логгеру, если они еще не добавлены
-    # if not logger.handlers:
-    if not logger.hasHandlers():
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+    with _listener_lock:
+        if logger.hasHandlers():
+            return logger
+
+        # Хендлер для вывода логов в файл с ротацией
+        file_handler = BatchingRotatingFileHandler(
+            LOG_FILE,
+            maxBytes=50 * 1024 * 1024,  # Ротация при достижении 50 МБ
+            backupCount=5,               # Хранить до 5 резервных файлов
+            encoding='utf-8',
+            gzip_rotated=LOG_GZIP_ROTATED
+        )
+        file_handler.setFormatter(JsonLinesFormatter())
+
+        # Хендлер для вывода логов в терминал
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        queue_handler = DroppingQueueHandler(log_queue)
+        queue_handler.name = name
+        logger.addHandler(queue_handler)
+
+        _listener = BatchingQueueListener(log_queue, queue_handler, file_handler, console_handler)
+        _listener.start()
+        atexit.register(shutdown_logging)
 
     return logger
 
 
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи и закрывает файлы логов."""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
 # Инициализируем основной логгер
 logger = setup_logger()
 
 
+def configure_call_logging(level=None, sample_rate=None):
+    """
+    Настраивает логирование вызовов функций декоратором `log_function_call`.
+
+    Args:
+        level (int | str): Уровень логирования вызовов (например, logging.DEBUG или 'INFO').
+        sample_rate (float): Доля логируемых вызовов от 0 до 1.
+    """
+    global LOG_CALL_LEVEL, LOG_CALL_SAMPLE_RATE
+    if level is not None:
+        LOG_CALL_LEVEL = logging.getLevelName(level) if isinstance(level, str) else level
+    if sample_rate is not None:
+        LOG_CALL_SAMPLE_RATE = max(0.0, min(1.0, float(sample_rate)))
+
+
+def summarize_arg(arg):
+    """
+    Возвращает краткое описание аргумента для лога.
+
+    Для сообщений и нажатий на кнопки вместо полного `repr` объекта
+    выводятся только идентификаторы и тип контента.
+
+    Args:
+        arg: Аргумент вызова.
+
+    Returns:
+        str: Краткое описание аргумента.
+    """
+    content_type = getattr(arg, 'content_type', None)
+    chat = getattr(arg, 'chat', None)
+    if content_type is not None and chat is not None:
+        from_user = getattr(arg, 'from_user', None)
+        user_id = from_user.id if from_user else None
+        return f"Message(id={arg.message_id}, chat={chat.id}, user={user_id}, type={content_type})"
+    if arg.__class__.__name__ == 'CallbackQuery':
+        return f"CallbackQuery(id={arg.id}, user={arg.from_user.id}, data={arg.data!r})"
+    text = repr(arg)
+    if len(text) > MAX_ARG_REPR_LENGTH:
+        text = text[:MAX_ARG_REPR_LENGTH] + "..."
+    return text
+
+
+class _CallArguments:
+    """Аргументы вызова, которые форматируются только при записи в лог."""
+    __slots__ = ('args', 'kwargs')
+
+    def __init__(self, args, kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        parts = [summarize_arg(arg) for arg in self.args]
+        parts.extend(f"{key}={summarize_arg(value)}" for key, value in self.kwargs.items())
+        return ", ".join(parts)
+
+
 # Декоратор для логирования вызова функции
 def log_function_call(func):
     """
     Декоратор для логирования вызовов функций.
 
-    При декорировании функции этот декоратор автоматически
-    записывает в лог информацию о вызове функции, включая
-    имя функции, переданные позиционные и именованные аргументы.
+    При декорировании функции этот декоратор записывает в лог имя функции
+    и краткое описание аргументов (см. `summarize_arg`). Форматирование
+    выполняется лениво, только если запись действительно попадет в лог.
+    Уровень и доля логируемых вызовов задаются `configure_call_logging`.
 
     Args:
         func (callable): Функция, которую необходимо декорировать.
@@ -75,9 +336,24 @@ def log_function_call(func):
     Returns:
         callable: Обёрнутая функция с добавленным логированием.
     """
+    name = func.__name__
+
+    def log_call(args, kwargs):
+        if logger.isEnabledFor(LOG_CALL_LEVEL) and (
+                LOG_CALL_SAMPLE_RATE >= 1.0 or random.random() < LOG_CALL_SAMPLE_RATE):
+            logger.log(LOG_CALL_LEVEL, "Вызов функции %s с аргументами: %s",
+                       name, _CallArguments(args, kwargs))
+
+    if inspect.iscoroutinefunction(func):
+        # Обработчики асинхронного режима (async_bot.py)
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            log_call(args, kwargs)
+            return await func(*args, **kwargs)
+        return async_wrapper
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        logger.info(
-            f"Вызов функции {func.__name__} с аргументами: {args} и именованными аргументами: {kwargs}")
+        log_call(args, kwargs)
         return func(*args, **kwargs)
     return wrapper
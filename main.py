@@ -1,13 +1,14 @@
 # Содержание main.py
 
 import telebot
-import json
 import threading
 from datetime import datetime
 import time
+import signal
+import os
 import sys
-from logger import logger
-from watchdog_monitoring import start_watchdog
+from logger import logger, configure_call_logging
+from config import ConfigError, load_config
 
 # Переменные для мониторинга и перезапуска
 bot_update_types = [
@@ -16,19 +17,16 @@ bot_update_types = [
     "chat_join_request",
 ]
 
-file_list = ['main.py', 'logger.py', 'bot.py',
-             'watchdog_monitoring.py']  # Список файлов для мониторинга
+file_list = ['main.py', 'logger.py', 'bot.py', 'async_bot.py',
+             'webhook_server.py', 'send_queue.py', 'broadcast.py', 'hot_reload.py',
+             'sharding.py', 'update_store.py', 'commands.py', 'templates.py',
+             'metrics.py', 'http_session.py', 'keyboards.py', 'lifecycle.py', 'state_store.py',
+             'config.py', 'media.py', 'watchdog_monitoring.py']  # Список файлов для мониторинга
+# Директория проекта: пути из file_list отсчитываются от нее, а не от текущей директории
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
-def load_bot_token():
-    '''Функция для загрузки токена'''
-    logger.info("Загрузка токена бота")
-    with open('settings/key.json', 'r') as file:
-        config = json.load(file)
-    return config['tgm_bots']['SendingTradeSignal_Bot']['tgm_bot_token']
-
-
-def run_bot_polling(signal_bot, max_retries=5, base_delay=5):
+def run_bot_polling(signal_bot, max_retries=5, base_delay=5, stop_event=None):
     """
     Функция для запуска infinity_polling в отдельном потоке с обработкой ошибок и ограничением на количество повторных попыток.
 
@@ -36,7 +34,10 @@ def run_bot_polling(signal_bot, max_retries=5, base_delay=5):
         signal_bot (telebot.TeleBot): Экземпляр бота, используемый для polling.
         max_retries (int): Максимальное количество попыток переподключения.
         base_delay (int): Начальная задержка перед переподключением, в секундах.
+        stop_event (threading.Event): Событие остановки, прерывающее ожидание перед переподключением.
     """
+    from metrics import POLLING_RETRIES
+
     retry_count = 0
     delay = base_delay
 
@@ -52,6 +53,7 @@ def run_bot_polling(signal_bot, max_retries=5, base_delay=5):
             break  # Успешный запуск - выходим из цикла
         except Exception as e:
             retry_count += 1
+            POLLING_RETRIES.inc()
             logger.error(
                 f"Ошибка в работе бота: {e}. Попытка {retry_count} из {max_retries}")
             if retry_count >= max_retries:
@@ -59,7 +61,10 @@ def run_bot_polling(signal_bot, max_retries=5, base_delay=5):
                     "Достигнуто максимальное количество попыток. Бот остановлен.")
                 break
             # Экспоненциальная задержка с увеличением интервала
-            time.sleep(delay)
+            if stop_event is not None and stop_event.wait(delay):
+                break
+            if stop_event is None:
+                time.sleep(delay)
             # Ограничиваем задержку максимум до 60 секунд
             delay = min(delay * 2, 60)
 
@@ -68,40 +73,219 @@ def run_bot_polling(signal_bot, max_retries=5, base_delay=5):
             "Не удалось восстановить соединение. Остановка работы бота.")
 
 
-def run_signal_bot(stop_event, restart_event):
-    """Запуск бота и обработка остановки."""
+def run_signal_bot(stop_event, restart_event, reload_event=None, config=None):
+    """Запуск бота и обработка остановки.
+
+    Если передан `reload_event`, обработчики перезагружаются без остановки
+    polling при каждой установке события (режимы threaded и webhook).
+    `config` - настройки из `config.load_config` (по умолчанию загружаются здесь).
+    """
+    # Модули подсистем импортируются только в режимах, которые их используют
+    from lifecycle import (
+        ShutdownManager, drain_outbound, drain_worker_pool, load_shutdown_settings,
+        restore_outbound, restore_updates, stop_intake
+    )
+    from metrics import MetricsServer, configure_metrics, instrument_bot_api, load_metrics_settings
+
     logger.info(f"{datetime.now()} Запуск бота - signal_bot")
-    bot_token = load_bot_token()
-    signal_bot = telebot.TeleBot(bot_token)
+    config = config or load_config()
+    bot_token = config.token
+    bot_settings = config.settings
+    runtime = config.runtime
+    if config.api_url:
+        telebot.apihelper.API_URL = config.api_url
+    if config.file_url:
+        telebot.apihelper.FILE_URL = config.file_url
+    logging_settings = bot_settings.get('logging', {})
+    configure_call_logging(level=logging_settings.get('call_level'),
+                           sample_rate=logging_settings.get('call_sample_rate'))
+    shutdown_settings = load_shutdown_settings(bot_settings)
+    dispatcher = None
+    responder = None
+    update_store = None
+    state_store = None
+    media = None
+    metrics_server = None
+    metrics_settings = load_metrics_settings(bot_settings)
+    configure_metrics(metrics_settings['enabled'])
+    if metrics_settings['enabled']:
+        instrument_bot_api()
+        try:
+            metrics_server = MetricsServer(metrics_settings['listen'], metrics_settings['port']).start()
+        except OSError as e:
+            logger.error(f"Не удалось запустить сервер метрик: {e}")
+    from http_session import PREWARM_TIMEOUT, install_session_layer, load_http_settings, prewarm
+    # Общий пул keep-alive соединений для всех потоков бота (в async режиме - для
+    # очереди исходящих, ответов на нажатия и вложений; polling идет через aiohttp)
+    install_session_layer(**load_http_settings(bot_settings))
+    handler_bot = None  # бот, на котором зарегистрированы обработчики из bot.py
 
-    from bot import register_handlers
-    register_handlers(signal_bot)
-    logger.info("Бот инициализирован и обработчики зарегистрированы")
+    if runtime['mode'] == 'async':
+        from async_bot import run_async_bot
+        from send_queue import create_dispatcher, load_outbound_settings
+        from keyboards import create_responder, load_callback_settings
+        from state_store import create_state_store, load_state_settings
+        from media import create_media_pipeline, load_media_settings
+        # Подсистемы работают в своих потоках через синхронный бот, а асинхронные
+        # обработчики только ставят в них работу
+        sender_bot = telebot.TeleBot(bot_token, threaded=False)
+        dispatcher = create_dispatcher(sender_bot, load_outbound_settings(bot_settings))
+        responder = create_responder(sender_bot, load_callback_settings(bot_settings))
+        state_store = create_state_store(load_state_settings(bot_settings))
+        media = create_media_pipeline(sender_bot, load_media_settings(bot_settings))
+        restore_outbound(sender_bot, dispatcher)
+        signal_bot = None
+        polling_thread = threading.Thread(
+            target=run_async_bot, args=(bot_token, stop_event),
+            kwargs={'allowed_updates': bot_update_types,
+                    'max_in_flight': runtime['async_max_in_flight'],
+                    'drain_timeout': shutdown_settings['deadline'],
+                    'api_url': config.api_url,
+                    'dispatcher': dispatcher, 'responder': responder,
+                    'state_store': state_store, 'media': media})
+    elif runtime['mode'] == 'sharded':
+        from sharding import run_sharded
+        # Обработчики регистрируются в рабочих процессах, см. sharding.py
+        signal_bot = None
+        polling_thread = threading.Thread(
+            target=run_sharded, args=(bot_token, bot_settings, stop_event),
+            kwargs={'allowed_updates': bot_update_types,
+                    'drain_timeout': shutdown_settings['deadline']})
+    elif runtime['mode'] == 'webhook':
+        from webhook_server import load_webhook_settings, run_webhook
+        from send_queue import create_dispatcher, load_outbound_settings
+        from keyboards import create_responder, load_callback_settings
+        from state_store import create_state_store, load_state_settings
+        from media import create_media_pipeline, load_media_settings
+        # Обработка идет в потоках webhook-сервера, пул потоков TeleBot не нужен
+        webhook_bot = telebot.TeleBot(bot_token, threaded=False)
+        warmup = prewarm(webhook_bot)
+        dispatcher = create_dispatcher(webhook_bot, load_outbound_settings(bot_settings))
+        responder = create_responder(webhook_bot, load_callback_settings(bot_settings))
+        state_store = create_state_store(load_state_settings(bot_settings))
+        media = create_media_pipeline(webhook_bot, load_media_settings(bot_settings))
 
-    # Запуск infinity_polling в отдельном потоке
-    polling_thread = threading.Thread(
-        target=run_bot_polling, args=(signal_bot,))
+        from bot import register_handlers, commands, catalog
+        register_handlers(webhook_bot, dispatcher, responder, state_store, media)
+        handler_bot = webhook_bot
+        logger.info("Бот инициализирован и обработчики зарегистрированы (webhook)")
+
+        signal_bot = None
+        polling_thread = threading.Thread(
+            target=run_webhook,
+            args=(webhook_bot, load_webhook_settings(bot_settings), stop_event),
+            kwargs={'allowed_updates': bot_update_types,
+                    'drain_timeout': shutdown_settings['deadline']})
+    else:
+        from update_store import load_inbound_settings
+        from send_queue import create_dispatcher, load_outbound_settings
+        from keyboards import create_responder, load_callback_settings
+        from state_store import create_state_store, load_state_settings
+        from media import create_media_pipeline, load_media_settings
+        inbound = load_inbound_settings(bot_settings)
+        # С надежным хранилищем обновление подтверждается после обработчиков,
+        # поэтому обработка идет синхронно в потоке polling
+        signal_bot = telebot.TeleBot(bot_token, threaded=not inbound['durable'])
+        warmup = prewarm(signal_bot)
+        dispatcher = create_dispatcher(signal_bot, load_outbound_settings(bot_settings))
+        responder = create_responder(signal_bot, load_callback_settings(bot_settings))
+        state_store = create_state_store(load_state_settings(bot_settings))
+        media = create_media_pipeline(signal_bot, load_media_settings(bot_settings))
+
+        from bot import register_handlers, commands, catalog
+        register_handlers(signal_bot, dispatcher, responder, state_store, media)
+        handler_bot = signal_bot
+        logger.info("Бот инициализирован и обработчики зарегистрированы")
+
+        if inbound['durable']:
+            from update_store import UpdateStore, run_durable_polling
+            update_store = UpdateStore(inbound['path'], ack_batch=inbound['ack_batch'],
+                                       synchronous=inbound['synchronous'])
+            polling_thread = threading.Thread(
+                target=run_durable_polling, args=(signal_bot, update_store, stop_event),
+                kwargs={'allowed_updates': bot_update_types,
+                        'batch_size': inbound['batch_size'],
+                        'retention_seconds': inbound['retention_seconds']})
+        else:
+            # Запуск infinity_polling в отдельном потоке
+            polling_thread = threading.Thread(
+                target=run_bot_polling, args=(signal_bot,), kwargs={'stop_event': stop_event})
+
+    if handler_bot is not None:
+        # get_me шел параллельно с инициализацией; имя бота нужно фильтру команд
+        warmup.join(PREWARM_TIMEOUT)
+        if handler_bot._user:
+            commands.bot_username = handler_bot._user.username
+        # Меню команд публикуется в фоне, не задерживая первое обновление
+        threading.Thread(target=commands.publish, args=(handler_bot, catalog.locales),
+                         name="publish-commands", daemon=True).start()
+        # Работа, не завершенная до прошлой остановки (см. lifecycle.py)
+        restore_outbound(handler_bot, dispatcher)
+        restore_updates(lambda update_json: handler_bot.process_new_updates(
+            [telebot.types.Update.de_json(update_json)]))
     polling_thread.start()
 
+    reload_thread = None
+    if reload_event is not None and handler_bot is not None:
+        from hot_reload import HandlerReloader
+        reloader = HandlerReloader(handler_bot, dispatcher=dispatcher, responder=responder,
+                                   state_store=state_store, media=media)
+        reload_thread = threading.Thread(
+            target=reloader.run, args=(reload_event, stop_event), daemon=True)
+        reload_thread.start()
+        logger.info("Горячая перезагрузка обработчиков включена")
+
     try:
-        while not stop_event.is_set():
-            time.sleep(1)
-            if restart_event.is_set():
-                logger.info("Перезапуск бота по событию restart_event")
-                stop_event.set()  # Ставим событие для остановки
+        # Перезапуск тоже устанавливает stop_event (см. watchdog_monitoring.py)
+        stop_event.wait()
+        if restart_event.is_set():
+            logger.info("Перезапуск бота по событию restart_event")
 
     except Exception as e:
         logger.error(
             f"Ошибка при перезапуске бота по событию restart_event: {e}")
     finally:
-        logger.info("Вызов stop_polling() для завершения работы бота")
-        signal_bot.stop_polling()
-        polling_thread.join()  # Ожидание завершения потока polling
+        # Остановка по этапам с общим дедлайном: прием обновлений, обработчики,
+        # нажатия кнопок, исходящие сообщения. Что не успело - сохраняется на диск
+        shutdown = ShutdownManager(shutdown_settings['deadline'])
+        shutdown.stage("inbound", lambda timeout: stop_intake(polling_thread, timeout, signal_bot))
+        if signal_bot is not None and signal_bot.threaded:
+            shutdown.stage("handlers", lambda timeout: drain_worker_pool(signal_bot, timeout))
+        if responder is not None:
+            logger.info(f"Метрики ответов на нажатия кнопок: {responder.metrics()}")
+            shutdown.stage("callbacks", lambda timeout: {"dropped": responder.stop(timeout)})
+        if media is not None:
+            logger.info(f"Метрики скачивания вложений: {media.metrics()}")
+            shutdown.stage("media", lambda timeout: {"dropped": media.stop(timeout)})
+        if dispatcher is not None:
+            logger.info(f"Метрики очереди исходящих сообщений: {dispatcher.metrics()}")
+            shutdown.stage("outbound", lambda timeout: drain_outbound(dispatcher, timeout))
+        if state_store is not None:
+            shutdown.stage("state", lambda timeout: state_store.close())
+        if update_store is not None:
+            def close_update_store(timeout):
+                logger.info(f"Хранилище входящих обновлений: {update_store.stats}")
+                persisted = update_store.pending_count()  # дообработаются после запуска
+                update_store.close()
+                return {"persisted": persisted}
+            shutdown.stage("update_store", close_update_store)
+        shutdown.run()
+        if reload_thread is not None:
+            reload_event.set()  # будим поток перезагрузки, чтобы он увидел stop_event
+            reload_thread.join()
+        if metrics_server is not None:
+            metrics_server.stop()
         logger.info("Бот остановлен и поток polling завершен.")
 
 
 if __name__ == "__main__":
     logger.info("-- Запуск телеграм бота --")
+    # SIGTERM (systemd, docker stop) останавливает бота так же, как CTRL+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    # watchdog нужен только при запуске из командной строки, а не при импорте main
+    from watchdog_monitoring import start_watchdog
+    stop_event = restart_event = None
+    thread_bot = thread_watchdog = None
     try:
         while True:
             logger.info(
@@ -109,26 +293,42 @@ if __name__ == "__main__":
             stop_event = threading.Event()
             restart_event = threading.Event()
 
+            # Настройки проверяются до запуска потоков; неизменившийся файл не читается повторно
+            try:
+                config = load_config()
+            except ConfigError as e:
+                logger.error(f"Ошибка в настройках бота: {e}")
+                sys.exit(1)
+
+            # Горячая перезагрузка обработчиков не поддерживается в режимах async и sharded
+            reload_settings = config.reload
+            reload_event = None
+            if reload_settings['mode'] == 'hot' and config.runtime['mode'] not in ('async', 'sharded'):
+                reload_event = threading.Event()
+
             # Запуск watchdog в отдельном потоке
             thread_watchdog = threading.Thread(
-                target=start_watchdog, args=(file_list, restart_event, stop_event), daemon=True)
+                target=start_watchdog, args=(file_list, restart_event, stop_event),
+                kwargs={'reload_event': reload_event,
+                        'reload_files': reload_settings['hot_files'],
+                        'base_dir': PROJECT_DIR},
+                daemon=True)
             thread_watchdog.start()
             logger.info("Watchdog поток запущен")
 
             # Запуск бота
             thread_bot = threading.Thread(
-                target=run_signal_bot, args=(stop_event, restart_event))
+                target=run_signal_bot, args=(stop_event, restart_event, reload_event),
+                kwargs={'config': config})
             thread_bot.start()
             logger.info("Бот поток запущен")
 
-            # Ожидание сигналов
-            while not stop_event.is_set() and not restart_event.is_set():
-                time.sleep(1)
+            # Ожидание сигналов: watchdog ставит restart_event вместе со stop_event
+            stop_event.wait()
 
             if restart_event.is_set():
                 logger.info(
-                    "Получен сигнал перезапуска (restart_event). Устанавливаем stop_event для остановки бота.")
-                stop_event.set()
+                    "Получен сигнал перезапуска (restart_event). Ожидание остановки бота.")
 
             logger.info("Ожидание завершения потоков bot и watchdog")
             thread_bot.join()
@@ -145,12 +345,15 @@ if __name__ == "__main__":
 
     except KeyboardInterrupt:
         logger.info("Завершение работы по CTRL+C.")
-        stop_event.set()
-        restart_event.set()
+        # Потоки и события могут быть еще не созданы, если сигнал пришел при запуске
+        if stop_event is not None:
+            stop_event.set()
+            restart_event.set()
 
         logger.info("Ожидание завершения потоков bot и watchdog после CTRL+C")
-        thread_bot.join()
-        thread_watchdog.join()
+        for thread in (thread_bot, thread_watchdog):
+            if thread is not None:
+                thread.join()
         sys.exit(0)
 
     logger.info("Работа программы завершена.")
@@ -0,0 +1,571 @@
+#  Содержание media.py
+
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from telebot import apihelper
+from logger import logger
+from metrics import Gauge
+
+try:
+    import fcntl  # блокировка файла кеша file_id между процессами (нет в Windows)
+except ImportError:
+    fcntl = None
+
+# Типы контента с файлом, которые может скачивать конвейер
+MEDIA_CONTENT_TYPES = ('photo', 'audio', 'document', 'video', 'voice', 'animation')
+# Bot API отдает через getFile файлы не больше 20 МБ
+BOT_API_DOWNLOAD_LIMIT = 20 * 1024 * 1024
+# Адрес файлов Bot API, если apihelper.FILE_URL не задан (как в apihelper.download_file)
+DEFAULT_FILE_URL = "https://api.telegram.org/file/bot{0}/{1}"
+# Таймауты (подключение, чтение очередной части) при скачивании файла, в секундах
+DOWNLOAD_TIMEOUT = (5, 60)
+
+_SAFE_NAME = re.compile(r'^[\w-]+$')
+
+
+def attachment_of(message, content_type=None):
+    """
+    Возвращает файл вложения сообщения (для фото - самый большой размер).
+
+    Args:
+        message (telebot.types.Message): Сообщение.
+        content_type (str): Тип вложения. По умолчанию `message.content_type`.
+
+    Returns:
+        Объект файла (`PhotoSize`, `Document`, `Audio` и т.д.) или None.
+    """
+    content_type = content_type or message.content_type
+    if content_type not in MEDIA_CONTENT_TYPES:
+        return None
+    content = getattr(message, content_type, None)
+    if content_type == 'photo':
+        return content[-1] if content else None
+    return content
+
+
+def _extension(content_type, attachment):
+    if content_type == 'photo':
+        return '.jpg'
+    file_name = getattr(attachment, 'file_name', None)
+    if file_name:
+        extension = os.path.splitext(file_name)[1]
+        if _SAFE_NAME.match(extension[1:]):
+            return extension.lower()
+    mime_type = getattr(attachment, 'mime_type', None)
+    return (mimetypes.guess_extension(mime_type) or '') if mime_type else ''
+
+
+class FileIdCache:
+    """
+    `file_id` файлов, уже загруженных в Telegram, по хешу содержимого.
+
+    Файл с тем же содержимым отправляется по `file_id` без повторной загрузки
+    байтов: при рассылке графика тысячам чатов файл загружается один раз.
+    Пока идет первая загрузка, остальные отправки того же файла ждут ее
+    `file_id`, а не загружают файл параллельно. Кеш пополняется и
+    скачанными входящими файлами (см. `MediaPipeline`) и хранится в JSON-файле
+    `path`, поэтому переживает перезапуск. Файл могут делить несколько
+    процессов (режим `sharded`): запись идет под блокировкой файла
+    `<path>.lock`, кеш перед записью объединяется с содержимым файла и
+    пишется через временный файл своего процесса.
+
+    Атрибуты:
+        path (str | None): Файл кеша. None - только в памяти.
+        stats (dict): Количество загрузок файлов и отправок по `file_id`.
+    """
+    def __init__(self, path=None):
+        """
+        Инициализирует FileIdCache и загружает сохраненные `file_id`.
+
+        Args:
+            path (str): Файл кеша (JSON).
+        """
+        self.path = path
+        self.stats = {"uploads": 0, "reused": 0}
+        self._ids = {}        # "тип:sha256" -> file_id
+        self._digests = {}    # путь -> (mtime_ns, размер, sha256)
+        self._uploading = {}  # "тип:sha256" -> threading.Event
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # запись файла кеша, вне self._lock
+        if path:
+            self._ids = self._load()
+
+    def _load(self):
+        """Читает сохраненные `file_id`; пустой словарь, если файла нет или он поврежден."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                ids = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось загрузить кеш file_id {self.path}: {e}")
+            return {}
+        return ids if isinstance(ids, dict) else {}
+
+    def digest(self, path):
+        """
+        SHA-256 содержимого файла (пересчитывается, только если файл изменился).
+
+        Args:
+            path (str): Путь к файлу.
+
+        Returns:
+            str: Хеш в шестнадцатеричном виде.
+        """
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        with self._lock:
+            self._digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    def get(self, content_type, digest):
+        """Возвращает `file_id` файла с хешем `digest` или None."""
+        with self._lock:
+            return self._ids.get(f"{content_type}:{digest}")
+
+    def remember(self, content_type, digest, file_id):
+        """
+        Запоминает `file_id` файла с хешем `digest`.
+
+        Args:
+            content_type (str): Тип файла (`photo`, `document`, ...): `file_id`
+                отправляется методом того же типа.
+            digest (str): SHA-256 содержимого.
+            file_id (str): Идентификатор файла в Telegram.
+        """
+        key = f"{content_type}:{digest}"
+        with self._lock:
+            if self._ids.get(key) == file_id:
+                return
+            self._ids[key] = file_id
+            snapshot = dict(self._ids) if self.path else None
+        if snapshot is None:
+            return
+        # Файл пишется вне self._lock, чтобы отправки не ждали диск
+        with self._save_lock:
+            merged = self._save(snapshot)
+        with self._lock:
+            for key, file_id in merged.items():
+                self._ids.setdefault(key, file_id)
+
+    def _save(self, ids):
+        """Объединяет `ids` с файлом кеша, записывает результат и возвращает его."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return self._merge_and_write(ids)
+
+    def _merge_and_write(self, ids):
+        # Другие процессы могли сохранить свои file_id с момента нашего чтения
+        for key, file_id in self._load().items():
+            ids.setdefault(key, file_id)
+        # Имя уникально для процесса и потока, как у частей скачиваемых файлов
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(ids, file)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.error(f"Не удалось сохранить кеш file_id {self.path}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        return ids
+
+    def send(self, signal_bot, chat_id, path, content_type='photo', **kwargs):
+        """
+        Отправляет файл в чат, загружая его в Telegram только в первый раз.
+
+        Args:
+            signal_bot (telebot.TeleBot): Экземпляр бота.
+            chat_id (int): Идентификатор чата.
+            path (str): Путь к локальному файлу.
+            content_type (str): Тип отправки: `photo`, `document`, `audio`,
+                `video`, `voice` или `animation` (метод `send_<тип>`).
+            **kwargs: Дополнительные параметры метода (caption, reply_markup и т.д.).
+
+        Returns:
+            telebot.types.Message: Отправленное сообщение.
+        """
+        send = getattr(signal_bot, f"send_{content_type}")
+        digest = self.digest(path)
+        key = f"{content_type}:{digest}"
+        while True:
+            with self._lock:
+                file_id = self._ids.get(key)
+                uploading = None if file_id else self._uploading.get(key)
+                owner = file_id is None and uploading is None
+                if owner:
+                    uploading = self._uploading[key] = threading.Event()
+            if file_id is not None:
+                with self._lock:
+                    self.stats["reused"] += 1
+                return send(chat_id, file_id, **kwargs)
+            if owner:
+                break
+            # Файл загружает другой поток; если загрузка не удастся, загрузим сами
+            uploading.wait()
+
+        try:
+            with open(path, 'rb') as file:
+                message = send(chat_id, file, **kwargs)
+            with self._lock:
+                self.stats["uploads"] += 1
+            attachment = attachment_of(message, content_type) or attachment_of(message)
+            if attachment is not None:
+                self.remember(content_type, digest, attachment.file_id)
+            return message
+        finally:
+            with self._lock:
+                self._uploading.pop(key, None)
+            uploading.set()
+
+
+class MediaPipeline:
+    """
+    Скачивание вложений входящих сообщений в пуле потоков.
+
+    Файл скачивается потоком частями по `chunk_size` байт во временный файл,
+    который после загрузки переименовывается: в памяти не держится больше
+    одной части, а недокачанный файл не виден обработчикам. Файлы хранятся в
+    `directory` под именем `file_unique_id`, поэтому одно и то же вложение
+    (пересланный сигнал, тот же график в нескольких сообщениях) скачивается
+    один раз, даже если сообщения пришли одновременно. После скачивания для
+    каждого сообщения вызывается переданный в `submit` обработчик.
+
+    Атрибуты:
+        signal_bot (telebot.TeleBot): Экземпляр бота.
+        directory (str): Директория скачанных файлов.
+        content_types (frozenset): Типы вложений, которые скачиваются.
+        max_pending (int): Максимальное число файлов в очереди и в работе.
+        max_file_size (int): Максимальный размер файла, в байтах.
+        chunk_size (int): Размер части при скачивании, в байтах.
+        file_ids (FileIdCache): Кеш `file_id`, пополняемый скачанными файлами.
+        stats (dict): Количество скачанных, уже имевшихся на диске, объединенных
+            с уже идущей загрузкой, обработанных, пропущенных и неудачных вложений.
+    """
+    def __init__(self, signal_bot, directory="media", content_types=('photo', 'document'), workers=4,
+                 max_pending=100, max_file_size=BOT_API_DOWNLOAD_LIMIT, chunk_size=64 * 1024,
+                 file_ids=None):
+        """
+        Инициализирует MediaPipeline.
+
+        Args:
+            signal_bot (telebot.TeleBot): Экземпляр бота.
+            directory (str): Директория скачанных файлов.
+            content_types (iterable): Типы вложений из `MEDIA_CONTENT_TYPES`.
+            workers (int): Количество потоков скачивания.
+            max_pending (int): Максимальное число файлов в очереди и в работе.
+                Вложения сверх лимита отбрасываются с записью в лог.
+            max_file_size (int): Максимальный размер файла, в байтах.
+            chunk_size (int): Размер части при скачивании, в байтах.
+            file_ids (FileIdCache): Кеш `file_id` для скачанных файлов.
+        """
+        self.signal_bot = signal_bot
+        self.directory = directory
+        self.content_types = frozenset(content_types)
+        self.max_pending = max_pending
+        self.max_file_size = max_file_size
+        self.chunk_size = chunk_size
+        self.file_ids = file_ids
+        self.stats = {"downloaded": 0, "cached": 0, "deduplicated": 0, "processed": 0,
+                      "too_large": 0, "dropped": 0, "failed": 0}
+        self._waiting = {}  # file_unique_id -> [(сообщение, обработчик)], ждущие файла
+        self._stopping = False
+        self._active = 0    # задачи скачивания, выполняемые в данный момент
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media")
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, message):
+        """Путь, по которому хранится вложение сообщения."""
+        attachment = attachment_of(message)
+        unique_id = attachment.file_unique_id
+        if not _SAFE_NAME.match(unique_id):
+            unique_id = hashlib.sha256(unique_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, unique_id + _extension(message.content_type, attachment))
+
+    def submit(self, message, processor=None):
+        """
+        Ставит скачивание вложения сообщения в очередь.
+
+        Args:
+            message (telebot.types.Message): Сообщение с вложением.
+            processor (callable): Обработчик (сообщение, путь к файлу), вызывается
+                в потоке скачивания после того, как файл сохранен.
+
+        Returns:
+            str: `queued` - поставлено в очередь, `joined` - тот же файл уже
+            скачивается, `skipped` - нет вложения нужного типа, `too_large` -
+            файл больше `max_file_size`, `dropped` - очередь переполнена.
+        """
+        if message.content_type not in self.content_types:
+            return "skipped"
+        attachment = attachment_of(message)
+        if attachment is None:
+            return "skipped"
+        if attachment.file_size and attachment.file_size > self.max_file_size:
+            with self._cond:
+                self.stats["too_large"] += 1
+            logger.warning("Вложение %s (%s байт) больше лимита %s байт, не скачивается",
+                           attachment.file_unique_id, attachment.file_size, self.max_file_size)
+            return "too_large"
+        unique_id = attachment.file_unique_id
+        with self._cond:
+            if self._stopping:
+                self.stats["dropped"] += 1
+                return "dropped"
+            waiting = self._waiting.get(unique_id)
+            if waiting is not None:
+                waiting.append((message, processor))
+                self.stats["deduplicated"] += 1
+                return "joined"
+            if len(self._waiting) >= self.max_pending:
+                self.stats["dropped"] += 1
+                logger.warning("Очередь скачивания вложений переполнена, вложение %s отброшено", unique_id)
+                return "dropped"
+            self._waiting[unique_id] = [(message, processor)]
+        self._executor.submit(self._run, unique_id, message.content_type, attachment.file_id,
+                              self.path_for(message))
+        return "queued"
+
+    def _run(self, unique_id, content_type, file_id, path):
+        with self._cond:
+            self._active += 1
+        try:
+            self._process(unique_id, content_type, file_id, path)
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def _process(self, unique_id, content_type, file_id, path):
+        try:
+            if os.path.exists(path):
+                status = "cached"
+            else:
+                digest = self.download(file_id, path)
+                status = "downloaded"
+                if self.file_ids is not None:
+                    self.file_ids.remember(content_type, digest, file_id)
+        except Exception as e:
+            with self._cond:
+                failed = self._waiting.pop(unique_id, [])
+                self.stats["failed"] += len(failed)
+                self._cond.notify_all()
+            logger.error("Не удалось скачать вложение %s: %s", unique_id, e)
+            return
+        with self._cond:
+            self.stats[status] += 1
+        # Сообщения с тем же файлом, пришедшие во время обработки, обрабатываются здесь же
+        while True:
+            with self._cond:
+                waiting = self._waiting.get(unique_id)
+                if not waiting:
+                    self._waiting.pop(unique_id, None)
+                    self._cond.notify_all()
+                    return
+                self._waiting[unique_id] = []
+            for message, processor in waiting:
+                if processor is None:
+                    continue
+                try:
+                    processor(message, path)
+                except Exception as e:
+                    logger.error("Ошибка при обработке вложения %s: %s", unique_id, e)
+                else:
+                    with self._cond:
+                        self.stats["processed"] += 1
+
+    def download(self, file_id, path):
+        """
+        Скачивает файл Bot API в `path` потоком, частями по `chunk_size` байт.
+
+        С локальным сервером Bot API (`--local`) `file_path` - путь на диске,
+        и файл копируется без HTTP.
+
+        Args:
+            file_id (str): Идентификатор файла.
+            path (str): Куда сохранить файл.
+
+        Returns:
+            str: SHA-256 содержимого в шестнадцатеричном виде.
+
+        Raises:
+            ValueError: Файл больше `max_file_size`.
+            apihelper.ApiException: Ошибка Bot API.
+        """
+        file_info = self.signal_bot.get_file(file_id)
+        if file_info.file_size and file_info.file_size > self.max_file_size:
+            raise ValueError(f"файл больше лимита: {file_info.file_size} байт")
+        sha256 = hashlib.sha256()
+        size = 0
+        # Имя уникально для процесса и потока: файл могут качать несколько рабочих процессов
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(temp_path, 'wb') as file:
+                if os.path.isabs(file_info.file_path) and os.path.isfile(file_info.file_path):
+                    chunks = self._read_local(file_info.file_path)
+                    response = None
+                else:
+                    url = (apihelper.FILE_URL or DEFAULT_FILE_URL).format(
+                        self.signal_bot.token, file_info.file_path)
+                    response = apihelper._get_req_session().get(
+                        url, stream=True, timeout=DOWNLOAD_TIMEOUT, proxies=apihelper.proxy)
+                    if response.status_code != 200:
+                        response.close()
+                        raise apihelper.ApiHTTPException('Download file', response)
+                    chunks = response.iter_content(self.chunk_size)
+                try:
+                    for chunk in chunks:
+                        size += len(chunk)
+                        if size > self.max_file_size:
+                            raise ValueError(f"файл больше лимита {self.max_file_size} байт")
+                        if self._stopping:
+                            raise RuntimeError("скачивание прервано остановкой бота")
+                        sha256.update(chunk)
+                        file.write(chunk)
+                finally:
+                    if response is not None:
+                        response.close()
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return sha256.hexdigest()
+
+    def _read_local(self, file_path):
+        with open(file_path, 'rb') as source:
+            yield from iter(lambda: source.read(self.chunk_size), b'')
+
+    def join(self, timeout):
+        """
+        Ожидает скачивания и обработки всех поставленных вложений.
+
+        Returns:
+            bool: True, если все завершено до истечения таймаута.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._waiting, timeout)
+
+    def stop(self, timeout=None):
+        """
+        Останавливает пул потоков скачивания.
+
+        Идущие скачивания прерываются на следующей части, временные файлы удаляются.
+        Скачивание, зависшее в чтении части (до `DOWNLOAD_TIMEOUT`), ждется не
+        дольше `timeout` и дорабатывает в фоне.
+
+        Args:
+            timeout (float): Сколько секунд ждать скачивания и обработки. None - не
+                ждать очереди, но дождаться идущих скачиваний.
+
+        Returns:
+            int: Количество сообщений, вложения которых не обработаны.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if timeout:
+            self.join(timeout)
+        with self._cond:
+            self._stopping = True
+            remaining = sum(len(waiting) for waiting in self._waiting.values())
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._cond:
+            if not self._cond.wait_for(lambda: not self._active,
+                                       None if deadline is None else max(0.0, deadline - time.monotonic())):
+                logger.warning(f"Скачивание вложений: {self._active} задач не завершились к дедлайну")
+            self._waiting.clear()
+        logger.info(f"Скачивание вложений остановлено, не обработано: {remaining}")
+        return remaining
+
+    def metrics(self):
+        """
+        Возвращает метрики конвейера вложений.
+
+        Returns:
+            dict: Счетчики и число файлов в очереди и в работе (`pending`).
+        """
+        with self._cond:
+            result = dict(self.stats)
+            result["pending"] = len(self._waiting)
+        if self.file_ids is not None:
+            result.update(self.file_ids.stats)
+        return result
+
+
+def load_media_settings(bot_settings):
+    """
+    Возвращает настройки скачивания вложений из секции `media`.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки со значениями по умолчанию.
+    """
+    media = bot_settings.get('media', {})
+    return {
+        'enabled': media.get('enabled', True),
+        'directory': media.get('directory', 'media'),
+        'content_types': media.get('content_types', ['photo', 'document']),
+        'workers': media.get('workers', 4),
+        'max_pending': media.get('max_pending', 100),
+        'max_file_size': media.get('max_file_size', BOT_API_DOWNLOAD_LIMIT),
+        'chunk_size': media.get('chunk_size', 64 * 1024),
+        'file_ids_path': media.get('file_ids_path', 'state/file_ids.json'),
+    }
+
+
+def create_media_pipeline(signal_bot, settings):
+    """
+    Создает `MediaPipeline` с кешем `file_id` по настройкам и регистрирует его метрики.
+
+    Args:
+        signal_bot (telebot.TeleBot): Экземпляр бота.
+        settings (dict): Настройки из `load_media_settings`.
+
+    Returns:
+        MediaPipeline: Созданный экземпляр или None, если скачивание отключено.
+    """
+    if not settings['enabled']:
+        return None
+    unknown = set(settings['content_types']) - set(MEDIA_CONTENT_TYPES)
+    if unknown:
+        logger.warning(f"Неизвестные типы вложений в media.content_types: {', '.join(sorted(unknown))}")
+    media = MediaPipeline(
+        signal_bot,
+        directory=settings['directory'],
+        content_types=set(settings['content_types']) & set(MEDIA_CONTENT_TYPES),
+        workers=settings['workers'],
+        max_pending=settings['max_pending'],
+        max_file_size=settings['max_file_size'],
+        chunk_size=settings['chunk_size'],
+        file_ids=FileIdCache(settings['file_ids_path']),
+    )
+    # Значения считаются только при чтении /metrics
+    Gauge("bot_media_downloads_pending", "Вложения в очереди и в работе на скачивание",
+          lambda: media.metrics()["pending"])
+    Gauge("bot_media_file_uploads", "Файлы, загруженные в Telegram, а не отправленные по file_id",
+          lambda: media.file_ids.stats["uploads"])
+    return media
@@ -0,0 +1,404 @@
+#  Содержание metrics.py
+
+import bisect
+import inspect
+import math
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import apihelper
+from logger import logger
+
+# Границы корзин гистограмм задержек по умолчанию, в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Границы корзин для задержки обновлений (от отправки пользователем до обработки)
+LAG_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    value = float(value)
+    # Нечисловые значения в текстовом формате Prometheus
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value) if value != int(value) else str(int(value))
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, метки и дочерние метрики по значениям меток."""
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames and self.type_name != "gauge":
+            self.labels()  # метрика без меток видна в /metrics сразу, с нулевым значением
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *labelvalues):
+        """Возвращает дочернюю метрику для значений меток (создается при первом обращении)."""
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labelvalues, self._new_child())
+        return child
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        """Увеличивает счетчик без меток."""
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for labelvalues, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(child.value)}"
+
+
+class Histogram(_Metric):
+    """Гистограмма значений (обычно задержек) с фиксированными корзинами."""
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        """Добавляет значение в гистограмму без меток."""
+        self.labels().observe(value)
+
+    def _samples(self):
+        for labelvalues, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, labelvalues, (("le", le),))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge(_Metric):
+    """
+    Метрика, значение которой вычисляется функцией в момент чтения `/metrics`.
+
+    Функция возвращает число или словарь {кортеж значений меток: число}.
+    Пока метрики никто не читает, она ничего не стоит.
+    """
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, fn, labelnames=(), registry=None):
+        self.fn = fn
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _samples(self):
+        try:
+            values = self.fn()
+        except Exception as e:
+            logger.error("Ошибка при вычислении метрики %s: %s", self.name, e)
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labelvalues, value in values.items():
+            if value is None:
+                continue
+            try:
+                formatted = _format_value(value)
+            except (TypeError, ValueError) as e:
+                # Одно нечисловое значение не должно ломать весь ответ /metrics
+                logger.error("Нечисловое значение метрики %s: %r (%s)", self.name, value, e)
+                continue
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {formatted}"
+
+
+class MetricsRegistry:
+    """Реестр метрик, отдающий их в текстовом формате Prometheus."""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Добавляет метрику. Метрика с тем же именем заменяет прежнюю (например, при перезапуске бота)."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name):
+        """Удаляет метрику по имени."""
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self):
+        """Возвращает все метрики в текстовом формате Prometheus."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Метрики бота
+HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Время выполнения обработчика обновления", ("handler",))
+HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ("handler",))
+UPDATE_LAG_SECONDS = Histogram(
+    "bot_update_lag_seconds", "Задержка от отправки сообщения пользователем до начала обработки",
+    buckets=LAG_BUCKETS)
+API_REQUEST_SECONDS = Histogram(
+    "bot_api_request_seconds", "Время запроса к Bot API (getUpdates - один цикл polling)", ("method",))
+API_ERRORS = Counter(
+    "bot_api_errors_total", "Ошибки запросов к Bot API по коду ответа", ("method", "code"))
+POLLING_RETRIES = Counter(
+    "bot_polling_retries_total", "Перезапуски polling после ошибок")
+OUTBOUND_RETRIES = Counter(
+    "bot_outbound_retries_total", "Повторные отправки сообщений после ответа 429")
+
+# Измерять ли обработчики (см. configure_metrics)
+HANDLER_METRICS_ENABLED = True
+
+
+def configure_metrics(enabled=True):
+    """
+    Включает или выключает измерение обработчиков декоратором `observe_handler`.
+
+    Действует на обработчики, зарегистрированные после вызова.
+
+    Args:
+        enabled (bool): Настройка `metrics.enabled`.
+    """
+    global HANDLER_METRICS_ENABLED
+    HANDLER_METRICS_ENABLED = bool(enabled)
+
+
+def observe_handler(func):
+    """
+    Декоратор, измеряющий время и ошибки обработчика и задержку обновления.
+
+    Задержка обновления считается по `edit_date` отредактированного сообщения
+    или `date` сообщения (точность - секунда). Если метрики выключены
+    (`configure_metrics`), обработчик возвращается без обертки.
+
+    Args:
+        func (callable): Обработчик обновления.
+
+    Returns:
+        callable: Обёрнутый обработчик.
+    """
+    if not HANDLER_METRICS_ENABLED:
+        return func
+    histogram = HANDLER_SECONDS.labels(func.__name__)
+    errors = HANDLER_ERRORS.labels(func.__name__)
+
+    def observe_lag(update):
+        # У отредактированного сообщения date - время исходной отправки
+        date = getattr(update, 'edit_date', None) or getattr(update, 'date', None)
+        if date:
+            UPDATE_LAG_SECONDS.observe(max(0.0, time.time() - date))
+
+    if inspect.iscoroutinefunction(func):
+        # Обработчики асинхронного режима: время считается до завершения корутины
+        @wraps(func)
+        async def async_wrapper(update, *args, **kwargs):
+            started = time.perf_counter()
+            observe_lag(update)
+            try:
+                return await func(update, *args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(update, *args, **kwargs):
+        started = time.perf_counter()
+        observe_lag(update)
+        try:
+            return func(update, *args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+_original_make_request = None
+
+
+def instrument_bot_api():
+    """
+    Включает измерение времени и ошибок всех запросов TeleBot к Bot API.
+
+    Оборачивает `apihelper._make_request`, через который проходят все методы
+    синхронного TeleBot, включая getUpdates. Повторный вызов ничего не делает.
+    """
+    global _original_make_request
+    if _original_make_request is not None:
+        return
+    _original_make_request = make_request = apihelper._make_request
+
+    def timed_make_request(token, method_name, method='get', params=None, files=None):
+        histogram = API_REQUEST_SECONDS.labels(method_name)
+        started = time.perf_counter()
+        try:
+            return make_request(token, method_name, method, params=params, files=files)
+        except apihelper.ApiTelegramException as e:
+            API_ERRORS.labels(method_name, str(e.error_code)).inc()
+            raise
+        except Exception:
+            API_ERRORS.labels(method_name, "network").inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    apihelper._make_request = timed_make_request
+
+
+class MetricsServer:
+    """
+    HTTP-сервер, отдающий метрики на `/metrics`.
+
+    Метрики форматируются только в момент запроса, поэтому без опроса
+    сервер не расходует ресурсы.
+    """
+    def __init__(self, host="127.0.0.1", port=9108, registry=None):
+        """
+        Инициализирует MetricsServer.
+
+        Args:
+            host (str): Адрес для прослушивания.
+            port (int): Порт для прослушивания (0 - выбрать свободный).
+            registry (MetricsRegistry): Реестр метрик. По умолчанию общий `REGISTRY`.
+        """
+        self.registry = registry if registry is not None else REGISTRY
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        """Фактический адрес сервера (host, port)."""
+        return self._server.server_address[:2]
+
+    def start(self):
+        """Запускает сервер в фоновом потоке."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Метрики доступны на http://{self.address[0]}:{self.address[1]}/metrics")
+        return self
+
+    def stop(self):
+        """Останавливает сервер."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def load_metrics_settings(bot_settings):
+    """
+    Возвращает настройки метрик из секции `metrics` настроек бота.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки метрик со значениями по умолчанию.
+    """
+    metrics = bot_settings.get('metrics', {})
+    return {
+        'enabled': metrics.get('enabled', False),
+        'listen': metrics.get('listen', '127.0.0.1'),
+        'port': metrics.get('port', 9108),
+    }
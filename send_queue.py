@@ -0,0 +1,503 @@
+#  Содержание send_queue.py
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from telebot import apihelper
+from logger import logger
+from metrics import Gauge, OUTBOUND_RETRIES
+
+# Полосы приоритета: чем меньше число, тем раньше отправка
+PRIORITY_COMMAND = 0  # ответы на команды
+PRIORITY_REPLY = 1    # остальные ответы пользователям
+PRIORITY_BULK = 2     # массовые рассылки сигналов
+PRIORITIES = (PRIORITY_COMMAND, PRIORITY_REPLY, PRIORITY_BULK)
+
+MAX_MESSAGE_LENGTH = 4096
+COALESCE_SEPARATOR = "\n\n"
+BUCKET_SWEEP_INTERVAL = 60  # как часто удалять token bucket неактивных чатов, в секундах
+
+
+def get_retry_after(exception):
+    """
+    Возвращает `retry_after` из ответа 429 Bot API или None для остальных ошибок.
+
+    Args:
+        exception (Exception): Исключение, полученное при вызове Bot API.
+
+    Returns:
+        float: Пауза в секундах, которую требует Telegram, или None.
+    """
+    if isinstance(exception, apihelper.ApiTelegramException) and exception.error_code == 429:
+        parameters = (exception.result_json or {}).get('parameters') or {}
+        return float(parameters.get('retry_after', 1))
+    return None
+
+
+class TokenBucket:
+    """
+    Ограничитель частоты по алгоритму token bucket.
+
+    Атрибуты:
+        rate (float): Скорость пополнения, токенов в секунду.
+        capacity (float): Максимальное количество накопленных токенов (размер всплеска).
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at', 'paused_until')
+
+    def __init__(self, rate, capacity=1.0):
+        """
+        Инициализирует TokenBucket.
+
+        Args:
+            rate (float): Скорость пополнения, токенов в секунду.
+            capacity (float): Размер всплеска.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+
+    def wait_time(self, now):
+        """Возвращает, сколько секунд нужно подождать до появления токена."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        """Забирает один токен. Вызывать после `wait_time`, вернувшего 0."""
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        """Запрещает выдачу токенов на `seconds` секунд (для `retry_after`)."""
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0.0
+        self.updated_at = now + seconds
+
+
+class OutboundMessage:
+    """Сообщение в очереди на отправку."""
+    __slots__ = ('chat_id', 'text', 'kwargs', 'priority', 'coalesce', 'send_func',
+                 'checkpointed', 'enqueued_at', 'attempts', 'futures')
+
+    def __init__(self, chat_id, text, kwargs, priority, coalesce, send_func=None, checkpointed=False):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.priority = priority
+        self.coalesce = coalesce
+        self.send_func = send_func
+        self.checkpointed = checkpointed
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.futures = [Future()]
+
+
+class OutboundDispatcher:
+    """
+    Очередь исходящих сообщений с ограничением частоты.
+
+    Все отправки проходят через общий token bucket (глобальный лимит Telegram)
+    и token bucket конкретного чата. Ответы на команды отправляются раньше
+    остальных ответов, а те — раньше массовых рассылок. Ответ 429 приостанавливает
+    чат на `retry_after` секунд, после чего сообщение отправляется повторно.
+    Несколько массовых сообщений одному чату, ожидающих в очереди, склеиваются
+    в одно, если помещаются в лимит длины сообщения.
+
+    В каждый чат одновременно отправляется не больше одного сообщения, поэтому
+    порядок сообщений внутри полосы приоритета сохраняется. Сообщение, результат
+    которого отменен до начала отправки (`Future.cancel`), не отправляется.
+
+    Атрибуты:
+        signal_bot (telebot.TeleBot): Экземпляр бота для отправки.
+        max_attempts (int): Максимальное количество попыток при ответах 429.
+    """
+    def __init__(self, signal_bot, global_rate=30.0, per_chat_rate=1.0, per_chat_burst=3,
+                 workers=4, max_attempts=5):
+        """
+        Инициализирует OutboundDispatcher.
+
+        Args:
+            signal_bot (telebot.TeleBot): Экземпляр бота для отправки.
+            global_rate (float): Общий лимит сообщений в секунду.
+            per_chat_rate (float): Лимит сообщений в секунду для одного чата.
+            per_chat_burst (int): Допустимый всплеск сообщений в один чат.
+            workers (int): Количество потоков, выполняющих запросы к Bot API.
+            max_attempts (int): Максимальное количество попыток при ответах 429.
+        """
+        self.signal_bot = signal_bot
+        self.max_attempts = max_attempts
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._per_chat_rate = per_chat_rate
+        self._per_chat_burst = per_chat_burst
+        self._chat_buckets = {}
+        self._pending = {}                             # chat_id -> {priority: deque}
+        self._lanes = {p: deque() for p in PRIORITIES}  # очереди чатов с ожидающими сообщениями
+        self._in_lane = {p: set() for p in PRIORITIES}
+        self._delayed = []                             # (ready_at, seq, priority, chat_id)
+        self._in_flight = set()
+        self._handed_off = {}                          # chat_id -> сообщение, переданное пулу
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="outbound")
+        self._thread = None
+        self._running = False
+        self._depth = 0
+        self._wait_times = deque(maxlen=1000)
+        self.stats = {"enqueued": 0, "sent": 0, "failed": 0, "retried": 0, "coalesced": 0,
+                      "cancelled": 0}
+
+    def start(self):
+        """Запускает поток планировщика отправки."""
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="outbound-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("Очередь исходящих сообщений запущена")
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Останавливает планировщик.
+
+        Отправка, уже начатая в HTTP, не прерывается: она ждется не дольше
+        `timeout` и дорабатывает в фоне. Сообщения, переданные пулу, но еще не
+        начавшие отправку, возвращаются в очередь (см. `take_pending`).
+
+        Args:
+            timeout (float): Сколько секунд ждать отправки оставшихся сообщений.
+                None - не ждать очереди, но дождаться уже начатых отправок.
+
+        Returns:
+            int: Количество сообщений, оставшихся неотправленными (включая
+            отправки, не завершившиеся к `timeout`).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if timeout:
+            self.join(timeout)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._cond:
+            for chat_id, message in self._handed_off.items():
+                self._pending.setdefault(chat_id, {}).setdefault(message.priority, deque()).appendleft(message)
+                self._depth += 1
+                self._in_flight.discard(chat_id)
+            self._handed_off.clear()
+            self._cond.wait_for(lambda: not self._in_flight,
+                                None if deadline is None else max(0.0, deadline - time.monotonic()))
+            remaining = self._depth + len(self._in_flight)
+        logger.info(f"Очередь исходящих сообщений остановлена, не отправлено: {remaining}")
+        return remaining
+
+    def join(self, timeout):
+        """
+        Ожидает опустошения очереди.
+
+        Returns:
+            bool: True, если все сообщения отправлены до истечения таймаута.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._depth or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def take_pending(self):
+        """
+        Снимает с очереди все ожидающие сообщения (кроме отправляемых в данный момент).
+
+        Используется при остановке, чтобы сохранить неотправленное. Результаты
+        снятых сообщений отменяются (`CancelledError`).
+
+        Returns:
+            list: Снятые `OutboundMessage` по чатам в порядке приоритета.
+        """
+        with self._cond:
+            messages = []
+            for chat_queues in self._pending.values():
+                for priority in sorted(chat_queues):
+                    messages.extend(chat_queues[priority])
+            self._pending.clear()
+            self._delayed.clear()
+            for priority in PRIORITIES:
+                self._lanes[priority].clear()
+                self._in_lane[priority].clear()
+            self._depth = 0
+            self._cond.notify_all()
+        for message in messages:
+            for future in message.futures:
+                # Сообщение, ожидающее повтора после 429, уже начало отправляться
+                if not future.cancel() and not future.done():
+                    future.set_exception(CancelledError())
+        return messages
+
+    def send(self, chat_id, text, priority=PRIORITY_REPLY, coalesce=None, send_func=None,
+             checkpointed=False, **kwargs):
+        """
+        Ставит сообщение в очередь на отправку.
+
+        Args:
+            chat_id (int): Идентификатор чата.
+            text (str): Текст сообщения.
+            priority (int): Полоса приоритета (`PRIORITY_COMMAND`, `PRIORITY_REPLY`, `PRIORITY_BULK`).
+            coalesce (bool): Разрешить склейку с другими сообщениями этому чату.
+                По умолчанию разрешена только для `PRIORITY_BULK` без доп. параметров.
+            send_func (callable): Функция отправки `send_func(chat_id, text, **kwargs)`
+                вместо `send_message` (например, отправка фото с подписью). Такие
+                сообщения не склеиваются.
+            checkpointed (bool): Отправитель сам хранит прогресс (чекпоинт рассылки)
+                и повторит сообщение, отмененное при остановке. Такие сообщения
+                не сохраняются в `state/pending`.
+            **kwargs: Дополнительные параметры для `send_message`.
+
+        Returns:
+            concurrent.futures.Future: Результат `send_message` (telebot.types.Message).
+        """
+        if send_func is not None:
+            coalesce = False
+        elif coalesce is None:
+            coalesce = priority == PRIORITY_BULK and not kwargs
+        message = OutboundMessage(chat_id, text, kwargs, priority, coalesce, send_func, checkpointed)
+        with self._cond:
+            self.stats["enqueued"] += 1
+            chat_queues = self._pending.setdefault(chat_id, {})
+            lane_queue = chat_queues.setdefault(priority, deque())
+            if coalesce and lane_queue and self._try_coalesce(lane_queue[-1], message):
+                return lane_queue[-1].futures[-1]
+            lane_queue.append(message)
+            self._depth += 1
+            self._schedule_chat(chat_id, priority)
+            self._cond.notify()
+        return message.futures[0]
+
+    def _try_coalesce(self, queued, message):
+        if not queued.coalesce or queued.kwargs != message.kwargs:
+            return False
+        combined = queued.text + COALESCE_SEPARATOR + message.text
+        if len(combined) > MAX_MESSAGE_LENGTH:
+            return False
+        queued.text = combined
+        queued.futures.extend(message.futures)
+        self.stats["coalesced"] += 1
+        return True
+
+    def _schedule_chat(self, chat_id, priority):
+        if chat_id not in self._in_lane[priority] and chat_id not in self._in_flight:
+            self._in_lane[priority].add(chat_id)
+            self._lanes[priority].append(chat_id)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self._per_chat_rate, capacity=self._per_chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _next_message(self, now):
+        """Выбирает следующее сообщение или возвращает время ожидания."""
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, priority, chat_id = heapq.heappop(self._delayed)
+            if self._pending.get(chat_id, {}).get(priority):
+                self._schedule_chat(chat_id, priority)
+
+        global_wait = self._global_bucket.wait_time(now)
+        if global_wait > 0:
+            return None, global_wait
+
+        for priority in PRIORITIES:
+            lane = self._lanes[priority]
+            while lane:
+                chat_id = lane.popleft()
+                self._in_lane[priority].discard(chat_id)
+                if chat_id in self._in_flight:
+                    continue  # вернется в полосу после завершения текущей отправки
+                chat_wait = self._chat_bucket(chat_id).wait_time(now)
+                if chat_wait > 0:
+                    heapq.heappush(self._delayed, (now + chat_wait, next(self._seq), priority, chat_id))
+                    continue
+                chat_queues = self._pending[chat_id]
+                message = chat_queues[priority].popleft()
+                if not chat_queues[priority]:
+                    del chat_queues[priority]
+                    if not chat_queues:
+                        del self._pending[chat_id]
+                return message, 0.0
+
+        if self._delayed:
+            return None, max(0.0, self._delayed[0][0] - now)
+        return None, None
+
+    def _sweep_buckets(self, now):
+        """Удаляет заполненные token bucket чатов без ожидающих сообщений."""
+        idle = [
+            chat_id for chat_id, bucket in self._chat_buckets.items()
+            if chat_id not in self._pending and chat_id not in self._in_flight
+            and bucket.wait_time(now) == 0 and bucket.tokens >= bucket.capacity
+        ]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+
+    def _run(self):
+        next_sweep = time.monotonic() + BUCKET_SWEEP_INTERVAL
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                if now >= next_sweep:
+                    self._sweep_buckets(now)
+                    next_sweep = now + BUCKET_SWEEP_INTERVAL
+                message, wait = self._next_message(now)
+                if message is None:
+                    self._cond.wait(wait)
+                    continue
+                self._global_bucket.consume()
+                self._chat_bucket(message.chat_id).consume()
+                self._in_flight.add(message.chat_id)
+                self._depth -= 1
+                self._wait_times.append(now - message.enqueued_at)
+                self._handed_off[message.chat_id] = message
+                self._executor.submit(self._deliver, message)
+
+    def _deliver(self, message):
+        with self._cond:
+            if self._handed_off.pop(message.chat_id, None) is not message:
+                return  # остановка вернула сообщение в очередь до начала отправки
+        if message.attempts == 0:
+            # Отправитель мог отменить сообщение, пока оно ждало в очереди
+            message.futures = [future for future in message.futures
+                               if future.set_running_or_notify_cancel()]
+            if not message.futures:
+                with self._cond:
+                    self.stats["cancelled"] += 1
+                    self._release(message.chat_id)
+                return
+        message.attempts += 1
+        send = message.send_func or self.signal_bot.send_message
+        try:
+            result = send(message.chat_id, message.text, **message.kwargs)
+        except Exception as e:
+            self._on_failure(message, e)
+        else:
+            with self._cond:
+                self.stats["sent"] += 1
+                self._release(message.chat_id)
+            for future in message.futures:
+                future.set_result(result)
+
+    def _on_failure(self, message, exception):
+        retry_after = get_retry_after(exception)
+        with self._cond:
+            if retry_after is not None and message.attempts < self.max_attempts:
+                logger.info("Лимит Telegram для чата %s, повтор через %s с",
+                            message.chat_id, retry_after)
+                self.stats["retried"] += 1
+                OUTBOUND_RETRIES.inc()
+                self._chat_bucket(message.chat_id).pause(retry_after)
+                chat_queues = self._pending.setdefault(message.chat_id, {})
+                chat_queues.setdefault(message.priority, deque()).appendleft(message)
+                self._depth += 1
+                self._release(message.chat_id)
+                return
+            self.stats["failed"] += 1
+            self._release(message.chat_id)
+        logger.error("Ошибка при отправке сообщения в чат %s: %s", message.chat_id, exception)
+        for future in message.futures:
+            future.set_exception(exception)
+
+    def _release(self, chat_id):
+        self._in_flight.discard(chat_id)
+        for priority in self._pending.get(chat_id, {}):
+            self._schedule_chat(chat_id, priority)
+        self._cond.notify_all()
+
+    def metrics(self):
+        """
+        Возвращает метрики очереди.
+
+        Returns:
+            dict: Глубина очереди по полосам, число отправок в процессе,
+            счетчики и время ожидания в очереди (среднее, p99, максимум) в секундах.
+        """
+        with self._cond:
+            depth_by_lane = {p: 0 for p in PRIORITIES}
+            for chat_queues in self._pending.values():
+                for priority, lane_queue in chat_queues.items():
+                    depth_by_lane[priority] += len(lane_queue)
+            wait_times = sorted(self._wait_times)
+            result = dict(self.stats)
+            result["queue_depth"] = self._depth
+            result["queue_depth_by_priority"] = depth_by_lane
+            result["in_flight"] = len(self._in_flight)
+        if wait_times:
+            result["wait_avg"] = sum(wait_times) / len(wait_times)
+            result["wait_p99"] = wait_times[min(len(wait_times) - 1, int(len(wait_times) * 0.99))]
+            result["wait_max"] = wait_times[-1]
+        else:
+            result["wait_avg"] = result["wait_p99"] = result["wait_max"] = 0.0
+        return result
+
+
+def load_outbound_settings(bot_settings):
+    """
+    Возвращает настройки очереди исходящих сообщений из секции `outbound`.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки очереди со значениями по умолчанию.
+    """
+    outbound = bot_settings.get('outbound', {})
+    return {
+        'enabled': outbound.get('enabled', True),
+        'global_rate': outbound.get('global_rate', 30),
+        'per_chat_rate': outbound.get('per_chat_rate', 1),
+        'per_chat_burst': outbound.get('per_chat_burst', 3),
+        'workers': outbound.get('workers', 4),
+        'max_attempts': outbound.get('max_attempts', 5),
+    }
+
+
+def create_dispatcher(signal_bot, settings):
+    """
+    Создает и запускает очередь исходящих сообщений по настройкам.
+
+    Args:
+        signal_bot (telebot.TeleBot): Экземпляр бота для отправки.
+        settings (dict): Настройки из `load_outbound_settings`.
+
+    Returns:
+        OutboundDispatcher: Запущенная очередь или None, если она отключена.
+    """
+    if not settings['enabled']:
+        return None
+    dispatcher = OutboundDispatcher(
+        signal_bot,
+        global_rate=settings['global_rate'],
+        per_chat_rate=settings['per_chat_rate'],
+        per_chat_burst=settings['per_chat_burst'],
+        workers=settings['workers'],
+        max_attempts=settings['max_attempts'],
+    ).start()
+    # Значения считаются только при чтении /metrics
+    Gauge("bot_outbound_queue_depth", "Сообщения в очереди исходящих по приоритету",
+          lambda: {(str(p),): depth for p, depth in dispatcher.metrics()["queue_depth_by_priority"].items()},
+          labelnames=("priority",))
+    Gauge("bot_outbound_in_flight", "Сообщения, отправляемые в данный момент",
+          lambda: dispatcher.metrics()["in_flight"])
+    Gauge("bot_outbound_wait_p99_seconds", "p99 времени ожидания в очереди исходящих",
+          lambda: dispatcher.metrics()["wait_p99"])
+    return dispatcher
@@ -0,0 +1,532 @@
+#  Содержание sharding.py
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import wait as wait_for_processes
+from telebot import apihelper
+from logger import logger
+from metrics import POLLING_RETRIES, configure_metrics, load_metrics_settings
+from lifecycle import (
+    DEFAULT_SHUTDOWN_DEADLINE, confirm_offset, drain_outbound, load_pending, restore_outbound,
+    restore_updates, save_pending
+)
+
+# Ключи обновлений, внутри которых лежит объект с полем chat
+CHAT_UPDATE_KEYS = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "my_chat_member", "chat_member", "chat_join_request",
+    "message_reaction", "message_reaction_count", "chat_boost", "removed_chat_boost",
+)
+# Сколько секунд сверх дедлайна остановки у процесса есть на сохранение исходящих сообщений
+PERSIST_GRACE = 2.0
+# Ключи обновлений без чата, где шардирование идет по пользователю
+USER_UPDATE_KEYS = (
+    "inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query",
+)
+
+
+def extract_chat_id(update_json):
+    """
+    Возвращает идентификатор чата, к которому относится обновление.
+
+    Для обновлений без чата (inline-запросы, платежи) используется id пользователя,
+    для опросов без чата - 0.
+
+    Args:
+        update_json (dict): Обновление в формате Bot API.
+
+    Returns:
+        int: Ключ шардирования.
+    """
+    for key in CHAT_UPDATE_KEYS:
+        payload = update_json.get(key)
+        if payload:
+            return payload["chat"]["id"]
+    callback_query = update_json.get("callback_query")
+    if callback_query:
+        message = callback_query.get("message")
+        return message["chat"]["id"] if message else callback_query["from"]["id"]
+    for key in USER_UPDATE_KEYS:
+        payload = update_json.get(key)
+        if payload:
+            return payload["from"]["id"]
+    poll_answer = update_json.get("poll_answer")
+    if poll_answer and poll_answer.get("user"):
+        return poll_answer["user"]["id"]
+    return 0
+
+
+def shard_for(chat_id, workers):
+    """Номер рабочего процесса для чата. Все обновления чата попадают в один процесс."""
+    return chat_id % workers
+
+
+def _worker_main(index, bot_token, bot_settings, inbox, processed, last_lag, stop_at,
+                 pending_outbound=(), api_url=None, file_url=None, bot_user=None):
+    """
+    Точка входа рабочего процесса: обрабатывает обновления своего шарда по порядку.
+
+    При остановке процесс обрабатывает очередь до метки `stop_at`, затем
+    сохраняет неотправленные исходящие сообщения. Необработанные обновления
+    сохраняет супервизор.
+
+    Args:
+        index (int): Номер рабочего процесса.
+        bot_token (str): Токен бота.
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+        inbox (multiprocessing.Queue): Очередь обновлений шарда (время постановки, JSON).
+        processed (multiprocessing.Value): Счетчик обработанных обновлений.
+        last_lag (multiprocessing.Value): Задержка последнего обновления в очереди, в секундах.
+        stop_at (multiprocessing.Value): Время (time.time()), до которого нужно
+            завершить обработку при остановке; 0 - остановка не запрошена.
+        pending_outbound (list): Исходящие сообщения этого шарда, сохраненные при прошлой остановке.
+        api_url (str): Адрес Bot API (для тестов и бенчмарков).
+        file_url (str): Адрес скачивания файлов Bot API.
+        bot_user (dict): Ответ get_me, полученный супервизором: имя бота нужно
+            фильтру команд `/cmd@бот`.
+    """
+    import telebot
+    from telebot import types
+    from bot import register_handlers
+    from send_queue import create_dispatcher, load_outbound_settings
+    from keyboards import create_responder, load_callback_settings
+    from state_store import create_state_store, load_state_settings
+    from media import create_media_pipeline, load_media_settings
+    from http_session import install_session_layer, load_http_settings
+
+    if api_url:
+        apihelper.API_URL = api_url
+    if file_url:
+        apihelper.FILE_URL = file_url
+    install_session_layer(**load_http_settings(bot_settings))
+    configure_metrics(load_metrics_settings(bot_settings)['enabled'])
+    signal_bot = telebot.TeleBot(bot_token, threaded=False)
+    if bot_user:
+        # register_handlers берет имя бота из кеша get_me, как в режиме threaded
+        signal_bot._user = types.User.de_json(bot_user)
+    outbound_settings = load_outbound_settings(bot_settings)
+    # Глобальный лимит Telegram общий на всех ботов: делим его между процессами
+    workers = bot_settings.get('sharding', {}).get('workers') or os.cpu_count()
+    outbound_settings['global_rate'] = outbound_settings['global_rate'] / workers
+    dispatcher = create_dispatcher(signal_bot, outbound_settings)
+    responder = create_responder(signal_bot, load_callback_settings(bot_settings))
+    # Чат всегда попадает в один процесс, поэтому кеши процессов не пересекаются
+    state_store = create_state_store(load_state_settings(bot_settings))
+    # Процессы скачивают в общую директорию: файл пишется во временный и переименовывается,
+    # поэтому одновременное скачивание одного файла двумя процессами безопасно
+    media = create_media_pipeline(signal_bot, load_media_settings(bot_settings))
+    register_handlers(signal_bot, dispatcher, responder, state_store, media)
+    restore_outbound(signal_bot, dispatcher, messages=pending_outbound)
+    logger.info("Рабочий процесс %s запущен (pid %s)", index, os.getpid())
+
+    try:
+        while True:
+            item = inbox.get()
+            if item is None or (stop_at.value and time.time() >= stop_at.value):
+                break
+            enqueued_at, update_json = item
+            try:
+                signal_bot.process_new_updates([types.Update.de_json(update_json)])
+            except Exception as e:
+                logger.error("Рабочий процесс %s: ошибка при обработке обновления %s: %s",
+                             index, update_json.get("update_id"), e)
+            with processed.get_lock():
+                processed.value += 1
+            last_lag.value = time.time() - enqueued_at
+    finally:
+        def time_left():
+            if not stop_at.value:
+                return DEFAULT_SHUTDOWN_DEADLINE
+            return max(0.0, stop_at.value - time.time())
+
+        responder.stop(timeout=time_left())
+        if media is not None:
+            media.stop(timeout=time_left())
+        if dispatcher is not None:
+            result = drain_outbound(dispatcher, time_left())
+            logger.info("Рабочий процесс %s: исходящих сообщений сохранено %s, потеряно %s",
+                        index, result["persisted"], result["dropped"])
+        if state_store is not None:
+            state_store.close()
+        logger.info("Рабочий процесс %s остановлен", index)
+
+
+class ShardWorker:
+    """
+    Состояние одного рабочего процесса на стороне супервизора.
+
+    Отправленные, но еще не обработанные обновления хранятся в `unacked`
+    вместе с порядковым номером, чтобы после падения процесса передать их
+    новому процессу. Очередь процесса при перезапуске пересоздается: процесс,
+    убитый во время чтения, может оставить ее блокировку захваченной.
+    """
+    def __init__(self, index, context, queue_size):
+        self.index = index
+        self.queue_size = queue_size
+        self.inbox = context.Queue(maxsize=queue_size)
+        self.processed = context.Value('q', 0)
+        self.last_lag = context.Value('d', 0.0)
+        self.dispatched = 0
+        self.unacked = deque()
+        self.process = None
+        self.restarts = 0
+        self.delay = None
+        self.restart_at = None
+        self.failed = False
+        self.reported_processed = 0
+        self.pending_outbound = []
+
+
+class ShardSupervisor:
+    """
+    Супервизор, распределяющий обновления по рабочим процессам по `chat_id`.
+
+    Супервизор получает обновления из одного источника (polling или webhook)
+    и кладет каждое в очередь процесса `chat_id % workers`, поэтому обновления
+    одного чата обрабатываются строго по порядку, а разные чаты - параллельно
+    на нескольких ядрах. Упавший процесс перезапускается с той же политикой,
+    что и `main.run_bot_polling`: экспоненциальная задержка от `base_delay`
+    до 60 секунд и не более `max_retries` перезапусков процесса.
+
+    Атрибуты:
+        workers (int): Количество рабочих процессов.
+        shards (list): Состояние рабочих процессов (`ShardWorker`).
+    """
+    def __init__(self, bot_token, bot_settings, workers=None, queue_size=1000,
+                 max_retries=5, base_delay=5, api_url=None, bot_user=None):
+        """
+        Инициализирует ShardSupervisor.
+
+        Args:
+            bot_token (str): Токен бота.
+            bot_settings (dict): Настройки бота из `settings/key.json`.
+            workers (int): Количество рабочих процессов (по умолчанию - число ядер).
+            queue_size (int): Размер очереди каждого процесса.
+            max_retries (int): Максимальное количество перезапусков процесса.
+            base_delay (int): Начальная задержка перед перезапуском, в секундах.
+            api_url (str): Адрес Bot API (локальный сервер Bot API, тесты и бенчмарки).
+                По умолчанию - `apihelper.API_URL` процесса супервизора.
+            bot_user (dict): Ответ get_me (`User.to_dict()`), передается процессам.
+        """
+        self.bot_token = bot_token
+        self.bot_settings = bot_settings
+        self.workers = workers or os.cpu_count()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        # Процессы запускаются через spawn и не наследуют API_URL и FILE_URL супервизора
+        self.api_url = api_url or apihelper.API_URL
+        self.file_url = apihelper.FILE_URL
+        self.bot_user = bot_user
+        self._context = multiprocessing.get_context("spawn")
+        self.shards = [ShardWorker(i, self._context, queue_size) for i in range(self.workers)]
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._stop_at = self._context.Value('d', 0.0)
+        self._monitor_thread = None
+        self._last_report = time.monotonic()
+
+    def _trim_unacked(self, shard):
+        processed = shard.processed.value
+        while shard.unacked and shard.unacked[0][0] < processed:
+            shard.unacked.popleft()
+
+    def _restart(self, shard):
+        """Запускает процесс заново и передает ему необработанные обновления."""
+        self._trim_unacked(shard)
+        shard.inbox = self._context.Queue(maxsize=shard.queue_size)
+        self._spawn(shard)
+        for _, item in shard.unacked:
+            shard.inbox.put(item)
+        logger.info("Рабочий процесс %s перезапущен, передано необработанных обновлений: %s",
+                    shard.index, len(shard.unacked))
+
+    def _spawn(self, shard):
+        # Каждый процесс пишет в свой файл лога, чтобы не делить ротацию файла
+        previous = os.environ.get('TGM_LOG_FILE')
+        os.environ['TGM_LOG_FILE'] = f"bot_log.worker{shard.index}.jsonl"
+        try:
+            shard.process = self._context.Process(
+                target=_worker_main,
+                args=(shard.index, self.bot_token, self.bot_settings, shard.inbox,
+                      shard.processed, shard.last_lag, self._stop_at, shard.pending_outbound),
+                kwargs={'api_url': self.api_url, 'file_url': self.file_url, 'bot_user': self.bot_user},
+                name=f"shard-{shard.index}", daemon=True)
+            shard.process.start()
+            shard.pending_outbound = []  # сохраненные сообщения передаются только первому процессу
+        finally:
+            if previous is None:
+                os.environ.pop('TGM_LOG_FILE', None)
+            else:
+                os.environ['TGM_LOG_FILE'] = previous
+
+    def start(self):
+        """
+        Запускает рабочие процессы и поток наблюдения за ними.
+
+        Исходящие сообщения, сохраненные при прошлой остановке, передаются
+        процессам по чату получателя.
+        """
+        for item in load_pending("outbound"):
+            self.shards[shard_for(item["chat_id"], self.workers)].pending_outbound.append(item)
+        for shard in self.shards:
+            self._spawn(shard)
+        self._monitor_thread = threading.Thread(target=self._monitor, name="shard-monitor", daemon=True)
+        self._monitor_thread.start()
+        logger.info("Запущено рабочих процессов: %s", self.workers)
+        return self
+
+    def _monitor(self):
+        """Перезапускает упавшие процессы с экспоненциальной задержкой."""
+        while not self._stopping.is_set():
+            with self._lock:
+                alive = {shard.process.sentinel: shard for shard in self.shards
+                         if shard.process is not None and shard.process.is_alive()}
+                pending = [shard for shard in self.shards if shard.restart_at is not None]
+            timeout = 1.0
+            if pending:
+                timeout = max(0.0, min(s.restart_at for s in pending) - time.monotonic())
+            ready = wait_for_processes(list(alive), timeout=timeout) if alive else []
+            if not alive:
+                self._stopping.wait(timeout)
+            if self._stopping.is_set():
+                return
+            now = time.monotonic()
+            with self._lock:
+                for sentinel in ready:
+                    shard = alive[sentinel]
+                    # Сентинел готов чуть раньше, чем процесс можно забрать waitpid
+                    shard.process.join()
+                    shard.restarts += 1
+                    logger.error("Рабочий процесс %s завершился с кодом %s. Попытка %s из %s",
+                                 shard.index, shard.process.exitcode, shard.restarts, self.max_retries)
+                    if shard.restarts >= self.max_retries:
+                        logger.error("Достигнуто максимальное количество попыток. "
+                                     "Рабочий процесс %s остановлен.", shard.index)
+                        shard.failed = True
+                        continue
+                    shard.delay = self.base_delay if shard.delay is None else min(shard.delay * 2, 60)
+                    shard.restart_at = now + shard.delay
+                for shard in self.shards:
+                    if shard.restart_at is not None and shard.restart_at <= now:
+                        shard.restart_at = None
+                        self._restart(shard)
+
+    def dispatch(self, update_json):
+        """
+        Отправляет обновление в очередь процесса, отвечающего за его чат.
+
+        Если очередь процесса заполнена, вызов блокируется (обратное давление на источник).
+        Если процесс упал, обновление будет передано перезапущенному процессу;
+        обновление, которое обрабатывалось в момент падения, может быть обработано повторно.
+
+        Args:
+            update_json (dict): Обновление в формате Bot API.
+        """
+        shard = self.shards[shard_for(extract_chat_id(update_json), self.workers)]
+        item = (time.time(), update_json)
+        with self._lock:
+            if shard.failed:
+                logger.error("Обновление %s потеряно: рабочий процесс %s остановлен",
+                             update_json.get("update_id"), shard.index)
+                return
+            self._trim_unacked(shard)
+            shard.unacked.append((shard.dispatched, item))
+            shard.dispatched += 1
+            inbox = shard.inbox
+        while not self._stopping.is_set():
+            try:
+                inbox.put(item, timeout=1)
+                return
+            except queue.Full:
+                if inbox is not shard.inbox:
+                    return  # процесс перезапущен, обновление уже передано из unacked
+
+    def report(self):
+        """
+        Возвращает метрики рабочих процессов.
+
+        Returns:
+            list: Для каждого процесса - количество обработанных обновлений,
+            пропускная способность с прошлого отчета, отставание очереди
+            (отправлено, но не обработано), задержка последнего обновления и число перезапусков.
+        """
+        now = time.monotonic()
+        elapsed = now - self._last_report
+        self._last_report = now
+        result = []
+        for shard in self.shards:
+            processed = shard.processed.value
+            result.append({
+                "worker": shard.index,
+                "alive": shard.process is not None and shard.process.is_alive(),
+                "processed": processed,
+                "throughput": (processed - shard.reported_processed) / elapsed if elapsed else 0.0,
+                "queue_lag": shard.dispatched - processed,
+                "last_lag": shard.last_lag.value,
+                "restarts": shard.restarts,
+            })
+            shard.reported_processed = processed
+        return result
+
+    def log_report(self):
+        """Пишет метрики рабочих процессов в лог."""
+        for item in self.report():
+            logger.info("Шард %(worker)s: обработано %(processed)s, %(throughput).1f upd/s, "
+                        "в очереди %(queue_lag)s, задержка %(last_lag).3f с, перезапусков %(restarts)s",
+                        item)
+
+    def stop(self, timeout=DEFAULT_SHUTDOWN_DEADLINE):
+        """
+        Останавливает процессы, дав им дообработать очереди до дедлайна.
+
+        Процессы обрабатывают свои очереди `timeout` секунд, затем сохраняют
+        неотправленные исходящие сообщения. Обновления, которые процессы
+        не успели обработать, возвращаются для сохранения.
+
+        Args:
+            timeout (float): Время на дообработку очередей, в секундах.
+
+        Returns:
+            list: Необработанные обновления (JSON).
+        """
+        self._stopping.set()
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
+        self._stop_at.value = time.time() + timeout
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                try:
+                    shard.inbox.put_nowait(None)
+                except queue.Full:
+                    pass  # процесс остановится по метке stop_at
+        deadline = time.monotonic() + timeout + PERSIST_GRACE
+        leftovers = []
+        for shard in self.shards:
+            if shard.process is not None:
+                shard.process.join(max(0.0, deadline - time.monotonic()))
+                if shard.process.is_alive():
+                    shard.process.terminate()
+                    shard.process.join()
+            self._trim_unacked(shard)
+            leftovers.extend(update_json for _, (_, update_json) in shard.unacked)
+        self.log_report()
+        logger.info(f"Рабочие процессы остановлены, необработанных обновлений: {len(leftovers)}")
+        return leftovers
+
+
+def poll_updates(bot_token, stop_event, consume, allowed_updates=None,
+                 long_polling_timeout=5, max_retries=5, base_delay=5):
+    """
+    Получает обновления long polling'ом в виде JSON и передает их в `consume`.
+
+    Offset подтверждается только после того, как пачка передана в `consume`,
+    и еще раз при остановке, чтобы последняя пачка не пришла повторно.
+
+    Args:
+        bot_token (str): Токен бота.
+        stop_event (threading.Event): Событие для остановки.
+        consume (callable): Функция, принимающая одно обновление в формате Bot API.
+        allowed_updates (list): Типы обновлений, которые нужно получать.
+        long_polling_timeout (int): Таймаут long polling, в секундах.
+        max_retries (int): Максимальное количество ошибок подряд.
+        base_delay (int): Начальная задержка перед повтором, в секундах.
+    """
+    offset = None
+    retry_count = 0
+    delay = base_delay
+    while not stop_event.is_set():
+        try:
+            updates = apihelper.get_updates(
+                bot_token, offset=offset, timeout=long_polling_timeout + 5,
+                allowed_updates=allowed_updates, long_polling_timeout=long_polling_timeout)
+        except Exception as e:
+            retry_count += 1
+            POLLING_RETRIES.inc()
+            logger.error("Ошибка получения обновлений: %s. Попытка %s из %s",
+                         e, retry_count, max_retries)
+            if retry_count >= max_retries:
+                logger.error("Не удалось восстановить соединение. Остановка получения обновлений.")
+                return
+            stop_event.wait(delay)
+            delay = min(delay * 2, 60)
+            continue
+        retry_count = 0
+        delay = base_delay
+        for update_json in updates:
+            consume(update_json)
+            offset = update_json["update_id"] + 1
+    if offset is not None:
+        # Все переданные в consume обновления обработаны или будут сохранены супервизором
+        confirm_offset(bot_token, offset)
+
+
+def load_sharding_settings(bot_settings):
+    """
+    Возвращает настройки шардирования из секции `sharding` настроек бота.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки шардирования со значениями по умолчанию.
+    """
+    sharding = bot_settings.get('sharding', {})
+    return {
+        'workers': sharding.get('workers') or os.cpu_count(),
+        'source': sharding.get('source', 'polling'),
+        'queue_size': sharding.get('queue_size', 1000),
+        'report_interval': sharding.get('report_interval', 60),
+    }
+
+
+def run_sharded(bot_token, bot_settings, stop_event, allowed_updates=None,
+                drain_timeout=DEFAULT_SHUTDOWN_DEADLINE):
+    """
+    Запускает супервизор с рабочими процессами до установки `stop_event`.
+
+    Источник обновлений (polling или webhook) один на весь бот и работает
+    в процессе супервизора. Функция блокирующая, как и `main.run_bot_polling`.
+
+    Args:
+        bot_token (str): Токен бота.
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+        stop_event (threading.Event): Событие для остановки.
+        allowed_updates (list): Типы обновлений, которые нужно получать.
+        drain_timeout (float): Сколько секунд при остановке дообрабатывать очереди
+            процессов. Необработанные обновления сохраняются для следующего запуска.
+    """
+    import telebot
+    settings = load_sharding_settings(bot_settings)
+    # get_me выполняется один раз здесь, а не в каждом процессе
+    bot_user = None
+    try:
+        bot_user = telebot.TeleBot(bot_token, threaded=False).get_me().to_dict()
+    except Exception as e:
+        logger.warning("Не удалось выполнить get_me: %r; команды вида /cmd@бот не будут "
+                       "проверяться по имени бота", e)
+    supervisor = ShardSupervisor(bot_token, bot_settings, workers=settings['workers'],
+                                 queue_size=settings['queue_size'], bot_user=bot_user).start()
+    restore_updates(supervisor.dispatch)
+
+    def report_loop():
+        while not stop_event.wait(settings['report_interval']):
+            supervisor.log_report()
+
+    threading.Thread(target=report_loop, name="shard-report", daemon=True).start()
+    try:
+        if settings['source'] == 'webhook':
+            from webhook_server import load_webhook_settings, run_webhook
+            webhook_settings = load_webhook_settings(bot_settings)
+            # Один поток webhook-сервера сохраняет порядок обновлений при раскладке по шардам
+            webhook_settings['workers'] = 1
+            run_webhook(telebot.TeleBot(bot_token, threaded=False), webhook_settings, stop_event,
+                        allowed_updates=allowed_updates, process_update=supervisor.dispatch,
+                        drain_timeout=drain_timeout)
+        else:
+            poll_updates(bot_token, stop_event, supervisor.dispatch, allowed_updates=allowed_updates)
+    finally:
+        save_pending("updates", supervisor.stop(drain_timeout))
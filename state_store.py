@@ -0,0 +1,365 @@
+#  Содержание state_store.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from logger import logger
+from metrics import Gauge
+from config import SYNCHRONOUS_MODES
+
+# Поля состояния чата, которые хранятся в базе
+STATE_FIELDS = ("language_code", "subscribed", "step", "data")
+# Сколько подписчиков читать из базы за один запрос
+SUBSCRIBERS_PAGE = 10000
+
+
+class ChatState:
+    """
+    Состояние одного чата: язык, подписка на сигналы и шаг диалога.
+
+    В кеше `StateStore` могут лежать миллионы таких объектов, поэтому класс
+    использует `__slots__` (у объекта нет своего `__dict__`), а словарь `data`
+    создается только при первой записи.
+
+    Атрибуты:
+        chat_id (int): Идентификатор чата.
+        language_code (str | None): Язык пользователя.
+        subscribed (bool): Подписан ли чат на сигналы.
+        step (str | None): Текущий шаг диалога (например, ожидание ввода).
+        data (dict | None): Настройки пользователя и данные диалога.
+        touched (float): Время последнего обращения (`time.monotonic`) для TTL кеша.
+    """
+    __slots__ = ("chat_id", "language_code", "subscribed", "step", "data", "touched")
+
+    def __init__(self, chat_id, language_code=None, subscribed=False, step=None, data=None):
+        self.chat_id = chat_id
+        self.language_code = language_code
+        self.subscribed = subscribed
+        self.step = step
+        self.data = data
+        self.touched = 0.0
+
+    def __repr__(self):
+        return (f"ChatState(chat_id={self.chat_id}, language_code={self.language_code!r}, "
+                f"subscribed={self.subscribed}, step={self.step!r})")
+
+
+class StateStore:
+    """
+    Состояние чатов в памяти (LRU + TTL) с отложенной записью в SQLite.
+
+    Чтение и изменение состояния на пути обработки обновления - поиск в
+    словаре за O(1) без обращения к диску. Изменения копятся и записываются
+    фоновым потоком одной транзакцией раз в `flush_interval` секунд или при
+    накоплении `flush_batch` изменений. В памяти держится не больше
+    `max_entries` чатов, а чаты без обращений дольше `ttl` секунд вытесняются
+    из кеша (в базе они остаются и загружаются при следующем обращении).
+    Вытесненные, но еще не записанные изменения не теряются: они хранятся
+    до записи отдельно от кеша.
+
+    При падении процесса теряются изменения не более чем за `flush_interval`
+    секунд; при остановке через `close` записывается все.
+
+    Атрибуты:
+        path (str): Путь к файлу базы.
+        max_entries (int): Максимальное количество чатов в кеше.
+        ttl (float): Через сколько секунд без обращений чат вытесняется из кеша.
+        flush_interval (float): Как часто записывать изменения, в секундах.
+        flush_batch (int): При скольких изменениях записывать, не дожидаясь интервала.
+        stats (dict): Попадания и промахи кеша, вытеснения и записанные изменения.
+    """
+    def __init__(self, path, max_entries=100_000, ttl=3600, flush_interval=1.0,
+                 flush_batch=1000, synchronous="NORMAL"):
+        """
+        Открывает (или создает) хранилище.
+
+        Args:
+            path (str): Путь к файлу базы.
+            max_entries (int): Максимальное количество чатов в кеше.
+            ttl (float): Через сколько секунд без обращений чат вытесняется из кеша.
+            flush_interval (float): Как часто записывать изменения, в секундах.
+            flush_batch (int): При скольких изменениях записывать, не дожидаясь интервала.
+            synchronous (str): Режим PRAGMA synchronous (см. `update_store.UpdateStore`).
+        """
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Неизвестный режим synchronous: {synchronous}")
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.flush_batch = max(1, flush_batch)
+        self.stats = {"hits": 0, "misses": 0, "loaded": 0, "evicted": 0, "expired": 0,
+                      "written": 0, "flushes": 0}
+        self._entries = OrderedDict()  # chat_id -> ChatState, от давно использованных к недавним
+        self._dirty = {}  # chat_id -> ChatState, измененные и еще не записанные
+        self._lock = threading.Lock()
+        # Запись и чтение базы. Берется до self._lock, а не внутри него
+        self._db_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={synchronous}")
+        # Рабочие процессы в режиме sharded пишут в одну базу
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chats ("
+            " chat_id INTEGER PRIMARY KEY,"
+            " language_code TEXT,"
+            " subscribed INTEGER NOT NULL DEFAULT 0,"
+            " step TEXT,"
+            " data TEXT,"
+            " updated_at REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chats_subscribed ON chats (chat_id) WHERE subscribed = 1")
+
+    def start(self):
+        """Запускает фоновую запись изменений."""
+        self._thread = threading.Thread(target=self._run, name="state-store", daemon=True)
+        self._thread.start()
+        return self
+
+    def get(self, chat_id):
+        """
+        Возвращает состояние чата: из кеша, из базы или новое (без записи в базу).
+
+        Args:
+            chat_id (int): Идентификатор чата.
+
+        Returns:
+            ChatState: Состояние чата. Менять его нужно через `update`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is not None:
+                self._entries.move_to_end(chat_id)
+                entry.touched = now
+                self.stats["hits"] += 1
+                return entry
+            self.stats["misses"] += 1
+            entry = self._dirty.get(chat_id)
+            if entry is not None:
+                return self._insert(entry, now)
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT language_code, subscribed, step, data FROM chats WHERE chat_id = ?",
+                (chat_id,)).fetchone()
+        if row is None:
+            loaded = ChatState(chat_id)
+        else:
+            language_code, subscribed, step, data = row
+            loaded = ChatState(chat_id, language_code, bool(subscribed), step,
+                               json.loads(data) if data else None)
+        with self._lock:
+            # Чат мог загрузить другой поток, пока шло чтение базы
+            entry = self._entries.get(chat_id) or self._dirty.get(chat_id)
+            if entry is None:
+                entry = loaded
+                if row is not None:
+                    self.stats["loaded"] += 1
+            return self._insert(entry, now)
+
+    def update(self, chat_id, **fields):
+        """
+        Изменяет состояние чата. Запись в базу выполняется в фоне.
+
+        Args:
+            chat_id (int): Идентификатор чата.
+            **fields: Новые значения полей из `STATE_FIELDS`.
+
+        Returns:
+            ChatState: Измененное состояние.
+        """
+        unknown = set(fields) - set(STATE_FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля состояния: {', '.join(sorted(unknown))}")
+        entry = self.get(chat_id)
+        with self._lock:
+            for name, value in fields.items():
+                setattr(entry, name, value)
+            self._dirty[chat_id] = entry
+            if len(self._dirty) >= self.flush_batch:
+                self._wake.set()
+        return entry
+
+    def subscribers(self):
+        """
+        Возвращает идентификаторы подписанных чатов, например для рассылки.
+
+        Перед чтением записываются накопленные изменения. Чаты читаются из базы
+        страницами, поэтому весь список не держится в памяти.
+
+        Yields:
+            int: Идентификатор чата.
+        """
+        self.flush()
+        last_chat_id = None
+        while True:
+            with self._db_lock:
+                rows = self._db.execute(
+                    "SELECT chat_id FROM chats WHERE subscribed = 1 AND chat_id > ? "
+                    "ORDER BY chat_id LIMIT ?",
+                    (last_chat_id if last_chat_id is not None else -(1 << 63), SUBSCRIBERS_PAGE)).fetchall()
+            for (chat_id,) in rows:
+                yield chat_id
+            if len(rows) < SUBSCRIBERS_PAGE:
+                return
+            last_chat_id = rows[-1][0]
+
+    def flush(self):
+        """
+        Записывает накопленные изменения одной транзакцией.
+
+        Returns:
+            int: Количество записанных чатов.
+        """
+        # База блокируется до снимка изменений, чтобы записи не обгоняли друг друга
+        with self._db_lock:
+            now = time.time()
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                rows = [(entry.chat_id, entry.language_code, int(entry.subscribed), entry.step,
+                         json.dumps(entry.data, ensure_ascii=False) if entry.data else None, now)
+                        for entry in dirty.values()]
+            if not rows:
+                return 0
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT INTO chats (chat_id, language_code, subscribed, step, data, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(chat_id) DO UPDATE SET "
+                    "language_code = excluded.language_code, subscribed = excluded.subscribed, "
+                    "step = excluded.step, data = excluded.data, updated_at = excluded.updated_at",
+                    rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                with self._lock:
+                    # Более новые изменения тех же чатов важнее не записанных
+                    for chat_id, entry in dirty.items():
+                        self._dirty.setdefault(chat_id, entry)
+                raise
+        self.stats["written"] += len(rows)
+        self.stats["flushes"] += 1
+        return len(rows)
+
+    def expire(self):
+        """
+        Вытесняет из кеша чаты без обращений дольше `ttl` секунд.
+
+        Returns:
+            int: Количество вытесненных чатов.
+        """
+        with self._lock:
+            return self._expire(time.monotonic())
+
+    def metrics(self):
+        """
+        Возвращает размер кеша, число не записанных изменений и счетчики.
+
+        Returns:
+            dict: Метрики хранилища.
+        """
+        with self._lock:
+            return {"cached": len(self._entries), "dirty": len(self._dirty), **self.stats}
+
+    def close(self):
+        """Останавливает фоновую запись, записывает оставшиеся изменения и закрывает базу."""
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        with self._db_lock:
+            self._db.close()
+        logger.info(f"Хранилище состояния чатов закрыто: {self.metrics()}")
+
+    def _insert(self, entry, now):
+        """Кладет чат в кеш и вытесняет лишние (вызывается под self._lock)."""
+        entry.touched = now
+        self._entries[entry.chat_id] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evicted"] += 1
+        self._expire(now)
+        return entry
+
+    def _expire(self, now):
+        # Кеш упорядочен по времени обращения: давно использованные чаты в начале
+        expired = 0
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry.touched <= self.ttl:
+                break
+            self._entries.popitem(last=False)
+            expired += 1
+        self.stats["expired"] += expired
+        return expired
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                self.expire()
+            except Exception as e:
+                logger.error("Ошибка записи состояния чатов: %s", e)
+
+
+def load_state_settings(bot_settings):
+    """
+    Возвращает настройки хранилища состояния чатов из секции `state`.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки хранилища со значениями по умолчанию.
+    """
+    state = bot_settings.get('state', {})
+    return {
+        'enabled': state.get('enabled', True),
+        'path': state.get('path', 'state/chats.db'),
+        'max_entries': state.get('max_entries', 100_000),
+        'ttl': state.get('ttl', 3600),
+        'flush_interval': state.get('flush_interval', 1.0),
+        'flush_batch': state.get('flush_batch', 1000),
+        'synchronous': state.get('synchronous', 'NORMAL'),
+    }
+
+
+def create_state_store(settings):
+    """
+    Создает и запускает хранилище состояния чатов по настройкам.
+
+    Args:
+        settings (dict): Настройки из `load_state_settings`.
+
+    Returns:
+        StateStore: Запущенное хранилище или None, если оно отключено.
+    """
+    if not settings['enabled']:
+        return None
+    state_store = StateStore(
+        settings['path'],
+        max_entries=settings['max_entries'],
+        ttl=settings['ttl'],
+        flush_interval=settings['flush_interval'],
+        flush_batch=settings['flush_batch'],
+        synchronous=settings['synchronous'],
+    ).start()
+    # Значения считаются только при чтении /metrics
+    Gauge("bot_state_cached_chats", "Чаты в кеше состояния",
+          lambda: state_store.metrics()["cached"])
+    Gauge("bot_state_dirty_chats", "Измененные чаты, еще не записанные в базу",
+          lambda: state_store.metrics()["dirty"])
+    return state_store
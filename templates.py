@@ -0,0 +1,191 @@
+#  Содержание templates.py
+
+import json
+import os
+import string
+import threading
+import time
+from logger import logger
+
+# Директория с каталогами шаблонов ответов (<язык>.json)
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locales')
+# Язык, используемый для пользователей без перевода и для отсутствующих ключей
+DEFAULT_LOCALE = 'ru'
+# Как часто проверять, изменились ли файлы каталога, в секундах
+CATALOG_CHECK_INTERVAL = 2.0
+
+_formatter = string.Formatter()
+
+
+def _compile(template):
+    """Возвращает (текст, есть ли в шаблоне подстановки)."""
+    has_fields = any(field is not None for _, field, _, _ in _formatter.parse(template))
+    return template, has_fields
+
+
+def _flatten(entries, prefix=""):
+    """Раскладывает вложенные секции каталога в ключи вида `content.text`."""
+    flat = {}
+    for key, value in entries.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = _compile(value)
+    return flat
+
+
+class TemplateCatalog:
+    """
+    Каталог шаблонов ответов бота с переводами.
+
+    Файлы `<язык>.json` загружаются и разбираются один раз. Ключи,
+    отсутствующие в переводе, берутся из каталога языка по умолчанию.
+    Язык пользователя выбирается по `from_user.language_code` (`en-US` -> `en`)
+    и кешируется. Шаблоны без подстановок возвращаются готовой строкой, а
+    результаты `cached` запоминаются до следующей перезагрузки каталога.
+    Каталог перечитывается, только если изменились его файлы (проверка
+    не чаще раза в `CATALOG_CHECK_INTERVAL` секунд).
+
+    Атрибуты:
+        directory (str): Директория с файлами каталога.
+        default_locale (str): Язык по умолчанию.
+        generation (int): Номер загрузки каталога, растет при каждой перезагрузке.
+    """
+    def __init__(self, directory=LOCALES_DIR, default_locale=DEFAULT_LOCALE):
+        """
+        Загружает каталог.
+
+        Args:
+            directory (str): Директория с файлами `<язык>.json`.
+            default_locale (str): Язык по умолчанию.
+        """
+        self.directory = directory
+        self.default_locale = default_locale
+        self._reload_lock = threading.Lock()
+        self._next_check = 0.0
+        self._signature = None
+        self._locales = {}
+        self._locale_cache = {}
+        self._rendered = {}
+        self.generation = 0
+        self.load()
+
+    def _files_signature(self):
+        signature = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.directory, name))
+                signature.append((name, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def load(self):
+        """Загружает и разбирает все файлы каталога."""
+        signature = self._files_signature()
+        raw = {}
+        for name, _, _ in signature:
+            with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as file:
+                raw[name[:-len('.json')]] = _flatten(json.load(file))
+        default = raw.get(self.default_locale, {})
+        locales = {locale: {**default, **entries} for locale, entries in raw.items()}
+        locales.setdefault(self.default_locale, default)
+        # Заменяем каталог целиком, чтобы потоки бота не видели его частично загруженным
+        self._locales, self._locale_cache, self._rendered = locales, {}, {}
+        self._signature = signature
+        self.generation += 1
+        logger.info("Загружен каталог шаблонов: языки %s", ", ".join(sorted(locales)))
+
+    def reload_if_changed(self):
+        """
+        Перечитывает каталог, если его файлы изменились.
+
+        Returns:
+            bool: True, если каталог был перезагружен.
+        """
+        with self._reload_lock:
+            try:
+                if self._files_signature() == self._signature:
+                    return False
+                self.load()
+                return True
+            except (OSError, ValueError) as e:
+                logger.error("Ошибка загрузки каталога шаблонов, используется прежний: %s", e)
+                return False
+
+    def _check(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + CATALOG_CHECK_INTERVAL
+            self.reload_if_changed()
+
+    def locale_for(self, language_code):
+        """
+        Возвращает язык каталога для `language_code` пользователя.
+
+        Args:
+            language_code (str | None): Код языка из Telegram (например, `en-US`).
+
+        Returns:
+            str: Язык, для которого есть каталог.
+        """
+        locale = self._locale_cache.get(language_code)
+        if locale is None:
+            short = (language_code or "").split('-')[0].lower()
+            locale = short if short in self._locales else self.default_locale
+            self._locale_cache[language_code] = locale
+        return locale
+
+    @property
+    def locales(self):
+        """Языки, для которых есть каталог."""
+        return sorted(self._locales)
+
+    def get(self, key, language_code=None, fallback=None):
+        """
+        Возвращает шаблон по ключу без подстановки значений.
+
+        Args:
+            key (str): Ключ шаблона.
+            language_code (str | None): Код языка пользователя.
+            fallback (str): Значение, если ключа нет в каталоге.
+        """
+        compiled = self._locales[self.locale_for(language_code)].get(key)
+        return compiled[0] if compiled is not None else fallback
+
+    def render(self, key, language_code=None, default_key=None, **values):
+        """
+        Возвращает текст по ключу каталога на языке пользователя.
+
+        Args:
+            key (str): Ключ шаблона (например, `content.photo`).
+            language_code (str | None): Код языка пользователя.
+            default_key (str): Ключ, используемый, если `key` нет в каталоге.
+            **values: Значения для подстановки в шаблон.
+
+        Returns:
+            str: Готовый текст.
+        """
+        self._check()
+        entries = self._locales[self.locale_for(language_code)]
+        compiled = entries.get(key)
+        if compiled is None:
+            compiled = entries[default_key]
+        text, has_fields = compiled
+        return text.format(**values) if has_fields else text
+
+    def cached(self, key, language_code=None, **values):
+        """
+        То же, что `render`, но результат запоминается для языка и значений.
+
+        Подходит для текстов, которые не меняются между обновлениями (например, /help).
+        Значения-функции вызываются без аргументов только при промахе кеша и в ключ
+        не входят: они должны зависеть только от языка и каталога. Кеш сбрасывается
+        при перезагрузке каталога.
+        """
+        self._check()
+        static = tuple(sorted((name, value) for name, value in values.items() if not callable(value)))
+        cache_key = (key, self.locale_for(language_code), static)
+        text = self._rendered.get(cache_key)
+        if text is None:
+            values = {name: value() if callable(value) else value for name, value in values.items()}
+            text = self._rendered[cache_key] = self.render(key, language_code, **values)
+        return text
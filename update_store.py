@@ -0,0 +1,283 @@
+#  Содержание update_store.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from telebot import apihelper, types
+from logger import logger
+from metrics import POLLING_RETRIES
+from config import SYNCHRONOUS_MODES  # допустимые режимы PRAGMA synchronous для журнала WAL
+
+
+class UpdateStore:
+    """
+    Надежное хранилище входящих обновлений на SQLite в режиме WAL.
+
+    Полученные обновления сначала записываются в базу и только затем
+    подтверждаются Telegram (следующий `offset` в getUpdates). Обновление
+    помечается обработанным (`ack`) после завершения обработчиков, поэтому
+    после падения или перезапуска бот дообрабатывает только то, что не успел,
+    а повторно доставленные обновления отбрасываются по `update_id`.
+
+    Подтверждения копятся и записываются одной транзакцией по `ack_batch`
+    штук: при падении повторно обработаются не более `ack_batch - 1`
+    обновлений. При `ack_batch=1` каждое обновление обрабатывается один раз,
+    кроме того, во время обработки которого произошло падение.
+
+    Атрибуты:
+        path (str): Путь к файлу базы.
+        ack_batch (int): Сколько подтверждений записывать одной транзакцией.
+        stats (dict): Количество сохраненных, повторных и обработанных обновлений.
+    """
+    def __init__(self, path, ack_batch=1, synchronous="NORMAL"):
+        """
+        Открывает (или создает) хранилище.
+
+        Args:
+            path (str): Путь к файлу базы.
+            ack_batch (int): Сколько подтверждений записывать одной транзакцией.
+            synchronous (str): Режим PRAGMA synchronous: FULL - fsync при каждой
+                транзакции, NORMAL - при контрольной точке WAL (переживает падение
+                процесса, но не отключение питания), OFF - без fsync.
+        """
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Неизвестный режим synchronous: {synchronous}")
+        self.path = path
+        self.ack_batch = max(1, ack_batch)
+        self.stats = {"stored": 0, "duplicates": 0, "acked": 0}
+        self._acks = []
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={synchronous}")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS updates ("
+            " update_id INTEGER PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " received_at REAL NOT NULL,"
+            " done INTEGER NOT NULL DEFAULT 0)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS updates_pending ON updates (done, update_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value INTEGER)")
+
+    def next_offset(self):
+        """
+        Возвращает offset для следующего запроса getUpdates.
+
+        Returns:
+            int | None: Номер, следующий за последним сохраненным обновлением, или None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state WHERE key = 'last_update_id'").fetchone()
+        return row[0] + 1 if row else None
+
+    def add(self, updates_json):
+        """
+        Сохраняет пачку обновлений одной транзакцией.
+
+        Args:
+            updates_json (list): Обновления в формате Bot API.
+
+        Returns:
+            int: Количество новых обновлений (без повторно доставленных).
+        """
+        if not updates_json:
+            return 0
+        now = time.time()
+        rows = [(u["update_id"], json.dumps(u, ensure_ascii=False), now) for u in updates_json]
+        last_update_id = max(row[0] for row in rows)
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                before = self._db.total_changes
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO updates (update_id, payload, received_at) VALUES (?, ?, ?)", rows)
+                added = self._db.total_changes - before
+                self._db.execute(
+                    "INSERT INTO state (key, value) VALUES ('last_update_id', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = max(value, excluded.value)",
+                    (last_update_id,))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        self.stats["stored"] += added
+        self.stats["duplicates"] += len(rows) - added
+        return added
+
+    def pending(self, limit=100):
+        """
+        Возвращает необработанные обновления в порядке `update_id`.
+
+        Args:
+            limit (int): Максимальное количество обновлений.
+
+        Returns:
+            list: Обновления в формате Bot API.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT payload FROM updates WHERE done = 0 ORDER BY update_id LIMIT ?", (limit,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def pending_count(self):
+        """Возвращает количество необработанных обновлений."""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM updates WHERE done = 0").fetchone()[0]
+
+    def ack(self, update_id):
+        """
+        Помечает обновление обработанным. Запись в базу выполняется пачками по `ack_batch`.
+
+        Args:
+            update_id (int): Идентификатор обработанного обновления.
+        """
+        self._acks.append((update_id,))
+        if len(self._acks) >= self.ack_batch:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленные подтверждения."""
+        if not self._acks:
+            return
+        acks, self._acks = self._acks, []
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("UPDATE updates SET done = 1 WHERE update_id = ?", acks)
+            self._db.execute("COMMIT")
+        self.stats["acked"] += len(acks)
+
+    def purge(self, retention_seconds):
+        """
+        Удаляет обработанные обновления старше `retention_seconds`.
+
+        Последний `update_id` хранится отдельно, поэтому offset после очистки не теряется.
+
+        Returns:
+            int: Количество удаленных обновлений.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM updates WHERE done = 1 AND received_at < ?",
+                (time.time() - retention_seconds,))
+        return cursor.rowcount
+
+    def close(self):
+        """Записывает подтверждения и закрывает базу."""
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+
+def process_pending(signal_bot, store, batch_size=100, stop_event=None):
+    """
+    Обрабатывает все необработанные обновления из хранилища пачками.
+
+    Обновления обрабатываются по одному и подтверждаются после завершения
+    обработчиков, поэтому бот должен быть создан с `threaded=False`.
+
+    Args:
+        signal_bot (telebot.TeleBot): Бот с зарегистрированными обработчиками.
+        store (UpdateStore): Хранилище обновлений.
+        batch_size (int): Сколько обновлений читать из базы за раз.
+        stop_event (threading.Event): Событие для остановки.
+
+    Returns:
+        int: Количество обработанных обновлений.
+    """
+    processed = 0
+    while stop_event is None or not stop_event.is_set():
+        batch = store.pending(batch_size)
+        if not batch:
+            break
+        for update_json in batch:
+            try:
+                signal_bot.process_new_updates([types.Update.de_json(update_json)])
+            except Exception as e:
+                # Ошибка обработчика не должна блокировать очередь: обновление
+                # подтверждается, как и при обычном polling
+                logger.error("Ошибка при обработке обновления %s: %s", update_json["update_id"], e)
+            store.ack(update_json["update_id"])
+            processed += 1
+        store.flush()
+    return processed
+
+
+def run_durable_polling(signal_bot, store, stop_event, allowed_updates=None,
+                        long_polling_timeout=5, batch_size=100, retention_seconds=86400,
+                        max_retries=5, base_delay=5):
+    """
+    Long polling с сохранением обновлений в `UpdateStore` до их обработки.
+
+    При запуске сначала дообрабатываются обновления, оставшиеся в хранилище
+    с прошлого запуска. Затем offset для getUpdates берется из хранилища,
+    поэтому Telegram удаляет обновления только после их записи на диск.
+    Ошибки соединения обрабатываются как в `main.run_bot_polling`.
+
+    Args:
+        signal_bot (telebot.TeleBot): Бот (`threaded=False`) с зарегистрированными обработчиками.
+        store (UpdateStore): Хранилище обновлений.
+        stop_event (threading.Event): Событие для остановки.
+        allowed_updates (list): Типы обновлений, которые нужно получать.
+        long_polling_timeout (int): Таймаут long polling, в секундах.
+        batch_size (int): Максимальный размер пачки getUpdates и обработки.
+        retention_seconds (int): Сколько хранить обработанные обновления.
+        max_retries (int): Максимальное количество ошибок подряд.
+        base_delay (int): Начальная задержка перед повтором, в секундах.
+    """
+    backlog = process_pending(signal_bot, store, batch_size, stop_event)
+    if backlog:
+        logger.info("Дообработано обновлений с прошлого запуска: %s", backlog)
+    purged = store.purge(retention_seconds)
+    if purged:
+        logger.info("Удалено старых обработанных обновлений: %s", purged)
+
+    retry_count = 0
+    delay = base_delay
+    while not stop_event.is_set():
+        try:
+            updates = apihelper.get_updates(
+                signal_bot.token, offset=store.next_offset(), limit=batch_size,
+                timeout=long_polling_timeout + 5, allowed_updates=allowed_updates,
+                long_polling_timeout=long_polling_timeout)
+        except Exception as e:
+            retry_count += 1
+            POLLING_RETRIES.inc()
+            logger.error("Ошибка получения обновлений: %s. Попытка %s из %s",
+                         e, retry_count, max_retries)
+            if retry_count >= max_retries:
+                logger.error("Не удалось восстановить соединение. Остановка работы бота.")
+                return
+            stop_event.wait(delay)
+            delay = min(delay * 2, 60)
+            continue
+        retry_count = 0
+        delay = base_delay
+        store.add(updates)
+        process_pending(signal_bot, store, batch_size, stop_event)
+
+
+def load_inbound_settings(bot_settings):
+    """
+    Возвращает настройки хранилища входящих обновлений из секции `inbound`.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки со значениями по умолчанию.
+    """
+    inbound = bot_settings.get('inbound', {})
+    return {
+        'durable': inbound.get('durable', False),
+        'path': inbound.get('path', 'state/updates.db'),
+        'ack_batch': inbound.get('ack_batch', 1),
+        'synchronous': inbound.get('synchronous', 'NORMAL'),
+        'batch_size': inbound.get('batch_size', 100),
+        'retention_seconds': inbound.get('retention_seconds', 86400),
+    }
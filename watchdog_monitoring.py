@@ -1,78 +1,185 @@
 #  Содержание watchdog_monitoring.py
 
+import hashlib
 import os
-import time
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from logger import logger  # Импортируем логгер из `logger.py`
 
 
+def file_digest(path):
+    """
+    Возвращает SHA-256 содержимого файла.
+
+    Args:
+        path (str): Путь к файлу.
+
+    Returns:
+        bytes | None: Хеш содержимого или None, если файл не читается (удален).
+    """
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha256(file.read()).digest()
+    except OSError:
+        return None
+
+
 class WatchdogHandler(FileSystemEventHandler):
     """
     Обработчик событий для мониторинга изменений в файлах.
 
     Этот класс наследует `FileSystemEventHandler` из библиотеки `watchdog`
     и используется для отслеживания изменений в указанных файлах. При
-    обнаружении изменения в одном из файлов из списка `file_list`, устанавливается
-    событие `restart_event` для инициирования перезапуска бота.
+    изменении одного из файлов `file_list` устанавливается событие
+    `restart_event` (и `stop_event`, по которому останавливаются потоки бота).
+    Изменения файлов из `reload_files` вместо перезапуска устанавливают
+    `reload_event` (горячая перезагрузка обработчиков).
+
+    Файлы сравниваются по полному пути, а не по имени: `bot.py` в другой
+    директории не вызывает перезапуск. События группируются: через `debounce`
+    секунд после последнего события сравнивается хеш содержимого файлов, и
+    событие устанавливается, только если содержимое действительно изменилось.
+    Поэтому сохранение без изменений (или `touch`) не перезапускает бота, а
+    редактор, сохраняющий файл в несколько приемов, вызывает один перезапуск.
 
     Атрибуты:
-        file_list (list): Список имен файлов, за изменениями которых необходимо следить.
+        paths (set): Полные пути файлов, за изменениями которых необходимо следить.
+        reload_paths (set): Пути файлов, изменение которых вызывает горячую перезагрузку.
         restart_event (threading.Event): Событие, которое устанавливается при обнаружении изменения.
+        stop_event (threading.Event): Событие остановки, устанавливается вместе с `restart_event`.
+        reload_event (threading.Event): Событие горячей перезагрузки обработчиков.
+        debounce (float): Интервал группировки событий, в секундах.
+        digests (dict): Хеш содержимого каждого файла на момент последней проверки.
     """
-    def __init__(self, file_list, restart_event):
+    def __init__(self, file_list, restart_event, reload_event=None, reload_files=(), debounce=0.5,
+                 stop_event=None, base_dir="."):
         """
-        Инициализирует WatchdogHandler.
+        Инициализирует WatchdogHandler и запоминает хеши содержимого файлов.
 
         Args:
-            file_list (list): Список имен файлов для мониторинга.
+            file_list (list): Файлы для мониторинга (пути относительно `base_dir`).
             restart_event (threading.Event): Событие для установки при обнаружении изменения.
+            reload_event (threading.Event): Событие горячей перезагрузки обработчиков.
+            reload_files (list): Файлы, изменение которых вызывает горячую перезагрузку.
+            debounce (float): Интервал группировки событий, в секундах.
+            stop_event (threading.Event): Событие остановки бота.
+            base_dir (str): Директория, относительно которой заданы файлы.
         """
         super().__init__()
-        self.file_list = file_list
+        self.paths = {os.path.abspath(os.path.join(base_dir, name)) for name in file_list}
+        self.reload_paths = set()
+        if reload_event is not None:
+            self.reload_paths = {os.path.abspath(os.path.join(base_dir, name)) for name in reload_files}
+            self.paths |= self.reload_paths
         self.restart_event = restart_event
+        self.stop_event = stop_event
+        self.reload_event = reload_event
+        self.debounce = debounce
+        self.digests = {path: file_digest(path) for path in self.paths}
+        self._timers = {}
+        self._changed = {}
+        self._lock = threading.Lock()
+
+    def _schedule(self, reload, path):
+        """Проверяет изменения через `debounce` секунд после последнего события."""
+        with self._lock:
+            self._changed.setdefault(reload, set()).add(path)
+            timer = self._timers.get(reload)
+            if timer is not None:
+                timer.cancel()
+            timer = threading.Timer(self.debounce, self._fire, args=(reload,))
+            timer.daemon = True
+            self._timers[reload] = timer
+            timer.start()
+
+    def _fire(self, reload):
+        with self._lock:
+            paths = self._changed.pop(reload, set())
+            self._timers.pop(reload, None)
+        changed = []
+        for path in sorted(paths):
+            digest = file_digest(path)
+            if digest != self.digests.get(path):
+                self.digests[path] = digest
+                changed.append(path)
+        if not changed:
+            logger.info("Файлы сохранены без изменений содержимого: %s", ", ".join(sorted(paths)))
+        elif reload:
+            logger.info("Изменение в файлах: %s. Горячая перезагрузка", ", ".join(changed))
+            self.reload_event.set()
+        else:
+            logger.info("Изменение в файлах: %s. Установлен restart_event", ", ".join(changed))
+            self.restart_event.set()
+            if self.stop_event is not None:
+                self.stop_event.set()
+
+    def cancel_pending(self):
+        """Отменяет отложенные проверки (при остановке мониторинга)."""
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            self._changed.clear()
+
+    def _handle_path(self, path):
+        path = os.path.abspath(path)
+        if path in self.paths:
+            self._schedule(path in self.reload_paths, path)
 
     def on_modified(self, event):
         """
         Обрабатывает событие изменения файла.
 
-        При изменении файла проверяет, входит ли он в `file_list`. Если да,
-        записывает информацию в лог и устанавливает событие `restart_event`.
+        Если файл отслеживается, планирует проверку его содержимого, после
+        которой устанавливается `restart_event` или `reload_event`.
 
         Args:
             event (FileSystemEvent): Объект события, содержащий информацию об изменении.
         """
-        filename = os.path.basename(event.src_path)
-        if filename in self.file_list:
-            logger.info(
-                f"Изменение в файле: {event.src_path}. Устанавливается restart_event")
-            self.restart_event.set()
+        self._handle_path(event.src_path)
+
+    def on_created(self, event):
+        """Обрабатывает создание файла (редакторы, сохраняющие через новый файл)."""
+        self._handle_path(event.src_path)
+
+    def on_moved(self, event):
+        """Обрабатывает переименование файла (атомарное сохранение через временный файл)."""
+        self._handle_path(event.dest_path)
 
 
-def start_watchdog(file_list, restart_event, stop_event):
+def start_watchdog(file_list, restart_event, stop_event, reload_event=None, reload_files=(), base_dir="."):
     """
     Запускает мониторинг файлов с использованием watchdog.
 
     Эта функция инициализирует `WatchdogHandler` для отслеживания изменений
-    в файлах из `file_list` и запускает наблюдателя (`Observer`). В цикле
-    она продолжает работу до тех пор, пока не будет установлено событие `stop_event`
-    или `restart_event`. После завершения работы наблюдателя записывает соответствующее сообщение в лог.
+    в файлах из `file_list` и запускает наблюдателя (`Observer`) на
+    директориях этих файлов (без вложенных). Функция ждет `stop_event`, не
+    просыпаясь по таймеру: при изменении файла `WatchdogHandler` устанавливает
+    `restart_event` вместе со `stop_event`. После завершения работы
+    наблюдателя записывает соответствующее сообщение в лог.
 
     Args:
-        file_list (list): Список имен файлов для мониторинга.
+        file_list (list): Файлы для мониторинга (пути относительно `base_dir`).
         restart_event (threading.Event): Событие, устанавливаемое при обнаружении изменения.
         stop_event (threading.Event): Событие для остановки мониторинга.
+        reload_event (threading.Event): Событие горячей перезагрузки обработчиков.
+        reload_files (list): Файлы, изменение которых вызывает горячую перезагрузку.
+        base_dir (str): Директория, относительно которой заданы файлы.
     """
-    event_handler = WatchdogHandler(file_list, restart_event)
+    event_handler = WatchdogHandler(file_list, restart_event, reload_event, reload_files,
+                                    stop_event=stop_event, base_dir=base_dir)
     observer = Observer()
-    observer.schedule(event_handler, path=".", recursive=False)
+    for directory in sorted({os.path.dirname(path) for path in event_handler.paths}):
+        if os.path.isdir(directory):
+            observer.schedule(event_handler, path=directory, recursive=False)
     observer.start()
-    logger.info("Watchdog запущен для мониторинга изменений")
+    logger.info(f"Watchdog запущен для мониторинга изменений ({len(event_handler.paths)} файлов)")
 
     try:
-        while not stop_event.is_set() and not restart_event.is_set():
-            time.sleep(1)
+        stop_event.wait()
     finally:
+        event_handler.cancel_pending()
         observer.stop()
         observer.join()
         logger.info("Watchdog остановлен.")
@@ -0,0 +1,279 @@
+#  Содержание webhook_server.py
+
+import hmac
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+from logger import logger
+from lifecycle import save_pending
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Максимальный размер тела webhook-запроса: обновления Telegram занимают
+# единицы килобайт, тело больше лимита отклоняется до чтения
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class WebhookServer:
+    """
+    HTTP-сервер для приема обновлений Telegram через webhook.
+
+    Сервер проверяет секретный токен из заголовка `X-Telegram-Bot-Api-Secret-Token`,
+    кладет JSON обновления в ограниченную очередь и сразу отвечает Telegram.
+    Обработку выполняют рабочие потоки, которые передают обновления в
+    `signal_bot.process_new_updates`, то есть в обработчики из `bot.register_handlers`.
+    Если очередь заполнена, сервер отвечает 503 и Telegram повторит доставку позже.
+    Запросы с телом больше `max_body_size` отклоняются с кодом 413 без чтения тела.
+
+    Атрибуты:
+        signal_bot (telebot.TeleBot): Экземпляр бота с зарегистрированными обработчиками.
+        updates_queue (queue.Queue): Очередь принятых, но еще не обработанных обновлений.
+        stats (dict): Счетчики принятых, отклоненных и обработанных обновлений.
+    """
+    def __init__(self, signal_bot, host="127.0.0.1", port=8443, path="/",
+                 secret_token=None, queue_size=1000, workers=4, process_update=None,
+                 max_body_size=MAX_BODY_SIZE):
+        """
+        Инициализирует WebhookServer.
+
+        Args:
+            signal_bot (telebot.TeleBot): Экземпляр бота с зарегистрированными обработчиками.
+            host (str): Адрес для прослушивания.
+            port (int): Порт для прослушивания (0 - выбрать свободный).
+            path (str): Путь, на который Telegram отправляет обновления.
+            secret_token (str): Секретный токен, переданный в `set_webhook`.
+            queue_size (int): Максимальный размер очереди обновлений.
+            workers (int): Количество рабочих потоков обработки.
+            process_update (callable): Обработчик обновления в формате JSON вместо
+                `signal_bot.process_new_updates` (например, `ShardSupervisor.dispatch`).
+            max_body_size (int): Максимальный размер тела запроса, в байтах.
+        """
+        self.signal_bot = signal_bot
+        self.process_update = process_update
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self.max_body_size = max_body_size
+        self.updates_queue = queue.Queue(maxsize=queue_size)
+        self.stats = {"accepted": 0, "rejected": 0, "unauthorized": 0, "too_large": 0,
+                      "processed": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._threads = []
+
+    @property
+    def address(self):
+        """Фактический адрес сервера (host, port)."""
+        return self._server.server_address[:2]
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def accept(self, headers, body):
+        """
+        Проверяет и ставит обновление в очередь.
+
+        Args:
+            headers: Заголовки HTTP-запроса.
+            body (bytes): Тело запроса с JSON обновления.
+
+        Returns:
+            int: HTTP-код ответа для Telegram.
+        """
+        if self.secret_token is not None:
+            received = headers.get(SECRET_TOKEN_HEADER) or ""
+            if not hmac.compare_digest(received, self.secret_token):
+                self._count("unauthorized")
+                return 403
+        try:
+            update_json = json.loads(body)
+        except ValueError:
+            logger.error("Получено некорректное тело webhook-запроса")
+            return 400
+        try:
+            self.updates_queue.put_nowait(update_json)
+        except queue.Full:
+            self._count("rejected")
+            return 503
+        self._count("accepted")
+        return 200
+
+    def _worker(self):
+        while True:
+            update_json = self.updates_queue.get()
+            try:
+                if update_json is None:
+                    return
+                if self.process_update is not None:
+                    self.process_update(update_json)
+                else:
+                    self.signal_bot.process_new_updates([types.Update.de_json(update_json)])
+                self._count("processed")
+            except Exception as e:
+                self._count("failed")
+                logger.error("Ошибка при обработке обновления из webhook: %s", e)
+            finally:
+                self.updates_queue.task_done()
+
+    def start(self):
+        """Запускает рабочие потоки и HTTP-сервер в фоновых потоках."""
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        server_thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        server_thread.start()
+        self._threads.append(server_thread)
+        logger.info(f"Webhook сервер запущен на {self.address[0]}:{self.address[1]}{self.path}")
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Останавливает прием обновлений и дожидается обработки уже принятых.
+
+        Args:
+            timeout (float): Сколько секунд ждать обработки очереди. None - без ограничения.
+
+        Рабочие потоки, не завершившиеся к `timeout`, не ожидаются: это потоки-демоны,
+        и обновления, которые они обрабатывают, в результат не попадают.
+
+        Returns:
+            list: Принятые, но не обработанные к `timeout` обновления (JSON).
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.updates_queue.all_tasks_done:
+            while self.updates_queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.updates_queue.all_tasks_done.wait(remaining)
+        leftovers = []
+        while True:
+            try:
+                leftovers.append(self.updates_queue.get_nowait())
+            except queue.Empty:
+                break
+            self.updates_queue.task_done()
+        for _ in range(self.workers):
+            try:
+                self.updates_queue.put_nowait(None)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        alive = sum(thread.is_alive() for thread in self._threads)
+        if alive:
+            logger.warning(f"Webhook сервер: {alive} рабочих потоков не завершились за {timeout} с")
+        self._threads = []
+        logger.info(f"Webhook сервер остановлен. Статистика: {self.stats}, "
+                    f"не обработано: {len(leftovers)}")
+        return leftovers
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    self.send_error(404)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    status = 400
+                elif length > server.max_body_size:
+                    server._count("too_large")
+                    status = 413
+                else:
+                    status = server.accept(self.headers, self.rfile.read(length))
+                if status in (400, 413) and length != 0:
+                    # Непрочитанное тело нельзя оставлять в соединении
+                    self.close_connection = True
+                self.send_response(status)
+                if status == 503:
+                    self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def load_webhook_settings(bot_settings):
+    """
+    Возвращает настройки webhook из секции `webhook` настроек бота.
+
+    Args:
+        bot_settings (dict): Настройки бота из `settings/key.json`.
+
+    Returns:
+        dict: Настройки webhook со значениями по умолчанию.
+    """
+    webhook = bot_settings.get('webhook', {})
+    return {
+        'url': webhook.get('url', ''),
+        'listen': webhook.get('listen', '127.0.0.1'),
+        'port': webhook.get('port', 8443),
+        'path': webhook.get('path', '/'),
+        'secret_token': webhook.get('secret_token') or None,
+        'queue_size': webhook.get('queue_size', 1000),
+        'workers': webhook.get('workers', 4),
+        'max_body_size': webhook.get('max_body_size', MAX_BODY_SIZE),
+    }
+
+
+def run_webhook(signal_bot, settings, stop_event, allowed_updates=None, process_update=None,
+                drain_timeout=None):
+    """
+    Запускает прием обновлений через webhook до установки `stop_event`.
+
+    Если в настройках указан публичный `url`, регистрирует webhook в Telegram
+    через `set_webhook`. Функция блокирующая, как и `main.run_bot_polling`.
+
+    Args:
+        signal_bot (telebot.TeleBot): Экземпляр бота с зарегистрированными обработчиками.
+        settings (dict): Настройки из `load_webhook_settings`.
+        stop_event (threading.Event): Событие для остановки сервера.
+        allowed_updates (list): Типы обновлений, которые нужно получать.
+        process_update (callable): Обработчик обновления в формате JSON
+            вместо `signal_bot.process_new_updates`.
+        drain_timeout (float): Сколько секунд при остановке ждать обработки
+            принятых обновлений. Необработанные сохраняются для следующего запуска.
+    """
+    server = WebhookServer(
+        signal_bot,
+        host=settings['listen'],
+        port=settings['port'],
+        path=settings['path'],
+        secret_token=settings['secret_token'],
+        queue_size=settings['queue_size'],
+        workers=settings['workers'],
+        process_update=process_update,
+        max_body_size=settings['max_body_size'],
+    ).start()
+
+    if settings['url']:
+        logger.info(f"Регистрация webhook: {settings['url']}")
+        signal_bot.remove_webhook()
+        signal_bot.set_webhook(
+            url=settings['url'],
+            secret_token=settings['secret_token'],
+            allowed_updates=allowed_updates,
+            max_connections=settings['workers'],
+        )
+
+    try:
+        stop_event.wait()
+    finally:
+        save_pending("updates", server.stop(drain_timeout))